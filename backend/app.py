@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, g, has_request_context
 from flask_cors import CORS
 from supabase import create_client, Client
 import os
@@ -11,9 +11,33 @@ import requests
 import json
 import re
 import html
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import random
+import email.utils
+import sqlite3
+import socket
+import tempfile
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import jwt
+from requests.adapters import HTTPAdapter
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from pywebpush import webpush, WebPushException
+from pywebpush import WebPushException
+from py_vapid import Vapid
+import push_crypto
+import template_engine
+
+try:
+  import fcntl  # POSIX only; used for the single-host job lock fallback
+except ImportError:
+  fcntl = None
 
 # -----------------------------------------------------------------------------
 # App + Supabase setup
@@ -61,6 +85,7 @@ CORS(
 SUPABASE_URL = os.environ.get("SUPABASE_URL") or os.environ.get("VITE_SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("VITE_SUPABASE_SERVICE_ROLE_KEY")
 INVITE_COOLDOWN_SECONDS = int(os.environ.get("INVITE_COOLDOWN_SECONDS", "300") or 300)
+BULK_INVITE_MAX_RECIPIENTS = int(os.environ.get("BULK_INVITE_MAX_RECIPIENTS", "200") or 200)
 BACKEND_API_KEY = os.environ.get("BACKEND_API_KEY")  # For internal API calls (e.g., Supabase triggers)
 VAPID_PUBLIC_KEY = os.environ.get("VAPID_PUBLIC_KEY")
 VAPID_PRIVATE_KEY = os.environ.get("VAPID_PRIVATE_KEY")
@@ -79,6 +104,74 @@ except Exception as e:
 # VAPID claims for push notifications (subject should be a contact URI)
 VAPID_CLAIMS = {"sub": f"mailto:{os.environ.get('VAPID_EMAIL', 'admin@example.com')}"}
 
+# Access token verification.
+# "local" verifies Supabase JWTs in-process (HS256 via SUPABASE_JWT_SECRET, or RS256/ES256 via the project's JWKS)
+# and only falls back to supabase.auth.get_user when no key is available; "remote" always asks Supabase Auth.
+AUTH_VERIFY_MODE = (os.environ.get("AUTH_VERIFY_MODE") or "local").strip().lower()
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_URL = os.environ.get("SUPABASE_JWKS_URL") or (
+  f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+AUTH_JWKS_CACHE_SECONDS = int(os.environ.get("AUTH_JWKS_CACHE_SECONDS", "600") or 600)
+AUTH_JWT_LEEWAY_SECONDS = int(os.environ.get("AUTH_JWT_LEEWAY_SECONDS", "10") or 10)
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "2048") or 2048)
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get("AUTH_TOKEN_CACHE_TTL", "300") or 300)
+
+# Cross-request profile cache (per worker). Kept short because the frontend also writes profiles directly.
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "1024") or 1024)
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", "30") or 30)
+
+# Email settings snapshot: reloaded at most every EMAIL_SETTINGS_TTL seconds, and re-validated against
+# email_settings.updated_at every EMAIL_SETTINGS_VERSION_CHECK_SECONDS so all workers converge after an admin edit.
+EMAIL_SETTINGS_TTL = int(os.environ.get("EMAIL_SETTINGS_TTL", "300") or 300)
+EMAIL_SETTINGS_VERSION_CHECK_SECONDS = int(os.environ.get("EMAIL_SETTINGS_VERSION_CHECK_SECONDS", "15") or 15)
+
+# Maileroo HTTP client: one pooled keep-alive session per worker process, bounded retries on 429/5xx
+MAILEROO_POOL_SIZE = int(os.environ.get("MAILEROO_POOL_SIZE", "10") or 10)
+MAILEROO_CONNECT_TIMEOUT = float(os.environ.get("MAILEROO_CONNECT_TIMEOUT", "3.05") or 3.05)
+MAILEROO_READ_TIMEOUT = float(os.environ.get("MAILEROO_READ_TIMEOUT", "15") or 15)
+MAILEROO_MAX_RETRIES = int(os.environ.get("MAILEROO_MAX_RETRIES", "3") or 3)
+MAILEROO_BACKOFF_BASE = float(os.environ.get("MAILEROO_BACKOFF_BASE", "0.5") or 0.5)
+MAILEROO_BACKOFF_MAX = float(os.environ.get("MAILEROO_BACKOFF_MAX", "10") or 10)
+MAILEROO_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Client-side send budget per worker process (token bucket); set to the provider plan's limit
+MAILEROO_RATE_LIMIT_PER_SECOND = float(os.environ.get("MAILEROO_RATE_LIMIT_PER_SECOND", "10") or 10)
+MAILEROO_RATE_LIMIT_BURST = int(os.environ.get("MAILEROO_RATE_LIMIT_BURST", "10") or 10)
+# Parallel sends during bulk jobs (keep <= MAILEROO_POOL_SIZE so every sender gets a warm connection)
+BULK_SEND_CONCURRENCY = int(os.environ.get("BULK_SEND_CONCURRENCY", "8") or 8)
+
+# Web push client: pooled keep-alive session per push service origin, VAPID headers signed once per
+# audience and reused until PUSH_VAPID_REFRESH_MARGIN_SECONDS before their JWT expires
+PUSH_POOL_SIZE = int(os.environ.get("PUSH_POOL_SIZE", "10") or 10)
+PUSH_CONNECT_TIMEOUT = float(os.environ.get("PUSH_CONNECT_TIMEOUT", "3.05") or 3.05)
+PUSH_READ_TIMEOUT = float(os.environ.get("PUSH_READ_TIMEOUT", "10") or 10)
+PUSH_VAPID_EXPIRY_SECONDS = int(os.environ.get("PUSH_VAPID_EXPIRY_SECONDS", "43200") or 43200)  # spec max: 24h
+PUSH_VAPID_REFRESH_MARGIN_SECONDS = int(os.environ.get("PUSH_VAPID_REFRESH_MARGIN_SECONDS", "600") or 600)
+# How long push services keep a message for an offline device (0 = deliver now or drop)
+PUSH_MESSAGE_TTL_SECONDS = int(os.environ.get("PUSH_MESSAGE_TTL_SECONDS", "0") or 0)
+# Subscriptions the push service reports gone (404/410) are removed in batches: when this many are queued,
+# or PUSH_PRUNE_FLUSH_SECONDS after the first one was queued, whichever comes first
+PUSH_PRUNE_BATCH_SIZE = int(os.environ.get("PUSH_PRUNE_BATCH_SIZE", "50") or 50)
+PUSH_PRUNE_FLUSH_SECONDS = float(os.environ.get("PUSH_PRUNE_FLUSH_SECONDS", "30") or 30)
+# Concurrent deliveries when fanning a message out to every registered device
+PUSH_FANOUT_CONCURRENCY = int(os.environ.get("PUSH_FANOUT_CONCURRENCY", "16") or 16)
+PUSH_SUBSCRIPTION_COLUMNS = "endpoint, user_id, subscription"
+# Broadcast push: registry page size and payload-encryption processes (0 = encrypt on the send threads)
+PUSH_BROADCAST_PAGE_SIZE = int(os.environ.get("PUSH_BROADCAST_PAGE_SIZE", "1000") or 1000)
+PUSH_ENCRYPT_PROCESSES = int(os.environ.get("PUSH_ENCRYPT_PROCESSES", str(min(4, os.cpu_count() or 1))) or 0)
+
+# Durable outbox for transactional email: requests enqueue into a local SQLite file and a small
+# per-process worker pool delivers in the background. Set OUTBOX_ENABLED=false to send inline.
+OUTBOX_ENABLED = (os.environ.get("OUTBOX_ENABLED", "true").lower() == "true")
+OUTBOX_DB_PATH = os.environ.get("OUTBOX_DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox.sqlite3")
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "2") or 2)
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "6") or 6)
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "120") or 120)
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "2") or 2)
+OUTBOX_DEDUP_WINDOW_SECONDS = int(os.environ.get("OUTBOX_DEDUP_WINDOW_SECONDS", "600") or 600)
+OUTBOX_RETENTION_SECONDS = int(os.environ.get("OUTBOX_RETENTION_SECONDS", str(7 * 24 * 3600)) or 7 * 24 * 3600)
+
 # -----------------------------------------------------------------------------
 # Preflight handler REMOVED
 # The Flask-CORS extension handles OPTIONS (preflight) requests automatically.
@@ -98,13 +191,150 @@ def parse_bearer_token(req) -> Optional[str]:
   return auth.split(" ", 1)[1].strip() or None
 
 
-def get_user_from_token(token: str) -> Tuple[Optional[str], Optional[str], Optional[dict]]:
+class _TTLCache:
+  """
+  Small thread-safe LRU cache whose entries also expire after a TTL.
+  Keeps hit/miss/eviction counters so callers can expose them in diagnostics.
+  """
+  def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+    self.maxsize = max(1, int(maxsize))
+    self.ttl = float(ttl)
+    self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key, default=None):
+    now = time.monotonic()
+    with self._lock:
+      item = self._data.get(key)
+      if item is None:
+        self.misses += 1
+        return default
+      expires_at, value = item
+      if expires_at <= now:
+        del self._data[key]
+        self.misses += 1
+        return default
+      self._data.move_to_end(key)
+      self.hits += 1
+      return value
+
+  def set(self, key, value, ttl: Optional[float] = None) -> None:
+    """
+    Stores value under key. ttl (seconds) overrides the default but never exceeds it.
+    Non-positive TTLs are ignored so already-expired values are never cached.
+    """
+    ttl = self.ttl if ttl is None else min(float(ttl), self.ttl)
+    if ttl <= 0:
+      return
+    with self._lock:
+      self._data[key] = (time.monotonic() + ttl, value)
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+        self.evictions += 1
+
+  def pop(self, key, default=None):
+    with self._lock:
+      item = self._data.pop(key, None)
+    return item[1] if item else default
+
+  def clear(self) -> None:
+    with self._lock:
+      self._data.clear()
+
+  def stats(self) -> dict:
+    with self._lock:
+      size = len(self._data)
+    lookups = self.hits + self.misses
+    return {
+      "size": size,
+      "maxsize": self.maxsize,
+      "ttl_seconds": self.ttl,
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+      "evictions": self.evictions,
+    }
+
+
+# token sha256 -> (user_id, email, raw_user_obj); entries never outlive the token's own exp
+_auth_token_cache = _TTLCache(maxsize=AUTH_TOKEN_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL)
+_auth_counters = {"local_verified": 0, "local_rejected": 0, "remote_lookups": 0, "remote_failures": 0}
+_jwks_client: Optional[jwt.PyJWKClient] = None
+
+
+def _get_jwks_client() -> Optional[jwt.PyJWKClient]:
+  global _jwks_client
+  if _jwks_client is None and SUPABASE_JWKS_URL:
+    _jwks_client = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True, lifespan=AUTH_JWKS_CACHE_SECONDS, timeout=5)
+  return _jwks_client
+
+
+def _verify_token_locally(token: str) -> Tuple[str, Optional[dict]]:
+  """
+  Verifies a Supabase access token (signature, exp, aud) without calling Supabase Auth.
+  Returns ("ok", claims), ("invalid", None) when the token is definitely bad, or
+  ("unavailable", None) when no verification key is usable and the caller should fall back to Supabase.
+  """
+  try:
+    alg = (jwt.get_unverified_header(token).get("alg") or "").upper()
+  except jwt.InvalidTokenError:
+    return "invalid", None
+
+  try:
+    if alg == "HS256":
+      if not SUPABASE_JWT_SECRET:
+        return "unavailable", None
+      key = SUPABASE_JWT_SECRET
+    elif alg in ("RS256", "ES256"):
+      client = _get_jwks_client()
+      if not client:
+        return "unavailable", None
+      key = client.get_signing_key_from_jwt(token).key
+    else:
+      return "unavailable", None
+  except jwt.PyJWKClientError as e:
+    print(f"_verify_token_locally: JWKS lookup failed, falling back to Supabase: {e}", file=sys.stderr)
+    return "unavailable", None
+
+  try:
+    claims = jwt.decode(
+      token,
+      key,
+      algorithms=[alg],
+      audience=SUPABASE_JWT_AUDIENCE,
+      leeway=AUTH_JWT_LEEWAY_SECONDS,
+      options={"require": ["exp", "sub"]},
+    )
+  except jwt.InvalidTokenError as e:
+    print(f"_verify_token_locally: rejected token: {e}", file=sys.stderr)
+    return "invalid", None
+  return "ok", claims
+
+
+def _token_seconds_left(token: str, claims: Optional[dict] = None) -> float:
+  """
+  Seconds until the token's exp claim (0 when missing/unparseable). Reads the claim without verifying.
+  """
+  try:
+    if claims is None:
+      claims = jwt.decode(token, options={"verify_signature": False})
+    return float(claims.get("exp")) - time.time()
+  except Exception:
+    return 0.0
+
+
+def _get_user_from_token_remote(token: str) -> Tuple[Optional[str], Optional[str], Optional[dict]]:
   """
   Uses Supabase to get user from access token.
   Returns (user_id, email, raw_user_obj)
   """
   if not supabase:
     return None, None, None
+  _auth_counters["remote_lookups"] += 1
   try:
     res = supabase.auth.get_user(token)
     user = getattr(res, "user", None) or (res.get("user") if isinstance(res, dict) else None)
@@ -115,9 +345,50 @@ def get_user_from_token(token: str) -> Tuple[Optional[str], Optional[str], Optio
     email = getattr(user, "email", None) or user.get("email")
     return uid, email, user
   except Exception as e:
+    _auth_counters["remote_failures"] += 1
     print(f"get_user_from_token error: {e}", file=sys.stderr)
     return None, None, None
 
+
+def get_user_from_token(token: str) -> Tuple[Optional[str], Optional[str], Optional[dict]]:
+  """
+  Resolves an access token to (user_id, email, raw_user_obj).
+  Identities are cached until the token expires; in "local" mode the JWT is verified in-process and
+  Supabase Auth is only called when no verification key is available.
+  """
+  if not token:
+    return None, None, None
+  cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+  cached = _auth_token_cache.get(cache_key)
+  if cached:
+    return cached
+
+  if AUTH_VERIFY_MODE == "local":
+    status, claims = _verify_token_locally(token)
+    if status == "invalid":
+      _auth_counters["local_rejected"] += 1
+      return None, None, None
+    if status == "ok":
+      _auth_counters["local_verified"] += 1
+      result = (claims.get("sub"), claims.get("email"), claims)
+      _auth_token_cache.set(cache_key, result, ttl=_token_seconds_left(token, claims))
+      return result
+
+  result = _get_user_from_token_remote(token)
+  if result[0]:
+    _auth_token_cache.set(cache_key, result, ttl=_token_seconds_left(token))
+  return result
+
+
+def _auth_cache_stats() -> dict:
+  return {
+    "verify_mode": AUTH_VERIFY_MODE,
+    "has_jwt_secret": bool(SUPABASE_JWT_SECRET),
+    "jwks_url": SUPABASE_JWKS_URL,
+    "token_cache": _auth_token_cache.stats(),
+    **_auth_counters,
+  }
+
 def _get_allowed_admin_emails() -> set:
   """
   Returns a set of allowed admin emails (lowercased) from ADMIN_EMAILS env.
@@ -197,22 +468,100 @@ def is_owner_or_admin(role: Optional[str]) -> bool:
   return role in ("owner", "admin")
 
 
-def fetch_profile(user_id: str) -> Optional[dict]:
+# user_id -> (row, complete). "complete" rows came from select("*"); partial rows hold only the columns fetched so far.
+_profile_cache = _TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+_profile_counters = {"request_hits": 0, "db_fetches": 0, "bytes_fetched": 0, "bytes_saved": 0}
+
+
+def _profile_entry_covers(entry: Optional[Tuple[dict, bool]], columns: Optional[Tuple[str, ...]]) -> bool:
+  if not entry:
+    return False
+  row, complete = entry
+  return complete or (columns is not None and all(c in row for c in columns))
+
+
+def _project_profile(row: dict, columns: Optional[Tuple[str, ...]]) -> dict:
+  if columns is None:
+    return dict(row)
+  return {c: row.get(c) for c in columns}
+
+
+def _json_size(val) -> int:
+  try:
+    return len(json.dumps(val, default=str))
+  except Exception:
+    return 0
+
+
+def fetch_profile(user_id: str, columns: Optional[Tuple[str, ...]] = None) -> Optional[dict]:
   """
   Fetches the profiles row for a given user_id.
+  Pass columns (e.g. ("companies",)) to select only what the caller reads instead of the whole row
+  with its JSONB blobs. Results are memoized for the current request (flask.g) and kept in a short-TTL
+  per-worker cache; call _invalidate_profile(user_id) after writing to the row.
   """
-  if not supabase:
+  if not supabase or not user_id:
     return None
+  if isinstance(columns, str):
+    columns = (columns,)
+  columns = tuple(dict.fromkeys(columns)) if columns else None
+
+  memo = None
+  if has_request_context():
+    memo = g.setdefault("_profile_memo", {})
+    entry = memo.get(user_id)
+    if _profile_entry_covers(entry, columns):
+      _profile_counters["request_hits"] += 1
+      projected = _project_profile(entry[0], columns)
+      _profile_counters["bytes_saved"] += _json_size(projected)
+      return projected
+
+  entry = _profile_cache.get(user_id)
+  if _profile_entry_covers(entry, columns):
+    projected = _project_profile(entry[0], columns)
+    _profile_counters["bytes_saved"] += _json_size(projected)
+    if memo is not None:
+      memo[user_id] = entry
+    return projected
+
   try:
-    resp = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
+    select_cols = ", ".join(columns) if columns else "*"
+    resp = supabase.table("profiles").select(select_cols).eq("id", user_id).single().execute()
     data = getattr(resp, "data", None) or (resp.get("data") if isinstance(resp, dict) else None)
     if isinstance(data, list) and data:
       data = data[0]
-    return data or None
+    if not data:
+      return None
+    _profile_counters["db_fetches"] += 1
+    _profile_counters["bytes_fetched"] += _json_size(data)
+
+    # Merge with whatever columns we already hold for this user so partial fetches accumulate
+    if entry and not entry[1]:
+      merged = {**entry[0], **data}
+    else:
+      merged = dict(data)
+    entry = (merged, columns is None)
+    _profile_cache.set(user_id, entry)
+    if memo is not None:
+      memo[user_id] = entry
+    return _project_profile(merged, columns)
   except Exception as e:
     print(f"fetch_profile error: {e}", file=sys.stderr)
     return None
 
+
+def _invalidate_profile(user_id: str) -> None:
+  """
+  Drops cached copies of a profile after the backend writes to it.
+  """
+  _profile_cache.pop(user_id)
+  if has_request_context():
+    g.get("_profile_memo", {}).pop(user_id, None)
+
+
+def _profile_cache_stats() -> dict:
+  return {**_profile_cache.stats(), **_profile_counters}
+
 def _utcnow_iso() -> str:
   try:
     return datetime.now(timezone.utc).isoformat()
@@ -229,43 +578,40 @@ def _parse_iso(dt_str: Optional[str]) -> Optional[datetime]:
     return None
 
 
+TEMPLATE_CACHE_SIZE = int(os.environ.get("TEMPLATE_CACHE_SIZE", "128") or 128)
+# (template name, updated_at, field) or ("inline", sha1 of source) -> template_engine.CompiledTemplate
+_compiled_template_cache = _TTLCache(maxsize=TEMPLATE_CACHE_SIZE, ttl=24 * 3600)
+
+
+def _compile_template(source: str, cache_key: Optional[tuple] = None) -> template_engine.CompiledTemplate:
+  if cache_key is None:
+    cache_key = ("inline", hashlib.sha1((source or "").encode("utf-8")).hexdigest())
+  compiled = _compiled_template_cache.get(cache_key)
+  if compiled is None:
+    compiled = template_engine.CompiledTemplate(source)
+    _compiled_template_cache.set(cache_key, compiled)
+  return compiled
+
+
 def _render_template(html_content: str, context: dict) -> str:
-    """
-    A robust, multi-pass template renderer.
-    1. Processes ternary expressions: {{ key ? 'if_true' : 'if_false' }}
-    2. Processes conditional blocks: {{#if key}}...{{/if}}
-    3. Processes variable replacements: {{ key }}
-    """
-    content = html_content
-
-    # Pass 1: Handle ternary-like expressions
-    def replace_ternary(match):
-        key, true_val, false_val = match.groups()
-        return true_val if context.get(key) else false_val
-    
-    ternary_regex = re.compile(r'\{\{\s*([a-zA-Z0-9_]+)\s*\?\s*\'(.*?)\'\s*:\s*\'(.*?)\'\s*\}\}')
-    content = ternary_regex.sub(replace_ternary, content)
-
-    # Pass 2: Handle conditional blocks
-    def replace_if_block(match):
-        key, inner_content = match.groups()
-        return inner_content if context.get(key) else ''
-
-    if_block_regex = re.compile(r'\{\{\s*#if\s*([a-zA-Z0-9_]+)\s*\}\}(.*?)\{\{\s*/if\s*\}\}', re.DOTALL)
-    
-    # Loop to handle simple nesting (process from outside in)
-    for _ in range(5): # Safety break
-        new_content = if_block_regex.sub(replace_if_block, content)
-        if new_content == content:
-            break
-        content = new_content
-
-    # Pass 3: Handle simple variable replacements
-    for key, value in context.items():
-        placeholder = f"{{{{ {key} }}}}"
-        content = content.replace(placeholder, str(value or ''))
-
-    return content
+  """
+  Renders a template string with the compiled single-pass engine.
+  Supports ternaries {{ key ? 'a' : 'b' }}, conditional blocks {{#if key}}...{{/if}} and {{ key }} variables.
+  """
+  return _compile_template(html_content).render(context)
+
+
+def _render_email_template(template: dict, context: dict) -> Tuple[str, str]:
+  """
+  Renders an email_templates row into (subject, html). Compiled forms are cached by (name, updated_at),
+  so an edited template is recompiled on its next use and stale versions age out of the LRU.
+  """
+  version = (template.get("name") or template.get("id"), template.get("updated_at"))
+  if not all(version):
+    return _render_template(template.get("subject") or "", context), _render_template(template.get("html_content") or "", context)
+  subject = _compile_template(template.get("subject") or "", version + ("subject",)).render(context)
+  html_out = _compile_template(template.get("html_content") or "", version + ("html_content",)).render(context)
+  return subject, html_out
 
 
 def _to_datetime_any(val: Optional[object]) -> Optional[datetime]:
@@ -303,6 +649,18 @@ def _fmt_event_date_display(val: Optional[object]) -> str:
     return str(val or "")
 
 
+def _fmt_event_time_display(val: Optional[object]) -> str:
+  """
+  Format the time part of an event_datetime for emails as 'HH:MM UTC' ('' if it cannot be parsed).
+  """
+  d = _to_datetime_any(val) if isinstance(val, (str, datetime)) else None
+  if not d:
+    return ""
+  if d.tzinfo is not None:
+    d = d.astimezone(timezone.utc)
+  return d.strftime("%H:%M UTC")
+
+
 def _ensure_list_event_tasks(raw) -> list:
   """
   Ensure event_tasks is a list. Accepts list or JSON string representations.
@@ -319,10 +677,16 @@ def _ensure_list_event_tasks(raw) -> list:
   return []
 
 
-def _get_email_settings() -> Optional[dict]:
+_email_settings_lock = threading.Lock()
+_email_settings_snapshot: Dict[str, Any] = {"settings": None, "db_updated_at": None, "loaded_at": 0.0, "checked_at": 0.0}
+_email_settings_counters = {"hits": 0, "loads": 0, "version_checks": 0, "invalidations": 0}
+
+
+def _load_email_settings() -> Tuple[Optional[dict], Optional[str]]:
   """
   Fetch email settings from DB (if available) and transparently fall back to environment variables
   for any missing values. This ensures email sending works even before UI saves settings.
+  Returns (settings, db_updated_at).
   """
   db_settings = None
   if supabase:
@@ -333,6 +697,7 @@ def _get_email_settings() -> Optional[dict]:
       print(f"ERROR: Failed to fetch email settings from DB: {e}", file=sys.stderr)
 
   settings = dict(db_settings or {})
+  db_updated_at = settings.get("updated_at")
 
   # Transparent ENV fallbacks
   env_api_key = os.environ.get("MAILEROO_API_KEY")
@@ -358,9 +723,78 @@ def _get_email_settings() -> Optional[dict]:
 
   # If still empty overall, return None to signal unusable config
   if not any([settings.get("maileroo_sending_key"), settings.get("mail_default_sender"), settings.get("maileroo_api_endpoint")]):
-    return None
+    return None, db_updated_at
+
+  return settings, db_updated_at
+
+
+def _email_settings_db_version() -> Optional[str]:
+  """
+  Cheap freshness probe: only reads email_settings.updated_at (bumped by trigger on every update).
+  """
+  resp = supabase.table("email_settings").select("updated_at").limit(1).single().execute()
+  return (resp.data or {}).get("updated_at")
+
+
+def _get_email_settings() -> Optional[dict]:
+  """
+  Returns the merged DB + ENV email settings from an in-process snapshot.
+  The snapshot is reloaded after EMAIL_SETTINGS_TTL, re-validated against updated_at every
+  EMAIL_SETTINGS_VERSION_CHECK_SECONDS, and dropped immediately by _invalidate_email_settings().
+  Bulk senders should call this once per run and pass the result to _send_email_via_maileroo(settings=...).
+  Always returns a copy, so callers may mutate it (e.g. to mask the key).
+  """
+  now = time.monotonic()
+  with _email_settings_lock:
+    snap = dict(_email_settings_snapshot)
+
+  if snap["loaded_at"] and now - snap["loaded_at"] < EMAIL_SETTINGS_TTL:
+    fresh = not supabase or now - snap["checked_at"] < EMAIL_SETTINGS_VERSION_CHECK_SECONDS
+    if not fresh:
+      _email_settings_counters["version_checks"] += 1
+      try:
+        fresh = _email_settings_db_version() == snap["db_updated_at"]
+      except Exception as e:
+        # Keep serving the snapshot rather than hammering the DB while it is unreachable
+        print(f"WARNING: email settings version check failed: {e}", file=sys.stderr)
+        fresh = True
+      if fresh:
+        with _email_settings_lock:
+          if _email_settings_snapshot["loaded_at"] == snap["loaded_at"]:
+            _email_settings_snapshot["checked_at"] = now
+    if fresh:
+      _email_settings_counters["hits"] += 1
+      return dict(snap["settings"]) if snap["settings"] else None
+
+  settings, db_updated_at = _load_email_settings()
+  _email_settings_counters["loads"] += 1
+  with _email_settings_lock:
+    _email_settings_snapshot.update({
+      "settings": settings,
+      "db_updated_at": db_updated_at,
+      "loaded_at": now,
+      "checked_at": now,
+    })
+  return dict(settings) if settings else None
 
-  return settings
+
+def _invalidate_email_settings() -> None:
+  with _email_settings_lock:
+    _email_settings_snapshot["loaded_at"] = 0.0
+  _email_settings_counters["invalidations"] += 1
+
+
+def _email_settings_cache_stats() -> dict:
+  with _email_settings_lock:
+    loaded_at = _email_settings_snapshot["loaded_at"]
+    db_updated_at = _email_settings_snapshot["db_updated_at"]
+  return {
+    "ttl_seconds": EMAIL_SETTINGS_TTL,
+    "version_check_seconds": EMAIL_SETTINGS_VERSION_CHECK_SECONDS,
+    "age_seconds": round(time.monotonic() - loaded_at, 1) if loaded_at else None,
+    "db_updated_at": db_updated_at,
+    **_email_settings_counters,
+  }
 
 
 def _get_email_template(template_name: str) -> Optional[dict]:
@@ -426,8 +860,147 @@ def _parse_sender_email_string(sender_string: str) -> Dict[str, str]:
     return {"address": sender_string}
 
 
-def _send_email_via_maileroo(recipient_email: str, subject: str, html_content: str, sender_email: Optional[str] = None) -> bool:
-  settings = _get_email_settings()
+class _TokenBucket:
+  """
+  Thread-safe token bucket: refills at `rate` tokens/second up to `burst`. acquire() blocks until a token is available.
+  """
+  def __init__(self, rate: float, burst: int):
+    self.rate = max(0.001, float(rate))
+    self.burst = max(1, int(burst))
+    self._tokens = float(self.burst)
+    self._updated = time.monotonic()
+    self._lock = threading.Lock()
+    self.waited_seconds = 0.0
+
+  def acquire(self, tokens: float = 1.0) -> float:
+    waited = 0.0
+    while True:
+      with self._lock:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= tokens:
+          self._tokens -= tokens
+          self.waited_seconds += waited
+          return waited
+        sleep_for = (tokens - self._tokens) / self.rate
+      time.sleep(sleep_for)
+      waited += sleep_for
+
+
+_maileroo_rate_limiter = _TokenBucket(MAILEROO_RATE_LIMIT_PER_SECOND, MAILEROO_RATE_LIMIT_BURST)
+_maileroo_http: Optional[requests.Session] = None
+_maileroo_http_pid: Optional[int] = None
+_maileroo_http_lock = threading.Lock()
+_maileroo_http_counters = {"requests": 0, "retries": 0, "gave_up": 0, "connections_reset": 0}
+
+
+def _maileroo_session() -> requests.Session:
+  """
+  Returns this worker's pooled keep-alive session for Maileroo (re-created after fork so
+  processes never share sockets).
+  """
+  global _maileroo_http, _maileroo_http_pid
+  if _maileroo_http is None or _maileroo_http_pid != os.getpid():
+    with _maileroo_http_lock:
+      if _maileroo_http is None or _maileroo_http_pid != os.getpid():
+        sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=MAILEROO_POOL_SIZE, pool_block=True)
+        sess.mount("https://", adapter)
+        sess.mount("http://", adapter)
+        sess.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+        _maileroo_http, _maileroo_http_pid = sess, os.getpid()
+  return _maileroo_http
+
+
+def _retry_after_seconds(response: Optional[requests.Response]) -> Optional[float]:
+  """
+  Parses a Retry-After header (delta-seconds or HTTP-date). Returns None if absent/invalid.
+  """
+  raw = response.headers.get("Retry-After") if response is not None else None
+  if not raw:
+    return None
+  try:
+    return max(0.0, float(raw))
+  except ValueError:
+    pass
+  try:
+    return max(0.0, (email.utils.parsedate_to_datetime(raw) - datetime.now(timezone.utc)).total_seconds())
+  except Exception:
+    return None
+
+
+def _backoff_delay(attempt: int) -> float:
+  # "Full jitter" exponential backoff
+  return random.uniform(0, min(MAILEROO_BACKOFF_MAX, MAILEROO_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _maileroo_post(url: str, api_key: str, payload: dict) -> requests.Response:
+  """
+  POSTs to Maileroo over the pooled session. Retries up to MAILEROO_MAX_RETRIES times on
+  429/5xx (honouring Retry-After) and on connection failures. Read timeouts are not retried,
+  because the message may already have been accepted. Raises requests.exceptions.RequestException
+  when the last attempt fails at the transport level.
+  """
+  sess = _maileroo_session()
+  attempt = 0
+  while True:
+    _acquire_maileroo_send_slot()
+    _maileroo_http_counters["requests"] += 1
+    try:
+      response = sess.post(
+        url,
+        headers={"X-API-Key": api_key},
+        json=payload,
+        timeout=(MAILEROO_CONNECT_TIMEOUT, MAILEROO_READ_TIMEOUT),
+      )
+    except requests.exceptions.ConnectionError as e:
+      # Includes ConnectTimeout and stale keep-alive sockets closed by the server
+      _maileroo_http_counters["connections_reset"] += 1
+      if attempt >= MAILEROO_MAX_RETRIES:
+        _maileroo_http_counters["gave_up"] += 1
+        raise
+      delay = _backoff_delay(attempt)
+      print(f"Maileroo: connection error ({e}); retry {attempt + 1}/{MAILEROO_MAX_RETRIES} in {delay:.2f}s", file=sys.stderr)
+    else:
+      if response.status_code not in MAILEROO_RETRY_STATUSES or attempt >= MAILEROO_MAX_RETRIES:
+        if response.status_code in MAILEROO_RETRY_STATUSES:
+          _maileroo_http_counters["gave_up"] += 1
+        return response
+      delay = _backoff_delay(attempt)
+      retry_after = _retry_after_seconds(response)
+      if retry_after is not None:
+        if retry_after > MAILEROO_BACKOFF_MAX:
+          # Don't park a worker for minutes; let the caller treat it as a failed send
+          print(f"Maileroo: status={response.status_code}; Retry-After {retry_after:.0f}s exceeds backoff cap, giving up", file=sys.stderr)
+          _maileroo_http_counters["gave_up"] += 1
+          return response
+        delay = max(delay, retry_after)
+      print(f"Maileroo: status={response.status_code}; retry {attempt + 1}/{MAILEROO_MAX_RETRIES} in {delay:.2f}s", file=sys.stderr)
+    _maileroo_http_counters["retries"] += 1
+    attempt += 1
+    time.sleep(delay)
+
+
+def _maileroo_http_stats() -> dict:
+  return {
+    "pool_size": MAILEROO_POOL_SIZE,
+    "connect_timeout": MAILEROO_CONNECT_TIMEOUT,
+    "read_timeout": MAILEROO_READ_TIMEOUT,
+    "max_retries": MAILEROO_MAX_RETRIES,
+    "rate_limit_per_second": MAILEROO_RATE_LIMIT_PER_SECOND,
+    "rate_limit_scope": MAILEROO_RATE_LIMIT_SCOPE,
+    "daily_budget": MAILEROO_DAILY_BUDGET or None,
+    "rate_limit_waited_seconds": round(_maileroo_rate_limiter.waited_seconds, 3),
+    **_maileroo_http_counters,
+  }
+
+
+def _send_email_via_maileroo(recipient_email: str, subject: str, html_content: str, sender_email: Optional[str] = None, settings: Optional[dict] = None) -> bool:
+  """
+  Sends one email through Maileroo. Pass settings to reuse a snapshot pinned for a whole job run.
+  """
+  settings = settings or _get_email_settings()
   if not settings:
     print("ERROR: Maileroo: Email settings not found in DB and no usable ENV fallback.", file=sys.stderr)
     return False
@@ -450,6 +1023,11 @@ def _send_email_via_maileroo(recipient_email: str, subject: str, html_content: s
   final_sender_string = sender_email if sender_email else default_sender
   from_email_object = _parse_sender_email_string(final_sender_string)
 
+  # The daily budget is taken before the request (so concurrent senders cannot overrun it) and given
+  # back below whenever Maileroo did not accept the message
+  if not _maileroo_budget_allows():
+    return False
+
   send_url = _resolved_maileroo_send_url(settings)
 
   # Build payload in v2 shape
@@ -471,16 +1049,7 @@ def _send_email_via_maileroo(recipient_email: str, subject: str, html_content: s
         print(f"Maileroo DIAG: X-API-Key (masked): {maileroo_api_key}", file=sys.stderr)
 
     print(f"Maileroo: POST {send_url} (base: {base_or_full_endpoint})", file=sys.stderr)
-    response = requests.post(
-      send_url,
-      headers={
-        "Content-Type": "application/json",
-        "X-API-Key": maileroo_api_key,
-        "Accept": "application/json",
-      },
-      json=payload,
-      timeout=15
-    )
+    response = _maileroo_post(send_url, maileroo_api_key, payload)
 
     status = response.status_code
     body_text = ""
@@ -497,10 +1066,13 @@ def _send_email_via_maileroo(recipient_email: str, subject: str, html_content: s
       return True
     else:
       print(f"ERROR: Maileroo non-2xx ({status}).", file=sys.stderr)
+      _refund_maileroo_budget()
       return False
 
   except requests.exceptions.RequestException as e:
     print(f"ERROR: Maileroo: Request error while sending to {recipient_email}: {e}", file=sys.stderr)
+    if not isinstance(e, requests.exceptions.ReadTimeout):  # may have been accepted; keep it counted
+      _refund_maileroo_budget()
     try:
       if getattr(e, "response", None) is not None:
         print(f"Maileroo Error Response: {e.response.text}", file=sys.stderr)
@@ -509,433 +1081,3621 @@ def _send_email_via_maileroo(recipient_email: str, subject: str, html_content: s
     return False
   except Exception as e:
     print(f"ERROR: Maileroo: Unexpected error: {e}", file=sys.stderr)
+    _refund_maileroo_budget()
     return False
 
 
-def _send_push_notification(subscription_info: dict, title: str, body: str, url: str = VITE_FRONTEND_URL) -> bool:
+class _PushClient:
+  """
+  Web push delivery with per-process state (re-created after fork, like the Maileroo session):
+    - the VAPID key is parsed once and the signed Authorization/Crypto-Key headers are cached per
+      push service audience until PUSH_VAPID_REFRESH_MARGIN_SECONDS before their JWT expires;
+    - one pooled keep-alive requests.Session per endpoint origin (FCM, Mozilla autopush, WNS, Apple, ...);
+    - per-origin counters: requests, status codes, transport errors and a latency histogram;
+    - dead subscriptions (404/410) queued and pruned from profiles in batches (see _prune_dead_subscriptions).
+  """
+  DEAD_STATUSES = (404, 410)
+
+  def __init__(self):
+    self.pid = os.getpid()
+    self._lock = threading.Lock()
+    self._vapid: Optional[Vapid] = None
+    self._headers: Dict[str, Tuple[dict, float]] = {}
+    self._sessions: Dict[str, requests.Session] = {}
+    self._stats: Dict[str, dict] = {}
+    self.vapid_signatures = 0
+    self._dead: Dict[str, float] = {}  # endpoint -> first reported (monotonic)
+    self._flush_timer: Optional[threading.Timer] = None
+    self._prune_lock = threading.Lock()
+    self.prune_counters = {"reported": 0, "pruned_subscriptions": 0, "pruned_profiles": 0, "batches": 0, "errors": 0}
+
+  @staticmethod
+  def origin(endpoint: str) -> str:
+    parsed = urlparse(endpoint or "")
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+  def vapid_headers(self, audience: str) -> dict:
+    now = time.time()
+    cached = self._headers.get(audience)
+    if cached and cached[1] - PUSH_VAPID_REFRESH_MARGIN_SECONDS > now:
+      return cached[0]
+    with self._lock:
+      cached = self._headers.get(audience)
+      if cached and cached[1] - PUSH_VAPID_REFRESH_MARGIN_SECONDS > now:
+        return cached[0]
+      if self._vapid is None:
+        # Same key formats webpush() accepts: a path to a PEM file or the base64url-encoded key
+        if os.path.isfile(VAPID_PRIVATE_KEY):
+          self._vapid = Vapid.from_file(private_key_file=VAPID_PRIVATE_KEY)
+        else:
+          self._vapid = Vapid.from_string(private_key=VAPID_PRIVATE_KEY)
+      expires_at = int(now) + PUSH_VAPID_EXPIRY_SECONDS
+      # Fresh claims every time: pywebpush's webpush() used to write aud/exp into the shared VAPID_CLAIMS
+      headers = self._vapid.sign({**VAPID_CLAIMS, "aud": audience, "exp": expires_at})
+      self._headers[audience] = (headers, float(expires_at))
+      self.vapid_signatures += 1
+      return headers
+
+  def session(self, origin: str) -> requests.Session:
+    sess = self._sessions.get(origin)
+    if sess is None:
+      with self._lock:
+        sess = self._sessions.get(origin)
+        if sess is None:
+          sess = requests.Session()
+          adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PUSH_POOL_SIZE, pool_block=True)
+          sess.mount("https://", adapter)
+          sess.mount("http://", adapter)
+          self._sessions[origin] = sess
+    return sess
+
+  def _record(self, origin: str, status: Optional[int], seconds: float) -> None:
+    with self._lock:
+      st = self._stats.get(origin)
+      if st is None:
+        st = self._stats[origin] = {"requests": 0, "errors": 0, "status": {}, "latency": _new_latency_histogram()}
+      st["requests"] += 1
+      if status is None:
+        st["errors"] += 1
+      else:
+        st["status"][str(status)] = st["status"].get(str(status), 0) + 1
+      ms = seconds * 1000.0
+      i = next((i for i, bound in enumerate(_LATENCY_BUCKETS_MS) if ms <= bound), len(_LATENCY_BUCKETS_MS))
+      st["latency"]["buckets"][i] += 1
+      st["latency"]["count"] += 1
+      st["latency"]["sum_ms"] += ms
+      st["latency"]["max_ms"] = max(st["latency"]["max_ms"], ms)
+
+  def send(self, subscription_info: dict, data: str, ttl: int = PUSH_MESSAGE_TTL_SECONDS) -> requests.Response:
+    """
+    Encrypts and posts one message. Raises WebPushException for non-2xx responses (with .response set).
+    """
+    return self.post(subscription_info.get("endpoint"), push_crypto.encrypt_payload(subscription_info, data), ttl)
+
+  def post(self, endpoint: str, body: bytes, ttl: int = PUSH_MESSAGE_TTL_SECONDS) -> requests.Response:
+    """
+    Posts an already encrypted (aes128gcm) payload, e.g. one encrypted in the broadcast process pool.
+    """
+    origin = self.origin(endpoint)
+    headers = {**self.vapid_headers(origin), "Content-Encoding": push_crypto.CONTENT_ENCODING, "TTL": str(ttl)}
+    started = time.monotonic()
+    try:
+      response = self.session(origin).post(endpoint, data=body, headers=headers, timeout=(PUSH_CONNECT_TIMEOUT, PUSH_READ_TIMEOUT))
+    except requests.exceptions.RequestException:
+      self._record(origin, None, time.monotonic() - started)
+      raise
+    self._record(origin, response.status_code, time.monotonic() - started)
+    if response.status_code in self.DEAD_STATUSES:
+      self.report_dead(endpoint)
+    if response.status_code > 202:
+      raise WebPushException(f"Push failed: {response.status_code} {response.reason}", response=response)
+    return response
+
+  def report_dead(self, endpoint: Optional[str]) -> None:
+    """
+    Queues an endpoint the push service no longer accepts; flushed by size or after PUSH_PRUNE_FLUSH_SECONDS.
+    """
+    if not endpoint:
+      return
+    with self._lock:
+      if endpoint in self._dead:
+        return
+      self._dead[endpoint] = time.monotonic()
+      self.prune_counters["reported"] += 1
+      full = len(self._dead) >= PUSH_PRUNE_BATCH_SIZE
+      if not full and self._flush_timer is None:
+        self._flush_timer = threading.Timer(PUSH_PRUNE_FLUSH_SECONDS, self.flush_dead)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+    if full:
+      self.flush_dead()
+
+  def flush_dead(self) -> int:
+    """
+    Prunes every queued dead endpoint, PUSH_PRUNE_BATCH_SIZE per statement. Returns profiles updated.
+    """
+    with self._prune_lock:
+      with self._lock:
+        endpoints = list(self._dead)
+        self._dead.clear()
+        if self._flush_timer is not None:
+          self._flush_timer.cancel()
+          self._flush_timer = None
+      updated = 0
+      for i in range(0, len(endpoints), max(1, PUSH_PRUNE_BATCH_SIZE)):
+        batch = endpoints[i:i + max(1, PUSH_PRUNE_BATCH_SIZE)]
+        try:
+          user_ids = _prune_dead_subscriptions(batch)
+        except Exception as e:
+          print(f"ERROR: could not prune {len(batch)} dead push subscription(s): {e}", file=sys.stderr)
+          with self._lock:
+            self.prune_counters["errors"] += 1
+          continue
+        for uid in user_ids:
+          _invalidate_profile(uid)
+        updated += len(user_ids)
+        with self._lock:
+          self.prune_counters["batches"] += 1
+          self.prune_counters["pruned_subscriptions"] += len(batch)
+          self.prune_counters["pruned_profiles"] += len(user_ids)
+      if endpoints:
+        print(f"Pruned {len(endpoints)} dead push subscription(s) from {updated} profile(s).", file=sys.stderr)
+      return updated
+
+  def stats(self) -> dict:
+    with self._lock:
+      services = {
+        origin: {
+          "requests": st["requests"],
+          "errors": st["errors"],
+          "status": dict(st["status"]),
+          "latency_ms": _latency_percentiles(st["latency"]),
+        }
+        for origin, st in self._stats.items()
+      }
+      prune = {**self.prune_counters, "queued": len(self._dead)}
+    return {
+      "pid": self.pid,
+      "vapid_signatures": self.vapid_signatures,
+      "cached_audiences": len(self._headers),
+      "sessions": len(self._sessions),
+      "services": services,
+      "prune": prune,
+    }
+
+
+_push_client: Optional[_PushClient] = None
+_push_client_lock = threading.Lock()
+
+
+def _get_push_client() -> _PushClient:
+  global _push_client
+  if _push_client is None or _push_client.pid != os.getpid():
+    with _push_client_lock:
+      if _push_client is None or _push_client.pid != os.getpid():
+        _push_client = _PushClient()
+  return _push_client
+
+
+def _prune_dead_subscriptions(endpoints: list) -> list:
+  """
+  Removes these endpoints from the device registry, clears profiles.push_subscription where it is one of
+  them and sets notifications.push = false for users left without a device, in one statement
+  (prune_push_subscriptions RPC). Returns affected user ids.
+  """
+  if not supabase or not endpoints:
+    return []
+  try:
+    res = supabase.rpc("prune_push_subscriptions", {"p_endpoints": endpoints}).execute()
+    return [r["user_id"] if isinstance(r, dict) else r for r in (res.data or [])]
+  except Exception as e:
+    print(f"prune_push_subscriptions RPC unavailable, pruning row by row: {e}", file=sys.stderr)
+  supabase.table("push_subscriptions").delete().in_("endpoint", endpoints).execute()
+  rows = (
+    supabase.table("profiles")
+    .select("id, notifications")
+    .in_("push_subscription->>endpoint", endpoints)
+    .execute()
+  ).data or []
+  for row in rows:
+    notif = dict(row.get("notifications") or {}) if isinstance(row.get("notifications"), dict) else None
+    updates = {"push_subscription": None}
+    if notif is not None:
+      notif["push"] = False
+      updates["notifications"] = notif
+    supabase.table("profiles").update(updates).eq("id", row["id"]).execute()
+  return [row["id"] for row in rows]
+
+
+def _push_payload(title: str, body: str, url: str = VITE_FRONTEND_URL) -> str:
+  return json.dumps({
+    "title": title,
+    "body": body,
+    "url": url,
+    "icon": f"{VITE_FRONTEND_URL}/favicon.svg",
+    "badge": f"{VITE_FRONTEND_URL}/favicon.svg",
+  })
+
+
+def _send_push_notification(subscription_info: dict, title: str, body: str, url: str = VITE_FRONTEND_URL,
+                            payload: Optional[str] = None) -> bool:
   # Only private key is required to sign VAPID; public key is used by client to subscribe
   if not VAPID_PRIVATE_KEY:
     print("VAPID private key not configured for push notifications.", file=sys.stderr)
     return False
   try:
-    payload = json.dumps({
-      "title": title,
-      "body": body,
-      "url": url,
-      "icon": f"{VITE_FRONTEND_URL}/favicon.svg",
-      "badge": f"{VITE_FRONTEND_URL}/favicon.svg",
-    })
-    webpush(
-      subscription_info=subscription_info,
-      data=payload,
-      vapid_private_key=VAPID_PRIVATE_KEY,
-      vapid_claims=VAPID_CLAIMS
-    )
+    _get_push_client().send(subscription_info, payload or _push_payload(title, body, url))
     print(f"Push notification sent to {subscription_info.get('endpoint')}", file=sys.stderr)
     return True
   except WebPushException as e:
+    # 404/410 responses were already queued for pruning by the push client
     print(f"Push notification failed: {e}", file=sys.stderr)
-    try:
-      if e.response is not None and hasattr(e.response, "status_code") and e.response.status_code == 410:
-        print("Subscription is no longer valid (410 Gone). Should remove from DB.", file=sys.stderr)
-    except Exception:
-      pass
     return False
   except Exception as e:
     print(f"An unexpected error occurred while sending push notification: {e}", file=sys.stderr)
     return False
 
 # -----------------------------------------------------------------------------
-# Routes
+# Push subscription registry (one row per device endpoint)
 # -----------------------------------------------------------------------------
-@app.get("/api/health")
-def health():
-  return jsonify({"ok": True, "service": "dayclap-backend"}), 200
+# public.push_subscriptions is the delivery source of truth. profiles.push_subscription is still written
+# (latest device) for the frontend, and a trigger copies direct writes to it into the registry.
+_push_fanout_executor: Optional[ThreadPoolExecutor] = None
+_push_fanout_executor_lock = threading.Lock()
+
+
+def _get_push_fanout_executor() -> ThreadPoolExecutor:
+  global _push_fanout_executor
+  if _push_fanout_executor is None:
+    with _push_fanout_executor_lock:
+      if _push_fanout_executor is None:
+        _push_fanout_executor = ThreadPoolExecutor(max_workers=max(1, PUSH_FANOUT_CONCURRENCY), thread_name_prefix="push-fanout")
+  return _push_fanout_executor
+
+
+def _valid_push_subscription(sub: Any) -> bool:
+  keys = sub.get("keys") if isinstance(sub, dict) else None
+  return (
+    isinstance(sub, dict) and isinstance(sub.get("endpoint"), str) and sub["endpoint"].startswith("https://")
+    and isinstance(keys, dict) and bool(keys.get("p256dh")) and bool(keys.get("auth"))
+  )
 
 
-@app.post("/api/subscribe-push")
-@require_auth
-def subscribe_push():
+def _register_push_subscription(user_id: str, sub: dict, user_agent: Optional[str] = None) -> None:
   """
-  Save a push subscription for the authenticated user.
-  Body: Web Push subscription JSON
-  Behavior: sets profiles.push_subscription and notifications.push = true (if column exists)
+  Adds or refreshes a device. The endpoint is unique, so a browser re-subscribing (or a device handed to
+  another account) updates the existing row instead of adding a duplicate.
   """
-  if not supabase:
-    return jsonify({"message": "Supabase client not configured"}), 500
+  now = _utcnow_iso()
+  supabase.table("push_subscriptions").upsert({
+    "endpoint": sub["endpoint"],
+    "user_id": user_id,
+    "subscription": {"endpoint": sub["endpoint"], "keys": sub["keys"]},
+    "user_agent": (user_agent or "")[:512] or None,
+    "last_seen_at": now,
+  }, on_conflict="endpoint").execute()
 
-  body = request.get_json(force=True, silent=True) or {}
-  uid = request._auth["id"]
 
-  updates = {
-    "push_subscription": body,
-    "last_activity_at": _utcnow_iso(),
-  }
+def _fetch_push_subscriptions(user_ids: list) -> Dict[str, list]:
+  """
+  All registered devices of these users: {user_id: [subscription_info, ...]}.
+  """
+  by_user: Dict[str, list] = {}
+  ids = [str(u) for u in dict.fromkeys(user_ids) if u]
+  for i in range(0, len(ids), REMINDER_PROFILE_BATCH_SIZE):
+    chunk = ids[i:i + REMINDER_PROFILE_BATCH_SIZE]
+    rows = supabase.table("push_subscriptions").select(PUSH_SUBSCRIPTION_COLUMNS).in_("user_id", chunk).execute().data or []
+    for row in rows:
+      if isinstance(row.get("subscription"), dict):
+        by_user.setdefault(str(row["user_id"]), []).append(row["subscription"])
+  return by_user
+
+
+def _send_push_to_users(messages: Dict[str, Tuple[str, str, str]], subscriptions: Optional[Dict[str, list]] = None) -> Dict[str, dict]:
+  """
+  Delivers one message per user to all of that user's devices, every (user, device) pair concurrently
+  (PUSH_FANOUT_CONCURRENCY threads).
+  messages: {user_id: (title, body, url)}; subscriptions: optional prefetched _fetch_push_subscriptions() result.
+  Returns {user_id: {"devices", "sent", "failed"}}. Successful endpoints get last_success_at stamped in one
+  UPDATE; dead endpoints are pruned by the push client.
+  """
+  if not supabase or not messages:
+    return {}
+  if subscriptions is None:
+    subscriptions = _fetch_push_subscriptions(list(messages))
+  results = {uid: {"devices": len(subscriptions.get(uid) or []), "sent": 0, "failed": 0} for uid in messages}
+  jobs = []
+  for uid, (title, body, url) in messages.items():
+    payload = _push_payload(title, body, url)
+    for sub in subscriptions.get(uid) or []:
+      jobs.append((uid, sub, payload))
+  if not jobs:
+    return results
+
+  executor = _get_push_fanout_executor()
+  futures = [executor.submit(_send_push_notification, sub, "", "", payload=payload) for _, sub, payload in jobs]
+  delivered = []
+  for (uid, sub, _), fut in zip(jobs, futures):
+    try:
+      ok = fut.result()
+    except Exception as e:
+      print(f"Push fan-out error for user {uid}: {e}", file=sys.stderr)
+      ok = False
+    results[uid]["sent" if ok else "failed"] += 1
+    if ok:
+      delivered.append(sub["endpoint"])
 
-  profile = fetch_profile(uid)
-  if profile and isinstance(profile.get("notifications"), dict):
-    notif = dict(profile.get("notifications") or {})
-    notif["push"] = True
-    updates["notifications"] = notif
+  for i in range(0, len(delivered), REMINDER_PROFILE_BATCH_SIZE):
+    try:
+      supabase.table("push_subscriptions").update({"last_success_at": _utcnow_iso()}).in_(
+        "endpoint", delivered[i:i + REMINDER_PROFILE_BATCH_SIZE]
+      ).execute()
+    except Exception as e:
+      print(f"Could not record push delivery timestamps: {e}", file=sys.stderr)
+  return results
 
-  try:
-    supabase.table("profiles").update(updates).eq("id", uid).execute()
-    return jsonify({"message": "Subscription saved"}), 200
-  except Exception as e:
-    print(f"subscribe_push update error: {e}", file=sys.stderr)
-    return jsonify({"message": "Subscription accepted"}), 200
 
+def _send_push_to_user(user_id: str, title: str, body: str, url: str = VITE_FRONTEND_URL) -> dict:
+  """
+  Delivers one message to every registered device of a user. Returns {"devices", "sent", "failed"}.
+  """
+  return _send_push_to_users({str(user_id): (title, body, url)}).get(str(user_id)) or {"devices": 0, "sent": 0, "failed": 0}
 
-@app.post("/api/unsubscribe-push")
-@require_auth
-def unsubscribe_push():
+# -----------------------------------------------------------------------------
+# Outbox (durable local email queue)
+# -----------------------------------------------------------------------------
+# Rows move pending -> sending (leased) -> sent | failed. While a row is being sent, a renewer thread keeps
+# pushing its lease forward, so a send slowed down by the rate limiter or retries is never reclaimed by
+# another worker. A worker that dies mid-send stops renewing and leaves an expired lease behind, which
+# any worker may reclaim, so delivery is at-least-once; dedup_key makes enqueueing idempotent for as long
+# as the row is retained.
+_OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  dedup_key TEXT UNIQUE,
+  kind TEXT NOT NULL,
+  recipient TEXT NOT NULL,
+  subject TEXT NOT NULL,
+  html TEXT NOT NULL,
+  sender TEXT,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at REAL NOT NULL,
+  lease_until REAL,
+  created_at REAL NOT NULL,
+  sent_at REAL,
+  last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_ready_idx ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_sent_at_idx ON outbox (sent_at);
+"""
+
+_outbox_init_lock = threading.Lock()
+_outbox_initialized = False
+_outbox_wakeup = threading.Event()
+_outbox_threads: list = []
+_outbox_threads_pid: Optional[int] = None
+_outbox_last_purge = 0.0
+# Ids of rows this process is sending right now; their leases are renewed every OUTBOX_LEASE_SECONDS / 3
+_outbox_inflight: set = set()
+_outbox_inflight_lock = threading.Lock()
+_outbox_renewer: Optional[threading.Thread] = None
+
+
+def _outbox_connect() -> sqlite3.Connection:
+  global _outbox_initialized
+  conn = sqlite3.connect(OUTBOX_DB_PATH, timeout=30, isolation_level=None)
+  conn.row_factory = sqlite3.Row
+  if not _outbox_initialized:
+    with _outbox_init_lock:
+      if not _outbox_initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_OUTBOX_SCHEMA)
+        _outbox_initialized = True
+  conn.execute("PRAGMA busy_timeout=30000")
+  return conn
+
+
+def _outbox_dedup_key(kind: str, *parts, window_seconds: Optional[int] = None) -> str:
   """
-  Remove a push subscription for the authenticated user.
-  Body: { endpoint?: string }
-  Behavior: sets profiles.push_subscription = null and notifications.push = false (best-effort)
+  Builds a dedup key from the message identity. With window_seconds, identical messages are only
+  collapsed within the same time bucket (so a legitimate repeat later on is still delivered).
   """
-  if not supabase:
-    return jsonify({"message": "Supabase client not configured"}), 500
+  material = [kind] + [str(p) for p in parts]
+  if window_seconds:
+    material.append(str(int(time.time() // window_seconds)))
+  return f"{kind}:" + hashlib.sha256("\x1f".join(material).encode("utf-8")).hexdigest()[:32]
 
-  uid = request._auth["id"]
 
-  updates = {
-    "push_subscription": None,
-    "last_activity_at": _utcnow_iso(),
-  }
+def _outbox_enqueue(kind: str, recipient: str, subject: str, html_content: str, sender: Optional[str] = None, dedup_key: Optional[str] = None) -> bool:
+  """
+  Stores a rendered email for background delivery. Returns True if it was queued (or an identical
+  message is already queued/sent under the same dedup_key).
+  """
+  now = time.time()
+  conn = _outbox_connect()
+  try:
+    conn.execute(
+      "INSERT OR IGNORE INTO outbox (dedup_key, kind, recipient, subject, html, sender, next_attempt_at, created_at) "
+      "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+      (dedup_key, kind, recipient, subject or "", html_content or "", sender, now, now),
+    )
+  finally:
+    conn.close()
+  _ensure_outbox_workers()
+  _outbox_wakeup.set()
+  return True
 
-  profile = fetch_profile(uid)
-  if profile and isinstance(profile.get("notifications"), dict):
-    notif = dict(profile.get("notifications") or {})
-    notif["push"] = False
-    updates["notifications"] = notif
 
+def _outbox_enqueue_many(kind: str, messages: list) -> None:
+  """
+  _outbox_enqueue for many messages ({"to", "subject", "html", "sender"?, "dedup_key"?}) in one transaction.
+  """
+  now = time.time()
+  conn = _outbox_connect()
   try:
-    supabase.table("profiles").update(updates).eq("id", uid).execute()
-    return jsonify({"message": "Subscription disabled"}), 200
-  except Exception as e:
-    print(f"unsubscribe_push update error: {e}", file=sys.stderr)
-    return jsonify({"message": "Subscription disabled"}), 500
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+      conn.executemany(
+        "INSERT OR IGNORE INTO outbox (dedup_key, kind, recipient, subject, html, sender, next_attempt_at, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(m.get("dedup_key"), kind, m["to"], m["subject"] or "", m["html"] or "", m.get("sender"), now, now) for m in messages],
+      )
+      conn.execute("COMMIT")
+    except Exception:
+      conn.execute("ROLLBACK")
+      raise
+  finally:
+    conn.close()
+  _ensure_outbox_workers()
+  _outbox_wakeup.set()
 
 
-@app.post("/api/send-invitation")
-@require_auth
-def send_invitation():
+def _queue_emails(kind: str, messages: list) -> list:
   """
-  Sends (records) an invitation to join a company.
-  Security:
-    - Requires Authorization: Bearer <token>
-    - Derives sender_id and sender_email from token (ignores any spoofed fields)
-    - Verifies that the sender has role owner/admin for company_id
-  Body JSON:
-    {
-      "recipient_email": "member@example.com",   (required)
-      "company_id": "uuid-or-string",           (required)
-      "company_name": "Company Name",           (required)
-      "role": "user" | "admin"                  (optional, defaults to "user")
-    }
-  Cooldown:
-    - Enforces a cooldown between identical invitations (same sender, recipient, and company).
-    - Duration is configured via INVITE_COOLDOS_SECONDS (default: 300).
-    - Returns 429 with Retry-After header and JSON body if within cooldown.
+  Batch form of _queue_email: queues all messages in one outbox transaction, or sends them
+  concurrently (_dispatch_emails) when the outbox is disabled or unavailable.
+  Returns "queued", "sent" or "failed" per message, in order.
   """
-  if not supabase:
-    return jsonify({"message": "Supabase client not configured"}), 500
+  if not messages:
+    return []
+  if OUTBOX_ENABLED:
+    try:
+      _outbox_enqueue_many(kind, messages)
+      return ["queued"] * len(messages)
+    except Exception as e:
+      print(f"ERROR: outbox enqueue failed ({e}); sending inline.", file=sys.stderr)
+  return ["sent" if ok else "failed" for _, ok, _ in _dispatch_emails(messages)]
 
-  body = request.get_json(force=True, silent=True) or {}
-  recipient = (body.get("recipient_email") or "").strip().lower()
-  company_id = str(body.get("company_id") or "").strip()
+
+def _queue_email(kind: str, recipient: str, subject: str, html_content: str, sender_email: Optional[str] = None, dedup_key: Optional[str] = None) -> bool:
+  """
+  Hands a transactional email to the outbox, or sends it inline when the outbox is disabled
+  or unavailable. Returns True if the message was accepted.
+  """
+  if OUTBOX_ENABLED:
+    try:
+      return _outbox_enqueue(kind, recipient, subject, html_content, sender_email, dedup_key)
+    except Exception as e:
+      print(f"ERROR: outbox enqueue failed ({e}); sending inline.", file=sys.stderr)
+  return _send_email_via_maileroo(recipient, subject, html_content, sender_email)
+
+
+def _outbox_claim() -> Optional[sqlite3.Row]:
+  now = time.time()
+  conn = _outbox_connect()
+  try:
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(
+      "SELECT * FROM outbox "
+      "WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_until < ?) "
+      "ORDER BY next_attempt_at LIMIT 1",
+      (now, now),
+    ).fetchone()
+    if row:
+      conn.execute(
+        "UPDATE outbox SET status = 'sending', lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+        (now + OUTBOX_LEASE_SECONDS, row["id"]),
+      )
+    conn.execute("COMMIT")
+    return row
+  except Exception:
+    conn.execute("ROLLBACK")
+    raise
+  finally:
+    conn.close()
+
+
+def _outbox_complete(row: sqlite3.Row, ok: bool, error: Optional[str] = None) -> None:
+  now = time.time()
+  conn = _outbox_connect()
+  try:
+    if ok:
+      conn.execute("UPDATE outbox SET status = 'sent', sent_at = ?, lease_until = NULL, last_error = NULL WHERE id = ?", (now, row["id"]))
+    elif row["attempts"] + 1 >= OUTBOX_MAX_ATTEMPTS:
+      conn.execute("UPDATE outbox SET status = 'failed', lease_until = NULL, last_error = ? WHERE id = ?", (error, row["id"]))
+      print(f"ERROR: outbox message {row['id']} ({row['kind']} to {row['recipient']}) failed permanently: {error}", file=sys.stderr)
+    else:
+      delay = min(3600, 30 * (2 ** row["attempts"])) * random.uniform(0.8, 1.2)
+      conn.execute(
+        "UPDATE outbox SET status = 'pending', next_attempt_at = ?, lease_until = NULL, last_error = ? WHERE id = ?",
+        (now + delay, error, row["id"]),
+      )
+  finally:
+    conn.close()
+
+
+def _outbox_purge() -> None:
+  global _outbox_last_purge
+  now = time.time()
+  if now - _outbox_last_purge < 600:
+    return
+  _outbox_last_purge = now
+  conn = _outbox_connect()
+  try:
+    conn.execute("DELETE FROM outbox WHERE status IN ('sent', 'failed') AND created_at < ?", (now - OUTBOX_RETENTION_SECONDS,))
+  finally:
+    conn.close()
+
+
+def _outbox_worker_loop() -> None:
+  while True:
+    try:
+      _outbox_purge()
+      row = _outbox_claim()
+    except Exception as e:
+      print(f"ERROR: outbox worker could not claim a message: {e}", file=sys.stderr)
+      time.sleep(5)
+      continue
+    if not row:
+      _outbox_wakeup.wait(OUTBOX_POLL_SECONDS)
+      _outbox_wakeup.clear()
+      continue
+    with _outbox_inflight_lock:
+      _outbox_inflight.add(row["id"])
+    try:
+      try:
+        ok = _send_email_via_maileroo(row["recipient"], row["subject"], row["html"], row["sender"] or None)
+        error = None if ok else "Maileroo send failed (see logs)"
+      except Exception as e:
+        ok, error = False, str(e)
+      try:
+        _outbox_complete(row, ok, error)
+      except Exception as e:
+        # Lease expiry will make the row claimable again
+        print(f"ERROR: outbox could not record result for message {row['id']}: {e}", file=sys.stderr)
+    finally:
+      with _outbox_inflight_lock:
+        _outbox_inflight.discard(row["id"])
+
+
+def _outbox_renew_leases() -> int:
+  """
+  Extends the leases of the rows this process is still sending. Returns how many were renewed.
+  """
+  with _outbox_inflight_lock:
+    ids = list(_outbox_inflight)
+  if not ids:
+    return 0
+  conn = _outbox_connect()
+  try:
+    cur = conn.execute(
+      f"UPDATE outbox SET lease_until = ? WHERE status = 'sending' AND id IN ({','.join('?' * len(ids))})",
+      [time.time() + OUTBOX_LEASE_SECONDS] + ids,
+    )
+    return cur.rowcount
+  finally:
+    conn.close()
+
+
+def _outbox_renewer_loop() -> None:
+  while True:
+    time.sleep(OUTBOX_LEASE_SECONDS / 3)
+    try:
+      _outbox_renew_leases()
+    except Exception as e:
+      print(f"WARNING: outbox could not renew leases: {e}", file=sys.stderr)
+
+
+def _ensure_outbox_workers() -> None:
+  """
+  Starts this process's delivery threads (once per process, re-started after fork).
+  """
+  global _outbox_threads, _outbox_threads_pid, _outbox_renewer
+  if not OUTBOX_ENABLED:
+    return
+  if _outbox_threads_pid == os.getpid() and all(t.is_alive() for t in _outbox_threads + [_outbox_renewer]):
+    return
+  with _outbox_init_lock:
+    if _outbox_threads_pid == os.getpid() and all(t.is_alive() for t in _outbox_threads + [_outbox_renewer]):
+      return
+    same_process = _outbox_threads_pid == os.getpid()
+    if not same_process:
+      with _outbox_inflight_lock:
+        _outbox_inflight.clear()  # ids inherited from the parent process are not ours to renew
+    alive = [t for t in _outbox_threads if t.is_alive()] if same_process else []
+    for i in range(len(alive), max(1, OUTBOX_WORKERS)):
+      t = threading.Thread(target=_outbox_worker_loop, name=f"outbox-worker-{i}", daemon=True)
+      t.start()
+      alive.append(t)
+    if not (same_process and _outbox_renewer is not None and _outbox_renewer.is_alive()):
+      _outbox_renewer = threading.Thread(target=_outbox_renewer_loop, name="outbox-lease-renewer", daemon=True)
+      _outbox_renewer.start()
+    _outbox_threads, _outbox_threads_pid = alive, os.getpid()
+
+
+def _outbox_stats() -> dict:
+  now = time.time()
+  conn = _outbox_connect()
+  try:
+    by_status = {r["status"]: r["n"] for r in conn.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status")}
+    oldest = conn.execute("SELECT MIN(created_at) AS t FROM outbox WHERE status IN ('pending', 'sending')").fetchone()["t"]
+    sent_windows = {}
+    for label, secs in (("1m", 60), ("5m", 300), ("1h", 3600)):
+      n = conn.execute("SELECT COUNT(*) AS n FROM outbox WHERE status = 'sent' AND sent_at >= ?", (now - secs,)).fetchone()["n"]
+      sent_windows[label] = {"sent": n, "per_minute": round(n / (secs / 60), 2)}
+    recent_errors = [
+      {"id": r["id"], "kind": r["kind"], "recipient": r["recipient"], "attempts": r["attempts"], "status": r["status"], "last_error": r["last_error"]}
+      for r in conn.execute("SELECT * FROM outbox WHERE last_error IS NOT NULL ORDER BY id DESC LIMIT 10")
+    ]
+  finally:
+    conn.close()
+  return {
+    "enabled": OUTBOX_ENABLED,
+    "db_path": OUTBOX_DB_PATH,
+    "depth": by_status.get("pending", 0) + by_status.get("sending", 0),
+    "by_status": by_status,
+    "oldest_pending_age_seconds": round(now - oldest, 1) if oldest else None,
+    "throughput": sent_windows,
+    "workers_alive_in_this_process": sum(1 for t in _outbox_threads if t.is_alive()) if _outbox_threads_pid == os.getpid() else 0,
+    "recent_errors": recent_errors,
+  }
+
+
+# -----------------------------------------------------------------------------
+# Rate limiting (shared by all workers of a host, or all nodes with Redis)
+# -----------------------------------------------------------------------------
+# Policies are "limit/seconds" strings (empty or "0" disables one). Two algorithms:
+#   - sliding window: at most `limit` hits in any rolling `seconds` (weighted two-bucket counter, so the
+#     store holds one counter per key and window instead of a log of hits);
+#   - token bucket: refills limit/seconds tokens per second up to a burst (burst 1 = an exact cooldown).
+# Counters live in a store every gunicorn worker shares: a SQLite file (default, like the outbox), Redis
+# when RATE_LIMIT_REDIS_URL is set (needed to share limits across nodes), or process memory. Once a key
+# is rejected, the worker remembers until when and rejects repeats in memory, without a store round trip.
+RATE_LIMIT_ENABLED = (os.environ.get("RATE_LIMIT_ENABLED", "true") or "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL") or ""
+RATE_LIMIT_BACKEND = (os.environ.get("RATE_LIMIT_BACKEND") or ("redis" if RATE_LIMIT_REDIS_URL else "sqlite")).lower()
+RATE_LIMIT_DB_PATH = os.environ.get("RATE_LIMIT_DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "rate_limits.sqlite3")
+# Proxies in front of the app that append to X-Forwarded-For (0 = use the socket peer address)
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "1") or 0)
+RATE_LIMIT_NOTIFY_TASK_PER_IP = os.environ.get("RATE_LIMIT_NOTIFY_TASK_PER_IP", "30/60")
+RATE_LIMIT_NOTIFY_TASK_PER_RECIPIENT = os.environ.get("RATE_LIMIT_NOTIFY_TASK_PER_RECIPIENT", "10/600")
+RATE_LIMIT_INVITES_PER_SENDER = os.environ.get("RATE_LIMIT_INVITES_PER_SENDER", "200/3600")
+# Maileroo budget: "host" shares MAILEROO_RATE_LIMIT_PER_SECOND between all workers (instead of each worker
+# sending at that rate); MAILEROO_DAILY_BUDGET caps sends per rolling 24h (0 = no cap)
+MAILEROO_RATE_LIMIT_SCOPE = (os.environ.get("MAILEROO_RATE_LIMIT_SCOPE", "host") or "host").lower()
+MAILEROO_DAILY_BUDGET = int(os.environ.get("MAILEROO_DAILY_BUDGET", "0") or 0)
+
+try:
+  import redis  # optional; only needed for RATE_LIMIT_BACKEND=redis
+except ImportError:
+  redis = None
+
+
+class _RateLimit:
+  """
+  A named policy: `limit` hits per `seconds` (sliding_window) or a bucket refilling limit/seconds tokens
+  per second up to `burst` (token_bucket).
+  """
+  def __init__(self, name: str, limit: float, seconds: float, algorithm: str = "sliding_window", burst: Optional[float] = None):
+    self.name = name
+    self.limit = float(limit)
+    self.seconds = float(seconds)
+    self.algorithm = algorithm
+    self.burst = float(burst if burst is not None else limit)
+
+  @classmethod
+  def parse(cls, name: str, spec: Optional[str], algorithm: str = "sliding_window", burst: Optional[float] = None) -> Optional["_RateLimit"]:
+    """
+    "30/60" -> 30 per 60 seconds. Returns None (no limit) for empty or zero specs.
+    """
+    spec = (spec or "").strip()
+    if not spec:
+      return None
+    limit, _, seconds = spec.partition("/")
+    try:
+      limit_n, seconds_n = float(limit), float(seconds or 1)
+    except ValueError:
+      print(f"WARNING: invalid rate limit '{spec}' for {name}; not limiting.", file=sys.stderr)
+      return None
+    if limit_n <= 0 or seconds_n <= 0:
+      return None
+    return cls(name, limit_n, seconds_n, algorithm, burst)
+
+  @property
+  def rate(self) -> float:
+    return self.limit / self.seconds
+
+
+def _window_decision(now: float, window: float, limit: float, cost: float, cur: float, prev: float) -> Tuple[bool, float, float]:
+  """
+  Sliding-window estimate from the current and previous fixed-window counts.
+  Returns (allowed, remaining, retry_after_seconds) as if the hit were taken when allowed.
+  """
+  window_start = (now // window) * window
+  weight = 1.0 - (now - window_start) / window
+  estimate = prev * weight + cur
+  if estimate + cost <= limit:
+    return True, max(0.0, limit - estimate - cost), 0.0
+  headroom = limit - cost - cur
+  if headroom >= 0 and prev > 0:
+    retry_at = window_start + window * (1.0 - headroom / prev)
+  else:
+    # Not even this window's own hits fit: wait until they have decayed far enough in the next window
+    retry_at = window_start + window + window * max(0.0, 1.0 - (limit - cost) / cur if cur else 0.0)
+  return False, 0.0, max(0.001, retry_at - now)
+
+
+def _bucket_decision(tokens: float, rate: float, cost: float) -> Tuple[bool, float, float]:
+  if tokens >= cost:
+    return True, tokens - cost, 0.0
+  return False, tokens, max(0.001, (cost - tokens) / rate)
+
+
+class _MemoryRateLimitStore:
+  """
+  Per-process store (RATE_LIMIT_BACKEND=memory, and the fallback when the shared store fails).
+  """
+  name = "memory"
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._windows: Dict[str, Tuple[float, float, float]] = {}  # key -> (window_start, cur, prev)
+    self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+    self._last_purge = time.time()
+
+  def _purge(self, now: float) -> None:
+    if now - self._last_purge < 60:
+      return
+    self._last_purge = now
+    self._windows = {k: v for k, v in self._windows.items() if v[0] > now - 86400 * 2}
+    self._buckets = {k: v for k, v in self._buckets.items() if v[1] > now - 86400}
+
+  def window_hit(self, key: str, limit: float, window: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    window_start = (now // window) * window
+    with self._lock:
+      self._purge(now)
+      start, cur, prev = self._windows.get(key, (window_start, 0.0, 0.0))
+      if start != window_start:
+        cur, prev = 0.0, (cur if start == window_start - window else 0.0)
+      decision = _window_decision(now, window, limit, cost, cur, prev)
+      self._windows[key] = (window_start, cur + cost if decision[0] else cur, prev)
+      return decision
+
+  def bucket_take(self, key: str, rate: float, burst: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    with self._lock:
+      self._purge(now)
+      tokens, updated = self._buckets.get(key, (burst, now))
+      tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+      decision = _bucket_decision(tokens, rate, cost)
+      self._buckets[key] = (decision[1], now)
+      return decision
+
+  def release_many(self, policy: "_RateLimit", keys: list, cost: float, now: float) -> None:
+    with self._lock:
+      for key in keys:
+        if policy.algorithm == "token_bucket":
+          if key in self._buckets:
+            tokens, updated = self._buckets[key]
+            tokens = min(policy.burst, tokens + max(0.0, now - updated) * policy.rate + cost)
+            self._buckets[key] = (tokens, now)
+        elif key in self._windows:
+          start, cur, prev = self._windows[key]
+          self._windows[key] = (start, max(0.0, cur - cost), prev)
+
+
+_RATE_LIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_windows (
+  key TEXT NOT NULL,
+  window_start REAL NOT NULL,
+  count REAL NOT NULL,
+  expires_at REAL NOT NULL,
+  PRIMARY KEY (key, window_start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rate_buckets (
+  key TEXT PRIMARY KEY,
+  tokens REAL NOT NULL,
+  updated_at REAL NOT NULL,
+  expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rate_windows_expires_idx ON rate_windows (expires_at);
+CREATE INDEX IF NOT EXISTS rate_buckets_expires_idx ON rate_buckets (expires_at);
+"""
+
+
+class _SQLiteRateLimitStore:
+  """
+  Host-wide store in a SQLite file (WAL). Each decision is one BEGIN IMMEDIATE transaction, so concurrent
+  workers serialize on the file lock and never both take the last token. One connection per thread.
+  """
+  name = "sqlite"
+
+  def __init__(self, path: str):
+    self.path = path
+    self._local = threading.local()
+    self._init_lock = threading.Lock()
+    self._initialized = False
+    self._last_purge = 0.0
+
+  def _conn(self) -> sqlite3.Connection:
+    conn = getattr(self._local, "conn", None)
+    if conn is None or getattr(self._local, "pid", None) != os.getpid():
+      conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+      conn.execute("PRAGMA busy_timeout=5000")
+      if not self._initialized:
+        with self._init_lock:
+          if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_RATE_LIMIT_SCHEMA)
+            self._initialized = True
+      conn.execute("PRAGMA synchronous=NORMAL")
+      self._local.conn, self._local.pid = conn, os.getpid()
+    return conn
+
+  def _transaction(self, fn):
+    conn = self._conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+      result = fn(conn)
+      conn.execute("COMMIT")
+      return result
+    except Exception:
+      conn.execute("ROLLBACK")
+      raise
+
+  def _purge(self, conn: sqlite3.Connection, now: float) -> None:
+    if now - self._last_purge < 60:
+      return
+    self._last_purge = now
+    conn.execute("DELETE FROM rate_windows WHERE expires_at < ?", (now,))
+    conn.execute("DELETE FROM rate_buckets WHERE expires_at < ?", (now,))
+
+  def _window_hit(self, conn: sqlite3.Connection, key: str, limit: float, window: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    window_start = (now // window) * window
+    counts = dict(conn.execute(
+      "SELECT window_start, count FROM rate_windows WHERE key = ? AND window_start IN (?, ?)",
+      (key, window_start, window_start - window),
+    ).fetchall())
+    decision = _window_decision(now, window, limit, cost, counts.get(window_start, 0.0), counts.get(window_start - window, 0.0))
+    if decision[0]:
+      conn.execute(
+        "INSERT INTO rate_windows (key, window_start, count, expires_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (key, window_start) DO UPDATE SET count = count + excluded.count",
+        (key, window_start, cost, window_start + 2 * window),
+      )
+    return decision
+
+  def _bucket_take(self, conn: sqlite3.Connection, key: str, rate: float, burst: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+    tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+    decision = _bucket_decision(tokens, rate, cost)
+    conn.execute(
+      "INSERT INTO rate_buckets (key, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?) "
+      "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+      (key, decision[1], now, now + burst / rate + 1),
+    )
+    return decision
+
+  def window_hit(self, key: str, limit: float, window: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    return self.decide_many(_RateLimit("", limit, window), [key], cost, now)[0]
+
+  def bucket_take(self, key: str, rate: float, burst: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    return self.decide_many(_RateLimit("", rate, 1, "token_bucket", burst), [key], cost, now)[0]
+
+  def decide_many(self, policy: "_RateLimit", keys: list, cost: float, now: float) -> list:
+    """
+    Decisions for several keys of one policy in a single transaction.
+    """
+    def _decide_all(conn):
+      self._purge(conn, now)
+      if policy.algorithm == "token_bucket":
+        return [self._bucket_take(conn, k, policy.rate, policy.burst, cost, now) for k in keys]
+      return [self._window_hit(conn, k, policy.limit, policy.seconds, cost, now) for k in keys]
+    return self._transaction(_decide_all)
+
+  def release_many(self, policy: "_RateLimit", keys: list, cost: float, now: float) -> None:
+    """
+    Gives back hits taken by decide_many: tokens return to the bucket, or the latest window's count drops.
+    """
+    def _release_all(conn):
+      for key in keys:
+        if policy.algorithm == "token_bucket":
+          conn.execute(
+            "UPDATE rate_buckets SET tokens = MIN(?, tokens + MAX(0, ? - updated_at) * ? + ?), updated_at = ? WHERE key = ?",
+            (policy.burst, now, policy.rate, cost, now, key),
+          )
+        else:
+          conn.execute(
+            "UPDATE rate_windows SET count = MAX(0, count - ?) "
+            "WHERE key = ? AND window_start = (SELECT MAX(window_start) FROM rate_windows WHERE key = ?)",
+            (cost, key, key),
+          )
+    self._transaction(_release_all)
+
+
+class _RedisRateLimitStore:
+  """
+  Store shared by every node, with each decision made atomically by a Lua script.
+  """
+  name = "redis"
+  _WINDOW_LUA = """
+local now, window, limit, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local ws = math.floor(now / window) * window
+local cur_key = KEYS[1] .. ':' .. string.format('%d', ws)
+local cur = tonumber(redis.call('GET', cur_key) or '0')
+local prev = tonumber(redis.call('GET', KEYS[1] .. ':' .. string.format('%d', ws - window)) or '0')
+if prev * (1 - (now - ws) / window) + cur + cost > limit then
+  return {0, tostring(cur), tostring(prev)}
+end
+redis.call('INCRBYFLOAT', cur_key, cost)
+redis.call('EXPIRE', cur_key, math.ceil(window * 2))
+return {1, tostring(cur), tostring(prev)}
+"""
+  _BUCKET_LUA = """
+local now, rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+  _RELEASE_LUA = """
+local now, window, rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+if rate > 0 then
+  local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+  if not state[1] then
+    return 0
+  end
+  local tokens = math.min(burst, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate + cost)
+  redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+  return 1
+end
+local ws = math.floor(now / window) * window
+for _, start in ipairs({ws, ws - window}) do
+  local key = KEYS[1] .. ':' .. string.format('%d', start)
+  local count = tonumber(redis.call('GET', key) or '0')
+  if count > 0 then
+    redis.call('INCRBYFLOAT', key, -math.min(count, cost))
+    return 1
+  end
+end
+return 0
+"""
+
+  def __init__(self, url: str):
+    self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    self._window = self.client.register_script(self._WINDOW_LUA)
+    self._bucket = self.client.register_script(self._BUCKET_LUA)
+    self._release = self.client.register_script(self._RELEASE_LUA)
+
+  @staticmethod
+  def _window_result(reply, limit: float, window: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    allowed, cur, prev = reply
+    # The script's verdict wins; the Python decision only supplies remaining / retry_after
+    _, remaining, retry_after = _window_decision(now, window, limit, cost, float(cur), float(prev))
+    return (True, remaining, 0.0) if allowed else (False, 0.0, max(0.001, retry_after))
+
+  @staticmethod
+  def _bucket_result(reply, rate: float, cost: float) -> Tuple[bool, float, float]:
+    allowed, tokens = reply
+    tokens = float(tokens)
+    return (True, tokens, 0.0) if allowed else (False, tokens, max(0.001, (cost - tokens) / rate))
+
+  def window_hit(self, key: str, limit: float, window: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    reply = self._window(keys=[f"rl:w:{key}"], args=[now, window, limit, cost])
+    return self._window_result(reply, limit, window, cost, now)
+
+  def bucket_take(self, key: str, rate: float, burst: float, cost: float, now: float) -> Tuple[bool, float, float]:
+    reply = self._bucket(keys=[f"rl:b:{key}"], args=[now, rate, burst, cost])
+    return self._bucket_result(reply, rate, cost)
+
+  def decide_many(self, policy: "_RateLimit", keys: list, cost: float, now: float) -> list:
+    """
+    Decisions for several keys of one policy in one pipelined round trip.
+    """
+    pipe = self.client.pipeline(transaction=False)
+    bucket = policy.algorithm == "token_bucket"
+    for key in keys:
+      if bucket:
+        self._bucket(keys=[f"rl:b:{key}"], args=[now, policy.rate, policy.burst, cost], client=pipe)
+      else:
+        self._window(keys=[f"rl:w:{key}"], args=[now, policy.seconds, policy.limit, cost], client=pipe)
+    replies = pipe.execute()
+    if bucket:
+      return [self._bucket_result(r, policy.rate, cost) for r in replies]
+    return [self._window_result(r, policy.limit, policy.seconds, cost, now) for r in replies]
+
+  def release_many(self, policy: "_RateLimit", keys: list, cost: float, now: float) -> None:
+    pipe = self.client.pipeline(transaction=False)
+    bucket = policy.algorithm == "token_bucket"
+    for key in keys:
+      self._release(keys=[f"rl:b:{key}" if bucket else f"rl:w:{key}"],
+                    args=[now, policy.seconds, policy.rate if bucket else 0, policy.burst, cost], client=pipe)
+    pipe.execute()
+
+
+class _RateLimiter:
+  """
+  Applies policies against the shared store, with an in-process cache of keys known to be blocked.
+  If the shared store fails, decisions fall back to process memory (fail open to per-worker limits).
+  """
+  def __init__(self, store):
+    self.pid = os.getpid()
+    self.store = store
+    self.fallback = store if isinstance(store, _MemoryRateLimitStore) else _MemoryRateLimitStore()
+    self._blocked = _TTLCache(maxsize=10000, ttl=86400)
+    self._stats_lock = threading.Lock()
+    self.counters: Dict[str, Dict[str, int]] = {}
+    self._last_error_log = 0.0
+
+  def _count(self, name: str, outcome: str) -> None:
+    with self._stats_lock:
+      c = self.counters.setdefault(name, {"allowed": 0, "rejected": 0, "rejected_in_memory": 0, "store_errors": 0})
+      c[outcome] += 1
+
+  def hit(self, policy: _RateLimit, key: str, cost: float = 1.0) -> Tuple[bool, float, float]:
+    """
+    Takes cost from policy's allowance for key. Returns (allowed, remaining, retry_after_seconds).
+    """
+    return self.hit_many(policy, [key], cost)[0]
+
+  def hit_many(self, policy: _RateLimit, keys: list, cost: float = 1.0) -> list:
+    """
+    hit() for several keys of one policy, in one store round trip. Returns decisions in keys order.
+    """
+    now = time.time()
+    full_keys = [f"{policy.name}:{k}" for k in keys]
+    decisions: list = [None] * len(keys)
+    pending = []
+    for i, fk in enumerate(full_keys):
+      blocked_until = self._blocked.get(fk)
+      if blocked_until and blocked_until > now:
+        self._count(policy.name, "rejected_in_memory")
+        decisions[i] = (False, 0.0, blocked_until - now)
+      else:
+        pending.append(i)
+    if not pending:
+      return decisions
+    pending_keys = [full_keys[i] for i in pending]
+    try:
+      results = self._decide_many(self.store, policy, pending_keys, cost, now)
+    except Exception as e:
+      self._count(policy.name, "store_errors")
+      if now - self._last_error_log > 60:
+        self._last_error_log = now
+        print(f"WARNING: rate limit store ({self.store.name}) failed, using per-worker limits: {e}", file=sys.stderr)
+      results = self._decide_many(self.fallback, policy, pending_keys, cost, now)
+    for i, decision in zip(pending, results):
+      decisions[i] = decision
+      if decision[0]:
+        self._count(policy.name, "allowed")
+      else:
+        self._count(policy.name, "rejected")
+        if cost <= 1:
+          # A larger request being refused says nothing about when a single hit would fit again
+          self._blocked.set(full_keys[i], now + decision[2], ttl=decision[2])
+    return decisions
+
+  def refund(self, policy: _RateLimit, keys: list, cost: float = 1.0) -> None:
+    """
+    Gives back allowance taken by hit()/hit_many() for work that did not happen (e.g. a failed insert or
+    send), so it does not count against the caller's next attempt.
+    """
+    now = time.time()
+    full_keys = [f"{policy.name}:{k}" for k in keys]
+    for fk in full_keys:
+      self._blocked.pop(fk)
+    try:
+      self.store.release_many(policy, full_keys, cost, now)
+    except Exception as e:
+      self._count(policy.name, "store_errors")
+      print(f"WARNING: rate limit store ({self.store.name}) failed to refund {policy.name}: {e}", file=sys.stderr)
+      self.fallback.release_many(policy, full_keys, cost, now)
+
+  @classmethod
+  def _decide_many(cls, store, policy: _RateLimit, keys: list, cost: float, now: float) -> list:
+    decide_many = getattr(store, "decide_many", None)
+    if decide_many is not None:
+      return decide_many(policy, keys, cost, now)
+    return [cls._decide(store, policy, k, cost, now) for k in keys]
+
+  @staticmethod
+  def _decide(store, policy: _RateLimit, key: str, cost: float, now: float) -> Tuple[bool, float, float]:
+    if policy.algorithm == "token_bucket":
+      return store.bucket_take(key, policy.rate, policy.burst, cost, now)
+    return store.window_hit(key, policy.limit, policy.seconds, cost, now)
+
+  def stats(self) -> dict:
+    with self._stats_lock:
+      counters = {k: dict(v) for k, v in self.counters.items()}
+    return {"enabled": RATE_LIMIT_ENABLED, "backend": self.store.name, "pid": self.pid, "policies": counters}
+
+
+_rate_limiter: Optional[_RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def _get_rate_limiter() -> _RateLimiter:
+  global _rate_limiter
+  if _rate_limiter is None or _rate_limiter.pid != os.getpid():
+    with _rate_limiter_lock:
+      if _rate_limiter is None or _rate_limiter.pid != os.getpid():
+        store = None
+        try:
+          if RATE_LIMIT_BACKEND == "redis":
+            if redis is None or not RATE_LIMIT_REDIS_URL:
+              raise RuntimeError("redis package or RATE_LIMIT_REDIS_URL missing")
+            store = _RedisRateLimitStore(RATE_LIMIT_REDIS_URL)
+          elif RATE_LIMIT_BACKEND == "sqlite":
+            store = _SQLiteRateLimitStore(RATE_LIMIT_DB_PATH)
+        except Exception as e:
+          print(f"WARNING: rate limit backend '{RATE_LIMIT_BACKEND}' unavailable ({e}); using per-worker memory.", file=sys.stderr)
+        _rate_limiter = _RateLimiter(store or _MemoryRateLimitStore())
+  return _rate_limiter
+
+
+def _client_ip() -> str:
+  """
+  Client address for per-IP limits: the entry RATE_LIMIT_TRUSTED_PROXIES hops from the end of
+  X-Forwarded-For (entries before it are client-supplied and can be forged), else the socket peer.
+  """
+  forwarded = [p.strip() for p in (request.headers.get("X-Forwarded-For") or "").split(",") if p.strip()]
+  if RATE_LIMIT_TRUSTED_PROXIES > 0 and forwarded:
+    return forwarded[-min(RATE_LIMIT_TRUSTED_PROXIES, len(forwarded))]
+  return request.remote_addr or "unknown"
+
+
+def _rate_limited_response(retry_after: float, message: str):
+  seconds = max(1, int(retry_after + 0.999))
+  resp = jsonify({
+    "message": message,
+    "retry_after_seconds": seconds,
+    "next_allowed_at": (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat(),
+  })
+  resp.headers["Retry-After"] = str(seconds)
+  return resp, 429
+
+
+def rate_limit(name: str, spec: Optional[str], key=None, algorithm: str = "sliding_window", burst: Optional[float] = None,
+               message: str = "Too many requests. Please try again later."):
+  """
+  Route decorator applying the policy `spec` ("limit/seconds") per key; 429 with Retry-After when exceeded.
+  key: callable returning the key for the current request (default: client IP); None skips the check.
+  Put it below @require_auth to key on request._auth.
+  """
+  policy = _RateLimit.parse(name, spec, algorithm, burst)
+
+  def decorator(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+      if policy is None or not RATE_LIMIT_ENABLED:
+        return fn(*args, **kwargs)
+      k = key() if key else _client_ip()
+      if k is None:
+        return fn(*args, **kwargs)
+      allowed, _, retry_after = _get_rate_limiter().hit(policy, str(k))
+      if not allowed:
+        return _rate_limited_response(retry_after, message)
+      return fn(*args, **kwargs)
+    return wrapper
+  return decorator
+
+
+_invites_per_sender_policy = _RateLimit.parse("invites_per_sender", RATE_LIMIT_INVITES_PER_SENDER)
+_invite_cooldown_policy = (
+  _RateLimit("invite_cooldown", 1, INVITE_COOLDOWN_SECONDS, "token_bucket", burst=1) if INVITE_COOLDOWN_SECONDS > 0 else None
+)
+_maileroo_send_policy = _RateLimit("maileroo_send", MAILEROO_RATE_LIMIT_PER_SECOND, 1, "token_bucket", burst=MAILEROO_RATE_LIMIT_BURST)
+_maileroo_daily_policy = _RateLimit("maileroo_daily", MAILEROO_DAILY_BUDGET, 86400) if MAILEROO_DAILY_BUDGET > 0 else None
+
+
+def _invite_cooldown(sender_id: str, recipient: str, company_id: str) -> Tuple[bool, float]:
+  """
+  Cooldown between identical invitations (same sender, recipient and company): (allowed, retry_after).
+  """
+  return _invite_cooldowns(sender_id, [recipient], company_id)[0]
+
+
+def _invite_cooldowns(sender_id: str, recipients: list, company_id: str) -> list:
+  """
+  _invite_cooldown for many recipients in one store round trip: [(allowed, retry_after), ...] in order.
+  """
+  if _invite_cooldown_policy is None or not RATE_LIMIT_ENABLED:
+    return [(True, 0.0)] * len(recipients)
+  keys = [f"{sender_id}:{r}:{company_id}" for r in recipients]
+  return [(allowed, retry_after) for allowed, _, retry_after in _get_rate_limiter().hit_many(_invite_cooldown_policy, keys)]
+
+
+def _release_invite_cooldowns(sender_id: str, recipients: list, company_id: str) -> None:
+  """
+  Ends the cooldowns _invite_cooldowns started for invitations that were not recorded after all.
+  """
+  if _invite_cooldown_policy is None or not RATE_LIMIT_ENABLED or not recipients:
+    return
+  _get_rate_limiter().refund(_invite_cooldown_policy, [f"{sender_id}:{r}:{company_id}" for r in recipients])
+
+
+def _charge_invites_per_sender(sender_id: str, count: int) -> Tuple[bool, float]:
+  """
+  Takes `count` invitations from the sender's RATE_LIMIT_INVITES_PER_SENDER budget: (allowed, retry_after).
+  """
+  if _invites_per_sender_policy is None or not RATE_LIMIT_ENABLED or count <= 0:
+    return True, 0.0
+  allowed, _, retry_after = _get_rate_limiter().hit(_invites_per_sender_policy, sender_id, cost=count)
+  return allowed, retry_after
+
+
+def _refund_invites_per_sender(sender_id: str, count: int) -> None:
+  if _invites_per_sender_policy is None or not RATE_LIMIT_ENABLED or count <= 0:
+    return
+  _get_rate_limiter().refund(_invites_per_sender_policy, [sender_id], cost=count)
+
+
+def _acquire_maileroo_send_slot() -> None:
+  """
+  Blocks until the Maileroo send budget allows one more request: host-wide with
+  MAILEROO_RATE_LIMIT_SCOPE=host, otherwise (or if the limiter is off) this worker's own token bucket.
+  """
+  if MAILEROO_RATE_LIMIT_SCOPE != "host" or not RATE_LIMIT_ENABLED:
+    _maileroo_rate_limiter.acquire()
+    return
+  limiter = _get_rate_limiter()
+  waited = 0.0
+  while True:
+    allowed, _, retry_after = limiter.hit(_maileroo_send_policy, "all")
+    if allowed:
+      break
+    time.sleep(retry_after)
+    waited += retry_after
+  _maileroo_rate_limiter.waited_seconds += waited
+
+
+def _maileroo_budget_allows() -> bool:
+  """
+  Counts one message against MAILEROO_DAILY_BUDGET; False once the rolling 24h budget is spent.
+  """
+  if _maileroo_daily_policy is None or not RATE_LIMIT_ENABLED:
+    return True
+  allowed, _, retry_after = _get_rate_limiter().hit(_maileroo_daily_policy, "all")
+  if not allowed:
+    print(f"ERROR: Maileroo daily budget ({MAILEROO_DAILY_BUDGET}) exhausted; next send possible in {retry_after:.0f}s.", file=sys.stderr)
+  return allowed
+
+
+def _refund_maileroo_budget() -> None:
+  """
+  Gives back the message _maileroo_budget_allows counted when Maileroo did not accept it.
+  """
+  if _maileroo_daily_policy is None or not RATE_LIMIT_ENABLED:
+    return
+  _get_rate_limiter().refund(_maileroo_daily_policy, ["all"])
+
+
+# -----------------------------------------------------------------------------
+# Routes
+# -----------------------------------------------------------------------------
+@app.get("/api/health")
+def health():
+  return jsonify({"ok": True, "service": "dayclap-backend"}), 200
+
+
+@app.post("/api/subscribe-push")
+@require_auth
+def subscribe_push():
+  """
+  Save a push subscription for the authenticated user.
+  Body: Web Push subscription JSON
+  Behavior: registers the device in push_subscriptions (one row per endpoint, so every device of the user
+  keeps receiving pushes), mirrors it to profiles.push_subscription and sets notifications.push = true
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase client not configured"}), 500
+
+  body = request.get_json(force=True, silent=True) or {}
+  uid = request._auth["id"]
+  if not _valid_push_subscription(body):
+    return jsonify({"message": "A Web Push subscription with endpoint and keys (p256dh, auth) is required"}), 400
+
+  try:
+    _register_push_subscription(uid, body, request.headers.get("User-Agent"))
+  except Exception as e:
+    print(f"subscribe_push registry error: {e}", file=sys.stderr)
+
+  updates = {
+    "push_subscription": body,
+    "last_activity_at": _utcnow_iso(),
+  }
+
+  profile = fetch_profile(uid, ("notifications",))
+  if profile and isinstance(profile.get("notifications"), dict):
+    notif = dict(profile.get("notifications") or {})
+    notif["push"] = True
+    updates["notifications"] = notif
+
+  try:
+    supabase.table("profiles").update(updates).eq("id", uid).execute()
+    _invalidate_profile(uid)
+    return jsonify({"message": "Subscription saved"}), 200
+  except Exception as e:
+    print(f"subscribe_push update error: {e}", file=sys.stderr)
+    return jsonify({"message": "Subscription accepted"}), 200
+
+
+@app.post("/api/unsubscribe-push")
+@require_auth
+def unsubscribe_push():
+  """
+  Remove a push subscription for the authenticated user.
+  Body: { endpoint?: string }
+  Behavior: with endpoint, unregisters that device only; without, unregisters all of the user's devices.
+  profiles.push_subscription is cleared if it was a removed device, and notifications.push = false once
+  no device is left (best-effort)
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase client not configured"}), 500
+
+  body = request.get_json(force=True, silent=True) or {}
+  endpoint = body.get("endpoint") if isinstance(body.get("endpoint"), str) else None
+  uid = request._auth["id"]
+
+  remaining = 0
+  try:
+    query = supabase.table("push_subscriptions").delete().eq("user_id", uid)
+    if endpoint:
+      query = query.eq("endpoint", endpoint)
+    query.execute()
+    if endpoint:
+      remaining = len(supabase.table("push_subscriptions").select("endpoint").eq("user_id", uid).limit(1).execute().data or [])
+  except Exception as e:
+    print(f"unsubscribe_push registry error: {e}", file=sys.stderr)
+
+  updates = {"last_activity_at": _utcnow_iso()}
+  profile = fetch_profile(uid, ("notifications", "push_subscription"))
+  current = (profile or {}).get("push_subscription")
+  if not endpoint or not isinstance(current, dict) or current.get("endpoint") == endpoint:
+    updates["push_subscription"] = None
+
+  if not remaining and profile and isinstance(profile.get("notifications"), dict):
+    notif = dict(profile.get("notifications") or {})
+    notif["push"] = False
+    updates["notifications"] = notif
+
+  try:
+    supabase.table("profiles").update(updates).eq("id", uid).execute()
+    _invalidate_profile(uid)
+    return jsonify({"message": "Subscription disabled"}), 200
+  except Exception as e:
+    print(f"unsubscribe_push update error: {e}", file=sys.stderr)
+    return jsonify({"message": "Subscription disabled"}), 500
+
+
+@app.post("/api/send-invitation")
+@require_auth
+def send_invitation():
+  """
+  Sends (records) an invitation to join a company.
+  Security:
+    - Requires Authorization: Bearer <token>
+    - Derives sender_id and sender_email from token (ignores any spoofed fields)
+    - Verifies that the sender has role owner/admin for company_id
+  Body JSON:
+    {
+      "recipient_email": "member@example.com",   (required)
+      "company_id": "uuid-or-string",           (required)
+      "company_name": "Company Name",           (required)
+      "role": "user" | "admin"                  (optional, defaults to "user")
+    }
+  Cooldown:
+    - Enforces a cooldown between identical invitations (same sender, recipient, and company).
+    - Duration is configured via INVITE_COOLDOWN_SECONDS (default: 300).
+    - Returns 429 with Retry-After header and JSON body if within cooldown.
+    - Each sender is also limited to RATE_LIMIT_INVITES_PER_SENDER invitations overall.
+    - Only requests that pass validation and the role check count; both are given back if the insert fails.
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase client not configured"}), 500
+
+  body = request.get_json(force=True, silent=True) or {}
+  recipient = (body.get("recipient_email") or "").strip().lower()
+  company_id = str(body.get("company_id") or "").strip()
   company_name = (body.get("company_name") or "").strip()
   role = (body.get("role") or "user").strip().lower()
   if role not in ("user", "admin"):
     role = "user"
 
-  if not recipient or not company_id or not company_name:
-    return jsonify({"message": "recipient_email, company_id and company_name are required"}), 400
+  if not recipient or not company_id or not company_name:
+    return jsonify({"message": "recipient_email, company_id and company_name are required"}), 400
+
+  sender_id = request._auth["id"]
+  sender_email = request._auth["email"]
+
+  profile = fetch_profile(sender_id, ("companies",))
+  sender_role = user_role_for_company(profile or {}, company_id)
+  if not is_owner_or_admin(sender_role):
+    return jsonify({"message": "Forbidden: only owner/admin can send invitations for this company"}), 403
+
+  # Cooldown for duplicate invitations (same sender -> recipient for same company), kept by the rate limiter
+  allowed, retry_after = _invite_cooldown(sender_id, recipient, company_id)
+  if not allowed:
+    return _rate_limited_response(retry_after, "Please wait before sending another invite to this person for this company.")
+  allowed, retry_after = _charge_invites_per_sender(sender_id, 1)
+  if not allowed:
+    _release_invite_cooldowns(sender_id, [recipient], company_id)
+    return _rate_limited_response(retry_after, "Too many invitations sent. Please try again later.")
+
+  payload = {
+    "sender_id": sender_id,
+    "sender_email": sender_email,
+    "recipient_email": recipient,
+    "company_id": company_id,
+    "company_name": company_name,
+    "role": role,
+    "status": "pending",
+  }
+
+  try:
+    insert_resp = supabase.table("invitations").insert(payload).execute()
+  except Exception as e:
+    print(f"send_invitation insert error: {e}", file=sys.stderr)
+    # Nothing was recorded: don't hold the failure against a retry
+    _release_invite_cooldowns(sender_id, [recipient], company_id)
+    _refund_invites_per_sender(sender_id, 1)
+    return jsonify({"message": "Failed to send invitation"}), 500
+
+  try:
+    inserted = getattr(insert_resp, "data", None) or []
+    invitation_id = inserted[0].get("id") if isinstance(inserted, list) and inserted and isinstance(inserted[0], dict) else None
+
+    # Queue invitation email (delivered by the outbox workers)
+    template = _get_email_template("invitation_to_company")
+    if template:
+      context = {
+        "sender_email": sender_email,
+        "company_name": company_name,
+        "role": role.capitalize(),
+        "current_year": datetime.now().year,
+        "frontend_url": VITE_FRONTEND_URL,
+      }
+      rendered_subject, rendered_html = _render_email_template(template, context)
+      dedup_key = f"invitation:{invitation_id}" if invitation_id else _outbox_dedup_key(
+        "invitation", sender_id, recipient, company_id, window_seconds=INVITE_COOLDOWN_SECONDS or None
+      )
+      _queue_email("invitation", recipient, rendered_subject, rendered_html, sender_email, dedup_key=dedup_key)
+    else:
+      print("Warning: 'invitation_to_company' email template not found.", file=sys.stderr)
+
+    return jsonify({
+      "message": "Invitation sent",
+      "cooldown_seconds": INVITE_COOLDOWN_SECONDS
+    }), 202
+  except Exception as e:
+    print(f"send_invitation email error: {e}", file=sys.stderr)
+    return jsonify({"message": "Failed to send invitation"}), 500
+
+
+_EMAIL_ADDRESS_RE = re.compile(r"^[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+$")
+
+
+@app.post("/api/send-invitations")
+@require_auth
+def send_invitations_bulk():
+  """
+  Sends (records) invitations to join a company for many recipients in one call.
+  Security: same as /api/send-invitation (sender taken from the token, must be owner/admin of company_id),
+  checked once for the whole batch.
+  Body JSON:
+    {
+      "company_id": "uuid-or-string",           (required)
+      "company_name": "Company Name",           (required)
+      "role": "user" | "admin",                 (optional default for all recipients, defaults to "user")
+      "recipients": ["a@example.com", {"email": "b@example.com", "role": "admin"}, ...]
+                                                (required, at most BULK_INVITE_MAX_RECIPIENTS)
+    }
+  Response "results" has one entry per recipient, in request order, with a status of:
+    - invited: row inserted (invitation_id); "delivery" is queued, sent, failed or no_template
+    - cooldown: same per-recipient cooldown as the single endpoint (retry_after_seconds)
+    - invalid / duplicate: not an email address / repeated earlier in the list
+    - failed: the insert failed
+  The invitations to be recorded (not invalid, duplicate or cooling down) count against the sender's
+  RATE_LIMIT_INVITES_PER_SENDER budget as a whole (429 if they do not fit); a failed insert gives back both
+  that charge and the recipients' cooldowns.
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase client not configured"}), 500
+
+  body = request.get_json(force=True, silent=True) or {}
+  company_id = str(body.get("company_id") or "").strip()
+  company_name = (body.get("company_name") or "").strip()
+  default_role = (body.get("role") or "user").strip().lower()
+  raw_recipients = body.get("recipients")
+
+  if not company_id or not company_name or not isinstance(raw_recipients, list) or not raw_recipients:
+    return jsonify({"message": "recipients (non-empty list), company_id and company_name are required"}), 400
+  if len(raw_recipients) > BULK_INVITE_MAX_RECIPIENTS:
+    return jsonify({"message": f"At most {BULK_INVITE_MAX_RECIPIENTS} recipients per request"}), 400
+
+  sender_id = request._auth["id"]
+  sender_email = request._auth["email"]
+
+  profile = fetch_profile(sender_id, ("companies",))
+  sender_role = user_role_for_company(profile or {}, company_id)
+  if not is_owner_or_admin(sender_role):
+    return jsonify({"message": "Forbidden: only owner/admin can send invitations for this company"}), 403
+
+  results = []
+  candidates = []  # (index into results, email, role)
+  seen = set()
+  for item in raw_recipients:
+    if isinstance(item, dict):
+      email, role = item.get("email") or item.get("recipient_email"), item.get("role") or default_role
+    else:
+      email, role = item, default_role
+    email = str(email or "").strip().lower()
+    role = str(role).strip().lower()
+    if role not in ("user", "admin"):
+      role = "user"
+    result = {"email": email, "role": role}
+    if not _EMAIL_ADDRESS_RE.match(email):
+      result["status"] = "invalid"
+    elif email in seen:
+      result["status"] = "duplicate"
+    else:
+      seen.add(email)
+      candidates.append((len(results), email, role))
+    results.append(result)
+
+  # Cooldowns for every candidate in one limiter round trip
+  to_invite = []
+  cooldowns = _invite_cooldowns(sender_id, [email for _, email, _ in candidates], company_id)
+  for (idx, email, role), (allowed, retry_after) in zip(candidates, cooldowns):
+    if allowed:
+      to_invite.append((idx, email, role))
+    else:
+      results[idx].update(status="cooldown", retry_after_seconds=max(1, int(retry_after + 0.999)))
+  invite_emails = [email for _, email, _ in to_invite]
+
+  # Only the invitations about to be recorded count against the sender's budget
+  if _invites_per_sender_policy is not None and RATE_LIMIT_ENABLED and len(to_invite) > _invites_per_sender_policy.limit:
+    _release_invite_cooldowns(sender_id, invite_emails, company_id)
+    return jsonify({"message": f"At most {int(_invites_per_sender_policy.limit)} invitations per {int(_invites_per_sender_policy.seconds)}s"}), 400
+  allowed, retry_after = _charge_invites_per_sender(sender_id, len(to_invite))
+  if not allowed:
+    _release_invite_cooldowns(sender_id, invite_emails, company_id)
+    return _rate_limited_response(retry_after, "Too many invitations sent. Please try again later.")
+
+  if to_invite:
+    rows = [{
+      "sender_id": sender_id,
+      "sender_email": sender_email,
+      "recipient_email": email,
+      "company_id": company_id,
+      "company_name": company_name,
+      "role": role,
+      "status": "pending",
+    } for _, email, role in to_invite]
+    try:
+      insert_resp = supabase.table("invitations").insert(rows).execute()
+      inserted = getattr(insert_resp, "data", None) or []
+    except Exception as e:
+      print(f"send_invitations_bulk insert error: {e}", file=sys.stderr)
+      # Nothing was recorded: don't hold the failure against a retry
+      _release_invite_cooldowns(sender_id, invite_emails, company_id)
+      _refund_invites_per_sender(sender_id, len(to_invite))
+      for idx, _, _ in to_invite:
+        results[idx]["status"] = "failed"
+      return jsonify({"message": "Failed to send invitations", "results": results}), 500
+    ids_by_email = {r.get("recipient_email"): r.get("id") for r in inserted if isinstance(r, dict)}
+
+    # The only per-recipient variable in the template context is the role: render once per role
+    template = _get_email_template("invitation_to_company")
+    if not template:
+      print("Warning: 'invitation_to_company' email template not found.", file=sys.stderr)
+    rendered: Dict[str, Tuple[str, str]] = {}
+    messages, message_indexes = [], []
+    for idx, email, role in to_invite:
+      invitation_id = ids_by_email.get(email)
+      results[idx].update(status="invited", invitation_id=invitation_id)
+      if not template:
+        results[idx]["delivery"] = "no_template"
+        continue
+      if role not in rendered:
+        rendered[role] = _render_email_template(template, {
+          "sender_email": sender_email,
+          "company_name": company_name,
+          "role": role.capitalize(),
+          "current_year": datetime.now().year,
+          "frontend_url": VITE_FRONTEND_URL,
+        })
+      rendered_subject, rendered_html = rendered[role]
+      messages.append({
+        "to": email,
+        "subject": rendered_subject,
+        "html": rendered_html,
+        "sender": sender_email,
+        "dedup_key": f"invitation:{invitation_id}" if invitation_id else _outbox_dedup_key(
+          "invitation", sender_id, email, company_id, window_seconds=INVITE_COOLDOWN_SECONDS or None
+        ),
+      })
+      message_indexes.append(idx)
+    for idx, delivery in zip(message_indexes, _queue_emails("invitation", messages)):
+      results[idx]["delivery"] = delivery
+
+  summary: Dict[str, int] = {}
+  for r in results:
+    summary[r["status"]] = summary.get(r["status"], 0) + 1
+  invited = summary.get("invited", 0)
+  return jsonify({
+    "message": f"{invited} invitation(s) sent",
+    "results": results,
+    "summary": summary,
+    "cooldown_seconds": INVITE_COOLDOWN_SECONDS,
+  }), 202 if invited else 200
+
+
+def _notify_task_recipient_key() -> Optional[str]:
+  body = request.get_json(force=True, silent=True) or {}
+  return (body.get("assigned_to_email") or "").strip().lower() or None
+
+
+@app.post("/api/notify-task-assigned")
+@rate_limit("notify_task_per_ip", RATE_LIMIT_NOTIFY_TASK_PER_IP)
+@rate_limit("notify_task_per_recipient", RATE_LIMIT_NOTIFY_TASK_PER_RECIPIENT, key=_notify_task_recipient_key)
+def notify_task_assigned():
+  """
+  This endpoint is called by the frontend when a task is assigned.
+  It should trigger an email notification to the assignee.
+  Rate limited per client IP and per assignee address (429 with Retry-After).
+  """
+  print("--- Received request at /api/notify-task-assigned ---", file=sys.stderr)
+  body = request.get_json(force=True, silent=True) or {}
+  print(f"Payload received: {json.dumps(body, indent=2)}", file=sys.stderr)
+
+  assigned_to_email = (body.get("assigned_to_email") or "").strip().lower()
+  assigned_to_name = (body.get("assigned_to_name") or "there").strip()
+  assigned_by_name = (body.get("assigned_by_name") or "Someone").strip()
+  assigned_by_email = (body.get("assigned_by_email") or "").strip()
+  event_title = (body.get("event_title") or "an event").strip()
+  event_date = (body.get("event_date") or "").strip()
+  event_time = (body.get("event_time") or "").strip()
+  company_name = (body.get("company_name") or "").strip()
+  task_title = (body.get("task_title") or "a task").strip()
+  task_description = (body.get("task_description") or "").strip()
+  due_date = (body.get("due_date") or "").strip()
+
+  if not assigned_to_email or not task_title:
+    return jsonify({"message": "Missing required fields for task notification"}), 400
+
+  template = _get_email_template("task_assigned")
+  if not template:
+    print("Warning: 'task_assigned' email template not found.", file=sys.stderr)
+    return jsonify({"message": "Email template not found"}), 500
+
+  context = {
+    "assignee_name": assigned_to_name,
+    "assigned_by_name": assigned_by_name,
+    "assigned_by_email": assigned_by_email,
+    "event_title": event_title,
+    "event_date": event_date,
+    "event_time": event_time,
+    "company_name": company_name,
+    "task_title": task_title,
+    "task_description": task_description,
+    "due_date": due_date,
+    "current_year": datetime.now().year,
+    "frontend_url": VITE_FRONTEND_URL,
+  }
+  rendered_subject, rendered_html = _render_email_template(template, context)
+
+  # Frontend retries of the same assignment collapse onto one message (Idempotency-Key header wins if sent)
+  dedup_key = request.headers.get("Idempotency-Key") or _outbox_dedup_key(
+    "task_assigned", assigned_to_email, task_title, event_title, due_date, assigned_by_email,
+    window_seconds=OUTBOX_DEDUP_WINDOW_SECONDS,
+  )
+  if _queue_email("task_assigned", assigned_to_email, rendered_subject, rendered_html, dedup_key=dedup_key):
+    return jsonify({"message": "Task assigned notification queued"}), 202
+  else:
+    return jsonify({"message": "Failed to send task assigned notification"}), 500
+
+@app.post("/api/send-welcome-email")
+@require_api_key  # Protected by API key from Supabase trigger
+def send_welcome_email():
+  body = request.get_json(force=True, silent=True) or {}
+  email = (body.get("email") or "").strip().lower()
+  user_name = (body.get("user_name") or "there").strip()
+
+  if not email:
+    return jsonify({"message": "Email is required"}), 400
+
+  template = _get_email_template("welcome_email")
+  if not template:
+    print("Warning: 'welcome_email' email template not found.", file=sys.stderr)
+    return jsonify({"message": "Email template not found"}), 500
+
+  context = {
+    "user_name": user_name,
+    "current_year": datetime.now().year,
+    "frontend_url": VITE_FRONTEND_URL,
+  }
+  rendered_subject, rendered_html = _render_email_template(template, context)
+
+  # One welcome email per address, however many times the trigger fires
+  if _queue_email("welcome_email", email, rendered_subject, rendered_html, dedup_key=f"welcome_email:{email}"):
+    return jsonify({"message": "Welcome email queued"}), 202
+  else:
+    return jsonify({"message": "Failed to send welcome email"}), 500
+
+# -----------------------------------------------------------------------------
+# Scheduler Setup
+# -----------------------------------------------------------------------------
+scheduler = BackgroundScheduler()
+scheduler_job_id = "daily_event_reminders"
+
+# Every gunicorn worker (and every node) schedules the same cron; a lease makes sure only one of them
+# actually runs a given job run. Primary: lease row in public.job_leases via RPC (works across nodes).
+# Fallback when the RPC isn't deployed/reachable: an fcntl lock file (single host only).
+JOB_LEASE_TTL_SECONDS = int(os.environ.get("JOB_LEASE_TTL_SECONDS", "120") or 120)
+# A released lease stays blocked until JOB_LEASE_MIN_HOLD_SECONDS after it was taken, so a worker whose
+# cron fires a few seconds late cannot start a second run of the same slot after the first one finished.
+JOB_LEASE_MIN_HOLD_SECONDS = int(os.environ.get("JOB_LEASE_MIN_HOLD_SECONDS", "60") or 60)
+JOB_LOCK_DIR = os.environ.get("JOB_LOCK_DIR") or tempfile.gettempdir()
+
+
+def _worker_id() -> str:
+  # Computed on demand: with --preload the pid changes after fork
+  return f"{socket.gethostname()}:{os.getpid()}"
+
+
+_job_last_runs: Dict[str, dict] = {}
+_job_local_locks: Dict[str, threading.Lock] = {}
+_job_local_locks_guard = threading.Lock()
+
+
+class _JobLease:
+  """
+  Exclusive, heartbeated lease on a named job. Use as a context manager:
+
+    with _JobLease("daily_event_reminders") as lease:
+      if lease.acquired:
+        ...
+
+  While held, a daemon thread renews the lease every TTL/3 so long runs keep it; if this process
+  dies, the lease simply expires after JOB_LEASE_TTL_SECONDS and another worker can take over.
+  """
+  def __init__(self, job_name: str, ttl_seconds: int = JOB_LEASE_TTL_SECONDS):
+    self.job_name = job_name
+    self.ttl_seconds = max(10, int(ttl_seconds))
+    self.holder = _worker_id()
+    self.acquired = False
+    self.backend: Optional[str] = None
+    self._lock_file = None
+    self._stop = threading.Event()
+    self._heartbeat: Optional[threading.Thread] = None
+
+  def _db_acquire(self) -> bool:
+    resp = supabase.rpc("acquire_job_lease", {
+      "p_job_name": self.job_name,
+      "p_holder": self.holder,
+      "p_ttl_seconds": self.ttl_seconds,
+    }).execute()
+    return bool(resp.data)
+
+  def _file_acquire(self) -> bool:
+    if fcntl is None:
+      return True  # No way to coordinate; behave like before rather than never running
+    path = os.path.join(JOB_LOCK_DIR, f"dayclap_{self.job_name}.lock")
+    f = open(path, "a+")
+    try:
+      fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+      f.close()
+      return False
+    # The file holds the last acquisition time; honour the same minimum hold as the DB lease
+    f.seek(0)
+    try:
+      last_acquired = float(f.read().strip() or 0)
+    except ValueError:
+      last_acquired = 0.0
+    if time.time() - last_acquired < JOB_LEASE_MIN_HOLD_SECONDS:
+      fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+      f.close()
+      return False
+    f.seek(0)
+    f.truncate()
+    f.write(str(time.time()))
+    f.flush()
+    self._lock_file = f
+    return True
+
+  def acquire(self) -> bool:
+    if supabase:
+      try:
+        self.acquired = self._db_acquire()
+        self.backend = "db"
+      except Exception as e:
+        print(f"Job lease RPC unavailable for '{self.job_name}' ({e}); using local lock file.", file=sys.stderr)
+    if self.backend is None:
+      self.acquired = self._file_acquire()
+      self.backend = "file"
+    if self.acquired and self.backend == "db":
+      self._heartbeat = threading.Thread(target=self._heartbeat_loop, name=f"lease-{self.job_name}", daemon=True)
+      self._heartbeat.start()
+    return self.acquired
+
+  def _heartbeat_loop(self) -> None:
+    while not self._stop.wait(self.ttl_seconds / 3):
+      try:
+        if not self._db_acquire():
+          print(f"WARNING: lost lease on '{self.job_name}' (holder {self.holder}).", file=sys.stderr)
+          return
+      except Exception as e:
+        print(f"WARNING: lease heartbeat failed for '{self.job_name}': {e}", file=sys.stderr)
+
+  def release(self) -> None:
+    self._stop.set()
+    if not self.acquired:
+      return
+    if self.backend == "db":
+      try:
+        supabase.rpc("release_job_lease", {
+          "p_job_name": self.job_name,
+          "p_holder": self.holder,
+          "p_min_hold_seconds": JOB_LEASE_MIN_HOLD_SECONDS,
+        }).execute()
+      except Exception as e:
+        print(f"WARNING: failed to release lease on '{self.job_name}' (it will expire): {e}", file=sys.stderr)
+    elif self._lock_file is not None:
+      try:
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+      finally:
+        self._lock_file.close()
+        self._lock_file = None
+    self.acquired = False
+
+  def __enter__(self):
+    self.acquire()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.release()
+    return False
+
+
+def _acquire_local_job_lock(job_name: str) -> Optional[threading.Lock]:
+  with _job_local_locks_guard:
+    local_lock = _job_local_locks.setdefault(job_name, threading.Lock())
+  if not local_lock.acquire(blocking=False):
+    print(f"Job '{job_name}' is already running in this worker; skipping.", file=sys.stderr)
+    return None
+  return local_lock
+
+
+def _run_job_exclusively(job_name: str, fn, *args, **kwargs) -> Tuple[bool, Any]:
+  """
+  Runs fn only if this process wins the job lease (and no other thread of this process is running it).
+  Returns (ran, result).
+  """
+  local_lock = _acquire_local_job_lock(job_name)
+  if local_lock is None:
+    return False, None
+  try:
+    with _JobLease(job_name) as lease:
+      if not lease.acquired:
+        print(f"Job '{job_name}' is running (or just ran) on another worker; skipping on {_worker_id()}.", file=sys.stderr)
+        return False, None
+      started_at = _utcnow_iso()
+      result = fn(*args, **kwargs)
+      _job_last_runs[job_name] = {"worker": _worker_id(), "lease_backend": lease.backend, "started_at": started_at, "finished_at": _utcnow_iso()}
+      return True, result
+  finally:
+    local_lock.release()
+
+
+def _run_job_on_this_worker(job_name: str, fn, *args, **kwargs) -> Tuple[bool, Any]:
+  """
+  Like _run_job_exclusively but without the cross-worker lease, for jobs that coordinate through
+  row claims and are meant to run on every worker at once. Returns (ran, result).
+  """
+  local_lock = _acquire_local_job_lock(job_name)
+  if local_lock is None:
+    return False, None
+  try:
+    started_at = _utcnow_iso()
+    result = fn(*args, **kwargs)
+    _job_last_runs[job_name] = {"worker": _worker_id(), "lease_backend": None, "started_at": started_at, "finished_at": _utcnow_iso()}
+    return True, result
+  finally:
+    local_lock.release()
+
+
+def _job_lease_status(job_name: str) -> dict:
+  status = {"job": job_name, "this_worker": _worker_id(), "holder": None, "held_by_this_worker": False, "last_run_on_this_worker": _job_last_runs.get(job_name)}
+  if supabase:
+    try:
+      resp = supabase.table("job_leases").select("holder, acquired_at, heartbeat_at, expires_at").eq("job_name", job_name).limit(1).execute()
+      row = (resp.data or [None])[0]
+      if row and (_parse_iso(row.get("expires_at")) or datetime.min.replace(tzinfo=timezone.utc)) > datetime.now(timezone.utc):
+        status.update({"holder": row.get("holder"), "acquired_at": row.get("acquired_at"), "heartbeat_at": row.get("heartbeat_at"), "expires_at": row.get("expires_at")})
+        status["held_by_this_worker"] = row.get("holder") == _worker_id()
+    except Exception as e:
+      status["error"] = f"lease table unavailable: {e}"
+  return status
+
+
+def _held_job_leases(prefix: str) -> list:
+  """
+  Unexpired leases of the jobs whose name starts with prefix (e.g. the per-bucket digest runs).
+  """
+  if not supabase:
+    return []
+  try:
+    rows = supabase.table("job_leases").select("job_name, holder, acquired_at, heartbeat_at, expires_at")\
+      .like("job_name", f"{prefix}%").gt("expires_at", _utcnow_iso()).order("job_name").execute().data or []
+  except Exception as e:
+    return [{"error": f"lease table unavailable: {e}"}]
+  return [dict(row, held_by_this_worker=row.get("holder") == _worker_id()) for row in rows]
+
+
+def _scheduled_1week_event_reminders() -> Tuple[bool, Any]:
+  if REMINDER_DRY_RUN:
+    report = _simulate_1week_reminders()
+    print(f"1-week reminder dry run (nothing sent): {json.dumps(report)}", file=sys.stderr)
+    return True, report
+  if REMINDER_SHARD_MODE == "claim":
+    return _run_job_on_this_worker(scheduler_job_id, _send_1week_event_reminders_sharded)
+  return _run_job_exclusively(scheduler_job_id, _send_1week_event_reminders_job)
+
+
+def _resume_interrupted_1week_reminders():
+  _run_job_exclusively(scheduler_job_id, _send_1week_event_reminders_job, resume_only=True)
+
+def _schedule_daily_reminders_job():
+  settings = _get_email_settings()
+  if not settings or not settings.get("scheduler_enabled"):
+    print("Scheduler is disabled or settings not found. Not scheduling job.", file=sys.stderr)
+    return
+
+  reminder_time_str = settings.get("reminder_time", "02:00")
+  try:
+    hour, minute = map(int, reminder_time_str.split(':'))
+  except ValueError:
+    print(f"Invalid reminder_time format: {reminder_time_str}. Defaulting to 02:00.", file=sys.stderr)
+    hour, minute = 2, 0
+
+  for job_id in (scheduler_job_id, digest_job_id, tz_bucket_job_id):
+    if scheduler.get_job(job_id):
+      scheduler.remove_job(job_id)
+      print(f"Removed existing scheduler job: {job_id}", file=sys.stderr)
+
+  # The per-event 1-week reminder is superseded when the digest engine owns that cadence
+  if "email_1week_countdown" not in DIGEST_CADENCES:
+    if REMINDER_SWEEP_INTERVAL_MINUTES > 0:
+      scheduler.add_job(
+        _scheduled_1week_event_reminders,
+        "interval",
+        minutes=REMINDER_SWEEP_INTERVAL_MINUTES,
+        id=scheduler_job_id,
+        replace_existing=True
+      )
+      print(f"Scheduled 1-week event reminder sweep every {REMINDER_SWEEP_INTERVAL_MINUTES} minute(s).", file=sys.stderr)
+    else:
+      scheduler.add_job(
+        _scheduled_1week_event_reminders,
+        CronTrigger(hour=hour, minute=minute),
+        id=scheduler_job_id,
+        replace_existing=True
+      )
+      print(f"Scheduled daily event reminders for {reminder_time_str} UTC.", file=sys.stderr)
+    # Pick up a run cut short by a restart once its old lease has expired
+    scheduler.add_job(
+      _resume_interrupted_1week_reminders,
+      "date",
+      run_date=datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_TTL_SECONDS + 5),
+      id=f"{scheduler_job_id}_resume",
+      replace_existing=True
+    )
+
+  if DIGEST_CADENCES and TZ_BUCKET_DELIVERY:
+    scheduler.add_job(
+      _scheduled_timezone_bucket_digests,
+      CronTrigger(minute=f"*/{max(1, TZ_BUCKET_TICK_MINUTES)}"),
+      id=tz_bucket_job_id,
+      replace_existing=True
+    )
+    print(f"Scheduled event digests ({', '.join(DIGEST_CADENCES)}) for {reminder_time_str} in each user's time zone.", file=sys.stderr)
+  elif DIGEST_CADENCES:
+    scheduler.add_job(
+      _scheduled_event_digests,
+      CronTrigger(hour=hour, minute=minute),
+      id=digest_job_id,
+      replace_existing=True
+    )
+    print(f"Scheduled event digests ({', '.join(DIGEST_CADENCES)}) for {reminder_time_str} UTC.", file=sys.stderr)
+
+
+REMINDER_PROFILE_BATCH_SIZE = int(os.environ.get("REMINDER_PROFILE_BATCH_SIZE", "200") or 200)
+REMINDER_PAGE_SIZE = int(os.environ.get("REMINDER_PAGE_SIZE", "500") or 500)
+REMINDER_RUN_PROFILE_MEMO_SIZE = int(os.environ.get("REMINDER_RUN_PROFILE_MEMO_SIZE", "10000") or 10000)
+REMINDER_MARK_BATCH_SIZE = int(os.environ.get("REMINDER_MARK_BATCH_SIZE", "200") or 200)
+REMINDER_MARK_MAX_DELAY_SECONDS = float(os.environ.get("REMINDER_MARK_MAX_DELAY_SECONDS", "5") or 5)
+# Candidates are read from the event_reminder_candidates view, which computes task counts in the database,
+# so jobs fetch only the columns their templates use instead of every event's whole event_tasks array
+REMINDER_CANDIDATES_VIEW = "event_reminder_candidates"
+REMINDER_EVENT_COLUMNS = "id, user_id, title, event_datetime, location, description, total_tasks, completed_tasks"
+_TASK_COUNT_COLUMNS = ("total_tasks", "completed_tasks", "pending_tasks")
+_reminder_view_retry_at = 0.0
+# Incremental sweep: every REMINDER_SWEEP_INTERVAL_MINUTES, remind events whose reminder moment
+# (event_datetime - 7 days) passed since the last completed sweep. 0 = one run per day at reminder_time.
+REMINDER_SWEEP_INTERVAL_MINUTES = int(os.environ.get("REMINDER_SWEEP_INTERVAL_MINUTES", "5") or 0)
+# How far back the first sweep (or one after a long outage) reaches, so a stale watermark cannot
+# trigger a flood of "1 week" reminders for events that are now only days away
+REMINDER_SWEEP_MAX_LOOKBACK_SECONDS = int(os.environ.get("REMINDER_SWEEP_MAX_LOOKBACK_SECONDS", "86400") or 86400)
+REMINDER_LEAD = timedelta(days=7)
+# Sharded execution: "claim" = every worker on every node claims batches of due events via the
+# claim_one_week_reminders RPC (FOR UPDATE SKIP LOCKED) instead of one lease holder doing all the work
+REMINDER_SHARD_MODE = (os.environ.get("REMINDER_SHARD_MODE") or "off").strip().lower()
+REMINDER_CLAIM_BATCH_SIZE = int(os.environ.get("REMINDER_CLAIM_BATCH_SIZE", "100") or 100)
+REMINDER_CLAIM_SECONDS = int(os.environ.get("REMINDER_CLAIM_SECONDS", "300") or 300)
+REMINDER_MAX_ATTEMPTS = int(os.environ.get("REMINDER_MAX_ATTEMPTS", "3") or 3)
+# Dry run: the scheduled job only simulates (query, resolve, render) and logs a capacity report
+REMINDER_DRY_RUN = (os.environ.get("REMINDER_DRY_RUN", "false") or "false").lower() in ("1", "true", "yes")
+REMINDER_DRY_RUN_MAX_MULTIPLIER = int(os.environ.get("REMINDER_DRY_RUN_MAX_MULTIPLIER", "1000") or 1000)
+# Push channel: users with notifications.push and a 1-week preference get one push per page of due events
+# ("3 events next week", see _1week_reminder_channels)
+REMINDER_PUSH_ENABLED = (os.environ.get("REMINDER_PUSH_ENABLED", "true") or "true").lower() in ("1", "true", "yes")
+
+
+def _columns_with_raw_tasks(columns: str) -> str:
+  """
+  Column list for reading straight from events: computed task counts are replaced by event_tasks.
+  """
+  fields = [c.strip() for c in columns.split(",") if c.strip()]
+  kept = [c for c in fields if c not in _TASK_COUNT_COLUMNS]
+  if len(kept) != len(fields) and "event_tasks" not in kept:
+    kept.append("event_tasks")
+  return ", ".join(kept)
+
+
+def _event_task_counts(event: dict) -> Tuple[int, int]:
+  """
+  (total_tasks, completed_tasks) for an event row: the view's precomputed counts when present,
+  otherwise counted from event_tasks.
+  """
+  if "total_tasks" in event:
+    return int(event.get("total_tasks") or 0), int(event.get("completed_tasks") or 0)
+  tasks = _ensure_list_event_tasks(event.get("event_tasks"))
+  return len(tasks), sum(1 for task in tasks if isinstance(task, dict) and task.get("completed"))
+
+
+def _iter_reminder_candidate_pages(window_start: datetime, window_end: datetime, columns: str = REMINDER_EVENT_COLUMNS, page_size: Optional[int] = None, summary: Optional[dict] = None, unsent_column: Optional[str] = "one_week_reminder_sent_at", start_after: Optional[Tuple[str, str]] = None, user_ids: Optional[list] = None):
+  """
+  Yields pages of events with window_start <= event_datetime < window_end (and unsent_column still NULL,
+  unless unsent_column is None), ordered by (event_datetime, id) and paged by keyset rather than OFFSET,
+  so peak memory is one page and rows marked as sent while we iterate cannot shift later pages.
+  Also avoids PostgREST's max-rows cap silently truncating one big response.
+  start_after=(event_datetime, id) resumes after a checkpointed row; user_ids restricts the owners.
+  """
+  global _reminder_view_retry_at
+  page_size = page_size or REMINDER_PAGE_SIZE
+  last_dt, last_id = start_after or (None, None)
+  while True:
+    use_view = time.monotonic() >= _reminder_view_retry_at
+    q = supabase.table(REMINDER_CANDIDATES_VIEW if use_view else "events")\
+      .select(columns if use_view else _columns_with_raw_tasks(columns))\
+      .gte("event_datetime", window_start.isoformat())\
+      .lt("event_datetime", window_end.isoformat())
+    if unsent_column:
+      q = q.is_(unsent_column, None)
+    if user_ids is not None:
+      q = q.in_("user_id", user_ids)
+    if last_dt is not None:
+      q = q.or_(f'event_datetime.gt."{last_dt}",and(event_datetime.eq."{last_dt}",id.gt.{last_id})')
+    try:
+      page = q.order("event_datetime").order("id").limit(page_size).execute().data or []
+    except Exception as e:
+      if not use_view:
+        raise
+      # Schema not migrated yet (or view unavailable): read event_tasks from events for a while
+      print(f"WARNING: {REMINDER_CANDIDATES_VIEW} unavailable ({e}); counting tasks in Python for 10 minutes.", file=sys.stderr)
+      _reminder_view_retry_at = time.monotonic() + 600
+      continue
+    if summary is not None:
+      summary["queries"] += 1
+      summary["pages"] = summary.get("pages", 0) + 1
+    if page:
+      yield page
+    if len(page) < page_size:
+      return
+    last_dt, last_id = page[-1].get("event_datetime"), page[-1].get("id")
+
+
+def _fetch_profiles_by_ids(user_ids: list, columns: str, summary: Optional[dict] = None) -> Dict[str, dict]:
+  """
+  Fetches profiles for many users with chunked in_() queries instead of one query per user.
+  Returns {user_id: row}; "id" is always selected. Increments summary["queries"] per round trip.
+  """
+  profiles: Dict[str, dict] = {}
+  ids = [uid for uid in dict.fromkeys(str(u) for u in user_ids if u)]
+  select_cols = columns if "id" in [c.strip() for c in columns.split(",")] else f"id, {columns}"
+  for i in range(0, len(ids), REMINDER_PROFILE_BATCH_SIZE):
+    chunk = ids[i:i + REMINDER_PROFILE_BATCH_SIZE]
+    resp = supabase.table("profiles").select(select_cols).in_("id", chunk).execute()
+    if summary is not None:
+      summary["queries"] += 1
+    for row in (resp.data or []):
+      profiles[str(row.get("id"))] = row
+  return profiles
+
+
+_bulk_send_executor: Optional[ThreadPoolExecutor] = None
+_bulk_send_executor_lock = threading.Lock()
+
+
+def _get_bulk_send_executor() -> ThreadPoolExecutor:
+  global _bulk_send_executor
+  if _bulk_send_executor is None:
+    with _bulk_send_executor_lock:
+      if _bulk_send_executor is None:
+        _bulk_send_executor = ThreadPoolExecutor(max_workers=max(1, BULK_SEND_CONCURRENCY), thread_name_prefix="bulk-send")
+  return _bulk_send_executor
+
+
+def _dispatch_emails(messages: list, settings: Optional[dict] = None, latencies: Optional[list] = None) -> list:
+  """
+  Sends many emails concurrently (BULK_SEND_CONCURRENCY threads, paced by the Maileroo token bucket).
+  messages: [{"to", "subject", "html", "sender"?}, ...]
+  Returns [(message, ok, error), ...] in the same order as messages, so callers can do their
+  bookkeeping in candidate order regardless of completion order.
+  If latencies is given, the wall time (seconds) of each completed send is appended to it.
+  """
+  if not messages:
+    return []
+
+  def _timed_send(m: dict) -> Tuple[bool, float]:
+    send_started = time.monotonic()
+    ok = _send_email_via_maileroo(m["to"], m["subject"], m["html"], m.get("sender"), settings)
+    return bool(ok), time.monotonic() - send_started
+
+  executor = _get_bulk_send_executor()
+  futures = [executor.submit(_timed_send, m) for m in messages]
+  results = []
+  for m, fut in zip(messages, futures):
+    try:
+      ok, seconds = fut.result()
+      if latencies is not None:
+        latencies.append(seconds)
+      results.append((m, ok, None if ok else "send failed"))
+    except Exception as e:
+      results.append((m, False, str(e)))
+  return results
+
+
+class _ReminderSentMarker:
+  """
+  Buffers ids of events whose reminder was delivered and marks them with one
+  UPDATE ... WHERE id IN (...) per batch. Flushes when REMINDER_MARK_BATCH_SIZE ids are waiting,
+  when the oldest has waited REMINDER_MARK_MAX_DELAY_SECONDS, and on exit. Callers only add()
+  after a successful send, so nothing is ever marked before its email went out. With a run (sweep
+  mode), events that fail to send (see hold()) or cannot be marked hold the run's watermark, so the
+  next sweep retries them.
+  """
+  def __init__(self, column: str = "one_week_reminder_sent_at", summary: Optional[dict] = None, run: Optional["_JobRun"] = None):
+    self.column = column
+    self.summary = summary
+    self.run = run
+    self._pending: list = []
+    self._due: Dict[Any, Any] = {}
+    self._oldest: Optional[float] = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.flush()
+    return False
+
+  def add(self, event_id, event_datetime=None) -> None:
+    if not self._pending:
+      self._oldest = time.monotonic()
+    self._pending.append(event_id)
+    if event_datetime is not None:
+      self._due[event_id] = event_datetime
+    if len(self._pending) >= REMINDER_MARK_BATCH_SIZE or time.monotonic() - self._oldest >= REMINDER_MARK_MAX_DELAY_SECONDS:
+      self.flush()
+
+  def flush(self) -> list:
+    """
+    Marks everything buffered. Returns the ids that could not be marked.
+    """
+    ids, self._pending, self._oldest = self._pending, [], None
+    due, self._due = self._due, {}
+    unmarked = []
+    for i in range(0, len(ids), REMINDER_MARK_BATCH_SIZE):
+      chunk = ids[i:i + REMINDER_MARK_BATCH_SIZE]
+      for attempt in range(2):
+        try:
+          supabase.table("events").update({self.column: datetime.now(timezone.utc).isoformat()}).in_("id", chunk).execute()
+          if self.summary is not None:
+            self.summary["queries"] += 1
+            self.summary["marked"] = self.summary.get("marked", 0) + len(chunk)
+          break
+        except Exception as e:
+          if attempt:
+            # Not marked -> held for the next run to retry (a duplicate is preferable to a miss)
+            print(f"ERROR: failed to mark {len(chunk)} event(s) as reminded ({self.column}): {e}; ids={chunk}", file=sys.stderr)
+            unmarked.extend(chunk)
+            for event_id in chunk:
+              self.hold(due.get(event_id))
+    return unmarked
+
+  def hold(self, event_datetime) -> None:
+    """
+    Holds the run's watermark for an event that was not delivered or not marked (sweep runs only;
+    sharded runs retry through their claims).
+    """
+    if self.run is not None:
+      self.run.hold_watermark(event_datetime)
+
+
+class _ReminderPushCoalescer:
+  """
+  Collects one page's (or claimed batch's) due 1-week reminders per user and sends each user a single push
+  for all of them ("3 events next week"), fanned out to all of the user's devices. The jobs flush it before
+  every checkpoint, so nothing queued here outlives the page it came from. Events of push-only users are
+  handed to marker once their push was delivered. Undelivered ones (push failed, no device) stay unmarked,
+  and the run's watermark is held at the earliest of them (run.hold_watermark), so the next sweep picks
+  them up again; a sharded run retries them through its claims instead.
+  """
+  def __init__(self, marker: "_ReminderSentMarker", summary: dict, run: Optional["_JobRun"] = None):
+    self.marker = marker
+    self.summary = summary
+    self.run = run
+    self._pending: Dict[str, dict] = {}
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.flush()
+    return False
+
+  def add(self, user_id: str, event: dict, mark: bool) -> None:
+    entry = self._pending.setdefault(user_id, {"events": [], "mark": []})
+    entry["events"].append(event)
+    if mark:
+      entry["mark"].append(event)
+
+  @staticmethod
+  def message(events: list) -> Tuple[str, str, str]:
+    events = sorted(events, key=lambda e: str(e.get("event_datetime") or ""))
+    if len(events) == 1:
+      e = events[0]
+      when = " ".join(filter(None, (_fmt_event_date_display(e.get("event_datetime")), _fmt_event_time_display(e.get("event_datetime")))))
+      return f"Next week: {e.get('title') or 'Untitled event'}", when or "Coming up in one week", VITE_FRONTEND_URL
+    titles = [e.get("title") or "Untitled event" for e in events[:3]]
+    more = len(events) - len(titles)
+    body = ", ".join(titles) + (f" and {more} more" if more else "")
+    return f"{len(events)} events next week", body, VITE_FRONTEND_URL
+
+  def flush(self) -> None:
+    pending, self._pending = self._pending, {}
+    if not pending:
+      return
+    try:
+      results = _send_push_to_users({uid: self.message(entry["events"]) for uid, entry in pending.items()})
+    except Exception as e:
+      print(f"ERROR: failed to send reminder pushes to {len(pending)} user(s): {e}", file=sys.stderr)
+      results = {}
+    for uid, entry in pending.items():
+      result = results.get(uid)
+      if result and result["sent"]:
+        outcome = "push_sent"
+        for event in entry["mark"]:
+          self.marker.add(event["id"], event.get("event_datetime"))
+      else:
+        outcome = "push_failed" if result is None or result["devices"] else "push_no_device"
+        if entry["mark"]:
+          self.summary["skipped" if outcome == "push_no_device" else "failed"] += len(entry["mark"])
+          self._hold(entry["mark"])
+      self.summary[outcome] = self.summary.get(outcome, 0) + 1
+      self.summary["push_events"] = self.summary.get("push_events", 0) + len(entry["events"])
+
+  def _hold(self, events: list) -> None:
+    if self.run is None:
+      return
+    for event in events:
+      self.run.hold_watermark(event.get("event_datetime"))
+
+
+# -----------------------------------------------------------------------------
+# Job run history (public.job_runs): checkpoints, resumption and per-run stats
+# -----------------------------------------------------------------------------
+JOB_RUN_ERROR_SAMPLES = int(os.environ.get("JOB_RUN_ERROR_SAMPLES", "20") or 20)
+JOB_RUN_HISTORY_LIMIT = int(os.environ.get("JOB_RUN_HISTORY_LIMIT", "50") or 50)
+JOB_RUN_RETENTION_DAYS = int(os.environ.get("JOB_RUN_RETENTION_DAYS", "30") or 30)
+# Upper bounds (ms) of the send-latency histogram buckets; a histogram (unlike raw samples) stays
+# small and can be merged when a run is resumed by another process
+_LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+_JOB_RUN_COUNTERS = ("events", "sent", "skipped", "failed", "send_seconds")
+
+
+def _new_latency_histogram() -> dict:
+  return {"buckets": [0] * (len(_LATENCY_BUCKETS_MS) + 1), "count": 0, "sum_ms": 0.0, "max_ms": 0.0}
+
+
+def _latency_percentiles(hist: Optional[dict], percentiles=(50, 90, 99)) -> dict:
+  """
+  Percentiles from a latency histogram, reported as the upper bound of the bucket that contains them.
+  """
+  hist = hist or {}
+  count = int(hist.get("count") or 0)
+  out: Dict[str, Any] = {"count": count}
+  if not count:
+    return out
+  buckets = hist.get("buckets") or []
+  for p in percentiles:
+    rank, seen = count * p / 100.0, 0
+    for i, n in enumerate(buckets):
+      seen += n
+      if seen >= rank:
+        out[f"p{p}"] = _LATENCY_BUCKETS_MS[i] if i < len(_LATENCY_BUCKETS_MS) else round(hist.get("max_ms") or 0, 1)
+        break
+  out["mean"] = round((hist.get("sum_ms") or 0) / count, 1)
+  out["max"] = round(hist.get("max_ms") or 0, 1)
+  return out
+
+
+class _JobRun:
+  """
+  One row of public.job_runs: the window a job run covers, its keyset checkpoint and what it did.
+  Counters live in the job's summary dict; checkpoint() persists them together with the cursor, so a
+  run cut short by a worker restart is resumed from there (resume()) instead of starting over.
+  Recording is best effort: if the table is unavailable the job still runs, just without history.
+  """
+  def __init__(self, job_name: str, summary: dict):
+    self.job_name = job_name
+    self.summary = summary
+    self.id: Optional[str] = None
+    self.cursor: Optional[dict] = None
+    self.attempts = 1
+    self.latency = _new_latency_histogram()
+    self.errors: list = []
+    self.watermark_hold: Optional[datetime] = None
+    self._prior_duration = 0.0
+    self._started = time.monotonic()
+
+  def _update(self, fields: dict) -> None:
+    if not self.id:
+      return
+    try:
+      supabase.table("job_runs").update(fields).eq("id", self.id).execute()
+    except Exception as e:
+      print(f"WARNING: failed to record progress of job run {self.id}: {e}", file=sys.stderr)
+
+  def _progress_fields(self) -> dict:
+    fields = {k: self.summary.get(k, 0) for k in _JOB_RUN_COUNTERS}
+    fields["send_seconds"] = round(float(fields["send_seconds"]), 3)
+    cursor = self.cursor
+    if self.watermark_hold is not None:
+      cursor = dict(cursor or {}, watermark_hold=self.watermark_hold.isoformat())
+    fields.update({
+      "cursor": cursor,
+      "latency": self.latency,
+      "error_samples": self.errors,
+      "duration_seconds": round(self._prior_duration + time.monotonic() - self._started, 3),
+      "updated_at": _utcnow_iso(),
+    })
+    return fields
+
+  def find_interrupted(self) -> Optional[dict]:
+    """
+    Latest run of this job still marked 'running'. Callers hold the job lease, so its worker is gone.
+    """
+    if not supabase:
+      return None
+    try:
+      resp = supabase.table("job_runs").select("*").eq("job_name", self.job_name).eq("status", "running")\
+        .order("started_at", desc=True).limit(1).execute()
+      return (resp.data or [None])[0]
+    except Exception as e:
+      print(f"WARNING: job run history unavailable for '{self.job_name}': {e}", file=sys.stderr)
+      return None
+
+  def start(self, window_start: Optional[datetime], window_end: Optional[datetime], group_key: Optional[str] = None) -> None:
+    try:
+      resp = supabase.table("job_runs").insert({
+        "job_name": self.job_name,
+        "status": "running",
+        "holder": _worker_id(),
+        "group_key": group_key,
+        "window_start": window_start.isoformat() if window_start else None,
+        "window_end": window_end.isoformat() if window_end else None,
+      }).execute()
+      self.id = ((resp.data or [{}])[0]).get("id")
+    except Exception as e:
+      print(f"WARNING: failed to record start of job run '{self.job_name}': {e}", file=sys.stderr)
+
+  def resume(self, row: dict) -> Tuple[datetime, datetime, Optional[Tuple[str, str]]]:
+    """
+    Takes over an interrupted run: restores its counters into summary and returns
+    (window_start, window_end, start_after) to continue from its last checkpoint.
+    """
+    self.id = row.get("id")
+    self.cursor = row.get("cursor") or None
+    self.watermark_hold = _parse_iso((self.cursor or {}).get("watermark_hold"))
+    self.attempts = int(row.get("attempts") or 1) + 1
+    self.latency = row.get("latency") or _new_latency_histogram()
+    self.errors = list(row.get("error_samples") or [])
+    self._prior_duration = float(row.get("duration_seconds") or 0)
+    for key in _JOB_RUN_COUNTERS:
+      self.summary[key] = type(self.summary.get(key, 0))(row.get(key) or 0)
+    self.summary["resumed_run"] = self.id
+    self._update({"holder": _worker_id(), "attempts": self.attempts, "updated_at": _utcnow_iso()})
+    start_after = (self.cursor["event_datetime"], self.cursor["id"]) if self.cursor and self.cursor.get("id") else None
+    return _parse_iso(row.get("window_start")), _parse_iso(row.get("window_end")), start_after
+
+  def abandon(self, row: dict) -> None:
+    try:
+      supabase.table("job_runs").update({"status": "abandoned", "finished_at": _utcnow_iso()}).eq("id", row.get("id")).execute()
+    except Exception as e:
+      print(f"WARNING: failed to abandon job run {row.get('id')}: {e}", file=sys.stderr)
+
+  def observe_latencies(self, seconds_list: list) -> None:
+    for seconds in seconds_list:
+      ms = seconds * 1000.0
+      i = next((i for i, bound in enumerate(_LATENCY_BUCKETS_MS) if ms <= bound), len(_LATENCY_BUCKETS_MS))
+      self.latency["buckets"][i] += 1
+      self.latency["count"] += 1
+      self.latency["sum_ms"] = round(self.latency["sum_ms"] + ms, 3)
+      self.latency["max_ms"] = max(self.latency["max_ms"], round(ms, 3))
+
+  def error(self, message: str) -> None:
+    if len(self.errors) < JOB_RUN_ERROR_SAMPLES:
+      self.errors.append({"at": _utcnow_iso(), "error": str(message)[:500]})
+
+  def checkpoint(self, cursor: Optional[dict] = None) -> None:
+    if cursor is not None:
+      self.cursor = cursor
+    self._update(self._progress_fields())
+
+  def hold_watermark(self, before) -> None:
+    """
+    Keeps this run's watermark at or before `before` (an event_datetime that still needs work): on
+    completion window_end is recorded no later than the earliest held value, so the next sweep's window
+    starts there again. Persisted with checkpoints, so a resumed run keeps it.
+    """
+    at = _to_datetime_any(before)
+    if at is not None and (self.watermark_hold is None or at < self.watermark_hold):
+      self.watermark_hold = at
+
+  def finish(self, status: str = "completed") -> None:
+    fields = self._progress_fields()
+    if status == "completed" and self.watermark_hold is not None:
+      fields["window_end"] = self.watermark_hold.isoformat()
+      self.summary["watermark_held_at"] = fields["window_end"]
+    fields.update({"status": status, "finished_at": _utcnow_iso(), "summary": self.summary})
+    self._update(fields)
+    self._purge_history()
+
+  def last_watermark(self) -> Optional[datetime]:
+    """
+    window_end of the latest completed run: everything before it has been swept.
+    """
+    if not supabase:
+      return None
+    try:
+      resp = supabase.table("job_runs").select("window_end").eq("job_name", self.job_name).eq("status", "completed")\
+        .order("window_end", desc=True).limit(1).execute()
+      return _parse_iso(((resp.data or [{}])[0]).get("window_end"))
+    except Exception as e:
+      print(f"WARNING: could not read watermark for '{self.job_name}': {e}", file=sys.stderr)
+      return None
+
+  def _purge_history(self) -> None:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=JOB_RUN_RETENTION_DAYS)).isoformat()
+    try:
+      supabase.table("job_runs").delete().eq("job_name", self.job_name).lt("started_at", cutoff).execute()
+    except Exception as e:
+      print(f"WARNING: failed to purge job run history for '{self.job_name}': {e}", file=sys.stderr)
+
+
+def _job_run_view(row: dict) -> dict:
+  """
+  Admin view of a job_runs row with derived throughput and latency percentiles.
+  """
+  view = {k: v for k, v in row.items() if k != "latency"}
+  attempted = int(row.get("sent") or 0) + int(row.get("failed") or 0)
+  send_seconds = float(row.get("send_seconds") or 0)
+  duration = float(row.get("duration_seconds") or 0)
+  view["messages_per_second"] = round(attempted / send_seconds, 2) if send_seconds else 0.0
+  view["events_per_second"] = round(int(row.get("events") or 0) / duration, 2) if duration else 0.0
+  view["latency_ms"] = _latency_percentiles(row.get("latency"))
+  return view
+
+
+def _aggregate_job_runs(rows: list) -> dict:
+  """
+  Combined report for the runs of one group (e.g. all shards of one sweep): summed counters, wall time
+  from the first start to the last finish, aggregate throughput, merged latency percentiles and per-shard rows.
+  """
+  totals = {k: 0 for k in ("events", "sent", "skipped", "failed")}
+  latency = _new_latency_histogram()
+  statuses: Dict[str, int] = {}
+  starts, finishes, shards = [], [], []
+  for row in rows:
+    for k in totals:
+      totals[k] += int(row.get(k) or 0)
+    statuses[row.get("status")] = statuses.get(row.get("status"), 0) + 1
+    hist = row.get("latency") or {}
+    for i, n in enumerate((hist.get("buckets") or [])[:len(latency["buckets"])]):
+      latency["buckets"][i] += n
+    latency["count"] += int(hist.get("count") or 0)
+    latency["sum_ms"] += float(hist.get("sum_ms") or 0)
+    latency["max_ms"] = max(latency["max_ms"], float(hist.get("max_ms") or 0))
+    started_at, finished_at = _parse_iso(row.get("started_at")), _parse_iso(row.get("finished_at") or row.get("updated_at"))
+    if started_at:
+      starts.append(started_at)
+    if finished_at:
+      finishes.append(finished_at)
+    view = _job_run_view(row)
+    shards.append({k: view.get(k) for k in ("id", "holder", "status", "events", "sent", "skipped", "failed", "duration_seconds", "messages_per_second")})
+  wall = (max(finishes) - min(starts)).total_seconds() if starts and finishes else 0.0
+  attempted = totals["sent"] + totals["failed"]
+  return {
+    "group_key": rows[0].get("group_key") if rows else None,
+    "shards": len(rows),
+    "statuses": statuses,
+    **totals,
+    "wall_seconds": round(wall, 3),
+    "messages_per_second": round(attempted / wall, 2) if wall > 0 else 0.0,
+    "latency_ms": _latency_percentiles(latency),
+    "runs": shards,
+  }
+
+
+def _build_1week_reminder_context(event: dict, user_profile: dict) -> dict:
+  user_email = user_profile.get("email")
+  user_name = user_profile.get("name") or (user_email.split('@')[0] if user_email else "there")
+
+  total_tasks, completed_tasks = _event_task_counts(event)
+  pending_tasks_count = total_tasks - completed_tasks
+  task_completion_percentage = f"{int((completed_tasks / total_tasks) * 100)}%" if total_tasks > 0 else "0%"
+
+  return {
+    "user_name": user_name,
+    "event_title": event.get("title") or "",
+    "event_date": _fmt_event_date_display(event.get("event_datetime") or event.get("date")),
+    "event_time": _fmt_event_time_display(event.get("event_datetime")) or event.get("time") or "N/A",
+    "event_location": event.get("location") or "",
+    "event_description": event.get("description") or "",
+    "has_tasks": "true" if total_tasks > 0 else "",
+    "pending_tasks_count": pending_tasks_count,
+    "task_completion_percentage": task_completion_percentage,
+    "current_year": datetime.now().year,
+    "frontend_url": VITE_FRONTEND_URL,
+  }
+
+
+def _1week_reminder_channels(user_profile: Optional[dict]) -> Tuple[str, ...]:
+  """
+  Channels a user gets 1-week reminders on. Resolved once per user per run (cached on the run's profile).
+  Every channel needs a 1-week preference: email_1week_countdown (email, plus push for users with
+  notifications.push) or push_1week_countdown (push only). notifications.push alone is only the device
+  master switch and never opts anyone in, so turning email_1week_countdown off stops 1-week reminders.
+  """
+  if not user_profile:
+    return ()
+  if "_channels" in user_profile:
+    return user_profile["_channels"]
+  notif = user_profile.get("notifications") or {}
+  wants_email = bool(notif.get("email_1week_countdown", False))
+  channels = []
+  if wants_email:
+    channels.append("email")
+  if REMINDER_PUSH_ENABLED and notif.get("push", False) and (wants_email or notif.get("push_1week_countdown", False)):
+    channels.append("push")
+  return tuple(channels)
+
+
+def _1week_reminder_skip_reason(user_profile: Optional[dict]) -> Optional[str]:
+  if not user_profile:
+    return "no_profile"
+  if not _1week_reminder_channels(user_profile):
+    return "disabled"
+  return None
+
+
+def _process_1week_reminder_page(page: list, reminder_template: dict, settings: dict, run_profiles: "_TTLCache", marker: "_ReminderSentMarker", run: "_JobRun", summary: dict,
+                                 push: Optional[_ReminderPushCoalescer] = None) -> list:
+  """
+  Renders and sends the 1-week reminders for one page (or claimed batch) of events.
+  Delivered events are handed to marker and failed ones held on it; events of users with push enabled
+  are queued on push (sent coalesced per user when the caller flushes it). Returns the ids of events
+  skipped by preference or missing profile.
+  """
+  skipped_ids = []
+  # One batched lookup per REMINDER_PROFILE_BATCH_SIZE owners not seen on earlier pages
+  missing = [uid for uid in dict.fromkeys(str(e.get("user_id")) for e in page) if run_profiles.get(uid) is None]
+  if missing:
+    fetched = _fetch_profiles_by_ids(missing, "email, name, notifications", summary)
+    summary["users"] += len(fetched)
+    for uid in missing:
+      profile = fetched.get(uid) or {}
+      if profile:
+        profile["_channels"] = _1week_reminder_channels(profile)
+      run_profiles.set(uid, profile)
+
+  # Render everything on this page first, then fan the sends out concurrently
+  outgoing = []
+  for event in page:
+    try:
+      user_profile = run_profiles.get(str(event.get("user_id")))
+      skip_reason = _1week_reminder_skip_reason(user_profile)
+      if skip_reason == "no_profile":
+        print(f"User profile not found for event {event['id']}. Skipping reminder.", file=sys.stderr)
+      elif skip_reason == "disabled":
+        print(f"User {user_profile.get('email')} has 1-week countdown reminders disabled. Skipping.", file=sys.stderr)
+      if skip_reason:
+        summary["skipped"] += 1
+        skipped_ids.append(event["id"])
+        continue
+
+      # Push-only users are queued here; users on both channels once their email went out, so an
+      # email retried by a later claim does not repeat the push
+      channels = user_profile["_channels"]
+      if "email" not in channels:
+        if push is not None:
+          push.add(str(event.get("user_id")), event, mark=True)
+        else:
+          summary["skipped"] += 1
+          skipped_ids.append(event["id"])
+        continue
+
+      user_email = user_profile.get("email")
+
+      context = _build_1week_reminder_context(event, user_profile)
+      rendered_subject, rendered_html = _render_email_template(reminder_template, context)
+      outgoing.append({
+        "event_id": event["id"], "to": user_email, "subject": rendered_subject, "html": rendered_html,
+        "event": event, "push": "push" in channels,
+      })
+    except Exception as inner_e:
+      summary["failed"] += 1
+      marker.hold(event.get("event_datetime"))
+      run.error(f"event {event.get('id')}: {inner_e}")
+      print(f"Error processing event {event.get('id')}: {inner_e}", file=sys.stderr)
+
+  latencies: list = []
+  send_started = time.monotonic()
+  results = _dispatch_emails(outgoing, settings, latencies)
+  summary["send_seconds"] += time.monotonic() - send_started
+  run.observe_latencies(latencies)
+
+  # Results come back in candidate order; only successful sends are buffered for marking
+  for message, ok, error in results:
+    if not ok:
+      summary["failed"] += 1
+      marker.hold(message["event"].get("event_datetime"))
+      run.error(f"event {message['event_id']} to {message['to']}: {error}")
+      print(f"Failed to send 1-week reminder for event {message['event_id']} to {message['to']}: {error}", file=sys.stderr)
+      continue
+    summary["sent"] += 1
+    marker.add(message["event_id"], message["event"].get("event_datetime"))
+    if message["push"] and push is not None:
+      push.add(str(message["event"].get("user_id")), message["event"], mark=False)
+    print(f"Sent 1-week reminder for event {message['event_id']} to {message['to']}", file=sys.stderr)
+  return skipped_ids
+
+
+def _reminder_sweep_window(run: "_JobRun", now: datetime) -> Tuple[datetime, datetime]:
+  """
+  Event window for one run of the 1-week reminder job. In sweep mode: events whose reminder moment
+  (event_datetime - 7 days) lies between the last completed sweep's watermark and now, capped at
+  REMINDER_SWEEP_MAX_LOOKBACK_SECONDS. In daily mode: the UTC day 7 days from now.
+  """
+  if REMINDER_SWEEP_INTERVAL_MINUTES <= 0:
+    day = (now + REMINDER_LEAD).date()
+    window_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return window_start, window_start + timedelta(days=1)
+  window_end = now + REMINDER_LEAD
+  floor = window_end - timedelta(seconds=REMINDER_SWEEP_MAX_LOOKBACK_SECONDS)
+  watermark = run.last_watermark()
+  return min(max(watermark or floor, floor), window_end), window_end
+
+
+def _send_1week_event_reminders_job(resume_only: bool = False) -> Optional[dict]:
+  """
+  This function is called by the scheduler to send 1-week event reminders.
+  It fetches events whose reminder is due (see _reminder_sweep_window), resolves their owners' profiles
+  in batches and sends notifications.
+  Progress is checkpointed to public.job_runs after every page; a run interrupted by a restart is
+  resumed from its checkpoint. With resume_only=True it only finishes such a run, if there is one.
+  Returns a run summary (query count, per-outcome counts, wall time), which is also logged.
+  """
+  print(f"Running 1-week event reminder job at {datetime.now(timezone.utc)} UTC.", file=sys.stderr)
+  if not supabase:
+    print("Supabase client not configured for scheduler job.", file=sys.stderr)
+    return None
+
+  settings = _get_email_settings()
+  if not settings or not settings.get("scheduler_enabled"):
+    print("Scheduler is now disabled. Skipping reminder job execution.", file=sys.stderr)
+    return None
+
+  started = time.monotonic()
+  summary = {"events": 0, "users": 0, "queries": 0, "sent": 0, "skipped": 0, "failed": 0, "send_seconds": 0.0}
+  run = _JobRun(scheduler_job_id, summary)
+  interrupted = run.find_interrupted()
+  if resume_only and not interrupted:
+    return None
+  run_status = "completed"
+  try:
+    window_start, window_end = _reminder_sweep_window(run, datetime.now(timezone.utc))
+
+    # Sweeps always finish an interrupted run first; the next sweep continues from its window_end
+    start_after = None
+    if interrupted and (resume_only or REMINDER_SWEEP_INTERVAL_MINUTES > 0 or _parse_iso(interrupted.get("window_start")) == window_start):
+      window_start, window_end, start_after = run.resume(interrupted)
+      print(f"Resuming 1-week reminder run {run.id} (attempt {run.attempts}) after {start_after}.", file=sys.stderr)
+    else:
+      if interrupted:
+        run.abandon(interrupted)
+      run.start(window_start, window_end)
+    summary["run_id"] = run.id
+
+    reminder_template = _get_email_template("event_1week_reminder")
+    summary["queries"] += 1
+    if not reminder_template:
+      print("Warning: 'event_1week_reminder' email template not found.", file=sys.stderr)
+      run.error("'event_1week_reminder' email template not found")
+      run_status = "failed"
+      return summary
+
+    # Profiles already resolved this run (bounded so a huge run can't grow memory without limit)
+    run_profiles = _TTLCache(maxsize=REMINDER_RUN_PROFILE_MEMO_SIZE, ttl=24 * 3600)
+
+    with _ReminderSentMarker("one_week_reminder_sent_at", summary, run) as marker, _ReminderPushCoalescer(marker, summary, run) as push:
+      for page in _iter_reminder_candidate_pages(window_start, window_end, summary=summary, start_after=start_after):
+        summary["events"] += len(page)
+
+        _process_1week_reminder_page(page, reminder_template, settings, run_profiles, marker, run, summary, push)
+
+        # Checkpoint only once this page's pushes went out and its deliveries are marked, so a resumed
+        # run neither skips unsent events nor re-sends delivered ones
+        push.flush()
+        marker.flush()
+        run.checkpoint({"event_datetime": page[-1].get("event_datetime"), "id": page[-1].get("id")})
+
+    print(f"1-week reminder: {summary['events']} event(s) in [{window_start.isoformat()}, {window_end.isoformat()})", file=sys.stderr)
+
+  except Exception as e:
+    run_status = "failed"
+    run.error(e)
+    print(f"Error in _send_1week_event_reminders_job: {e}", file=sys.stderr)
+  finally:
+    summary["duration_seconds"] = round(time.monotonic() - started, 3)
+    attempted = summary["sent"] + summary["failed"]
+    summary["messages_per_second"] = round(attempted / summary["send_seconds"], 2) if summary["send_seconds"] else 0.0
+    summary["send_seconds"] = round(summary["send_seconds"], 3)
+    summary["latency_ms"] = _latency_percentiles(run.latency)
+    run.finish(run_status)
+    print(f"1-week reminder run summary: {json.dumps(summary)}", file=sys.stderr)
+  return summary
+
+def _last_send_latency_seconds() -> Optional[float]:
+  """
+  Mean send latency of the latest completed 1-week reminder run (either mode), if any.
+  """
+  try:
+    rows = supabase.table("job_runs").select("latency").in_("job_name", [scheduler_job_id, f"{scheduler_job_id}#shard"])\
+      .eq("status", "completed").order("started_at", desc=True).limit(5).execute().data or []
+  except Exception:
+    return None
+  for row in rows:
+    hist = row.get("latency") or {}
+    if hist.get("count"):
+      return float(hist.get("sum_ms") or 0) / hist["count"] / 1000.0
+  return None
+
+
+def _simulate_1week_reminders(multiplier: int = 1, window: Optional[Tuple[datetime, datetime]] = None, workers: int = 1) -> dict:
+  """
+  Dry run of the 1-week reminder pipeline: the same candidate paging, batched profile resolution and
+  template rendering as a real run, but nothing is sent, marked or recorded. multiplier > 1 renders every
+  candidate that many times (and scales the query/profile stages) to project a larger volume.
+  Send time is projected from the Maileroo rate limit, BULK_SEND_CONCURRENCY and the last observed latency.
+  """
+  if not supabase:
+    return {"dry_run": True, "error": "Supabase client not configured"}
+  multiplier = max(1, min(int(multiplier), REMINDER_DRY_RUN_MAX_MULTIPLIER))
+  workers = max(1, int(workers))
+  started = time.monotonic()
+  if window is None:
+    window = _reminder_sweep_window(_JobRun(scheduler_job_id, {}), datetime.now(timezone.utc))
+  window_start, window_end = window
+  report: Dict[str, Any] = {
+    "dry_run": True,
+    "multiplier": multiplier,
+    "window": {"start": window_start.isoformat(), "end": window_end.isoformat()},
+    "events": 0,
+    "users": 0,
+    "would_send": 0,
+    "skipped": {"no_profile": 0, "disabled": 0},
+    "render_errors": 0,
+    "queries": 0,
+  }
+  stages = {"query_seconds": 0.0, "profile_seconds": 0.0, "render_seconds": 0.0}
+  rendered_total, rendered_max = 0, 0
+
+  template = _get_email_template("event_1week_reminder")
+  report["queries"] += 1
+  if not template:
+    report["error"] = "'event_1week_reminder' email template not found"
+    return report
+
+  run_profiles = _TTLCache(maxsize=REMINDER_RUN_PROFILE_MEMO_SIZE, ttl=24 * 3600)
+  pages = _iter_reminder_candidate_pages(window_start, window_end, summary=report)
+  while True:
+    t0 = time.monotonic()
+    page = next(pages, None)
+    stages["query_seconds"] += time.monotonic() - t0
+    if page is None:
+      break
+    report["events"] += len(page)
+
+    t0 = time.monotonic()
+    missing = [uid for uid in dict.fromkeys(str(e.get("user_id")) for e in page) if run_profiles.get(uid) is None]
+    if missing:
+      fetched = _fetch_profiles_by_ids(missing, "email, name, notifications", report)
+      report["users"] += len(fetched)
+      for uid in missing:
+        run_profiles.set(uid, fetched.get(uid) or {})
+    stages["profile_seconds"] += time.monotonic() - t0
+
+    t0 = time.monotonic()
+    for event in page:
+      user_profile = run_profiles.get(str(event.get("user_id")))
+      skip_reason = _1week_reminder_skip_reason(user_profile)
+      if skip_reason:
+        report["skipped"][skip_reason] += multiplier
+        continue
+      for _ in range(multiplier):
+        try:
+          subject, html_out = _render_email_template(template, _build_1week_reminder_context(event, user_profile))
+        except Exception:
+          report["render_errors"] += 1
+          continue
+        size = len(subject.encode("utf-8")) + len(html_out.encode("utf-8"))
+        rendered_total += size
+        rendered_max = max(rendered_max, size)
+        report["would_send"] += 1
+    stages["render_seconds"] += time.monotonic() - t0
+
+  # Only rendering really ran multiplier times; scale the per-candidate stages to match
+  stages["query_seconds"] *= multiplier
+  stages["profile_seconds"] *= multiplier
+  report["events"] *= multiplier
+  report["users"] *= multiplier
+  report["stages"] = {k: round(v, 3) for k, v in stages.items()}
+  report["rendered_bytes"] = {
+    "total": rendered_total,
+    "max": rendered_max,
+    "avg": round(rendered_total / report["would_send"]) if report["would_send"] else 0,
+  }
+
+  n = report["would_send"]
+  latency = _last_send_latency_seconds()
+  # With a host-wide Maileroo budget, extra workers share the rate instead of multiplying it
+  rate_workers = 1 if MAILEROO_RATE_LIMIT_SCOPE == "host" and RATE_LIMIT_ENABLED else workers
+  rate_bound = n / (MAILEROO_RATE_LIMIT_PER_SECOND * rate_workers) if MAILEROO_RATE_LIMIT_PER_SECOND > 0 else 0.0
+  concurrency_bound = n * latency / (max(1, BULK_SEND_CONCURRENCY) * workers) if latency else None
+  send_seconds = max(rate_bound, concurrency_bound or 0.0)
+  report["projection"] = {
+    "workers": workers,
+    "rate_limit_per_second": MAILEROO_RATE_LIMIT_PER_SECOND,
+    "concurrency": BULK_SEND_CONCURRENCY,
+    "observed_latency_seconds": round(latency, 3) if latency else None,
+    "send_seconds_rate_bound": round(rate_bound, 1),
+    "send_seconds_concurrency_bound": round(concurrency_bound, 1) if concurrency_bound is not None else None,
+    "send_seconds": round(send_seconds, 1),
+    "total_seconds": round(send_seconds + sum(stages.values()), 1),
+  }
+  report["simulation_seconds"] = round(time.monotonic() - started, 3)
+  return report
+
+
+def _claim_1week_reminder_batch(window_start: datetime, window_end: datetime, summary: dict) -> list:
+  resp = supabase.rpc("claim_one_week_reminders", {
+    "p_window_start": window_start.isoformat(),
+    "p_window_end": window_end.isoformat(),
+    "p_holder": _worker_id(),
+    "p_limit": REMINDER_CLAIM_BATCH_SIZE,
+    "p_claim_seconds": REMINDER_CLAIM_SECONDS,
+    "p_max_attempts": REMINDER_MAX_ATTEMPTS,
+  }).execute()
+  summary["queries"] += 1
+  return resp.data or []
+
+
+def _park_1week_reminders(event_ids: list, until: datetime, summary: dict) -> None:
+  """
+  Keeps skipped events (reminders disabled / no profile) claimed past their event time so no shard claims them again.
+  """
+  for i in range(0, len(event_ids), REMINDER_MARK_BATCH_SIZE):
+    chunk = event_ids[i:i + REMINDER_MARK_BATCH_SIZE]
+    try:
+      supabase.table("events").update({"one_week_reminder_claimed_until": until.isoformat()}).in_("id", chunk).execute()
+      summary["queries"] += 1
+    except Exception as e:
+      print(f"WARNING: failed to park {len(chunk)} skipped reminder(s): {e}", file=sys.stderr)
+
+
+def _send_1week_event_reminders_sharded() -> Optional[dict]:
+  """
+  Shard worker for REMINDER_SHARD_MODE=claim. Every worker on every node runs this on each tick and
+  claims batches of due events through claim_one_week_reminders (FOR UPDATE SKIP LOCKED), so no batch
+  goes to two workers and sending capacity grows with the number of workers. A claim expires after
+  REMINDER_CLAIM_SECONDS: whatever a crashed or failing worker did not deliver is claimed again by a
+  later sweep, up to REMINDER_MAX_ATTEMPTS times. Each shard records its own job_runs row; rows of
+  the same sweep share a group_key (see /api/admin/job-runs/report).
+  """
+  print(f"Running 1-week event reminder shard on {_worker_id()} at {datetime.now(timezone.utc)} UTC.", file=sys.stderr)
+  if not supabase:
+    print("Supabase client not configured for scheduler job.", file=sys.stderr)
+    return None
+
+  settings = _get_email_settings()
+  if not settings or not settings.get("scheduler_enabled"):
+    print("Scheduler is now disabled. Skipping reminder job execution.", file=sys.stderr)
+    return None
+
+  started = time.monotonic()
+  now = datetime.now(timezone.utc)
+  summary = {"events": 0, "batches": 0, "users": 0, "queries": 0, "sent": 0, "skipped": 0, "failed": 0, "send_seconds": 0.0}
+  run = _JobRun(f"{scheduler_job_id}#shard", summary)
+  run_status = "completed"
+  try:
+    # Claims make the window safe to overlap between sweeps, so it always spans the full lookback
+    # (that is also what retries events whose earlier claim expired undelivered)
+    if REMINDER_SWEEP_INTERVAL_MINUTES > 0:
+      window_end = now + REMINDER_LEAD
+      window_start = window_end - timedelta(seconds=REMINDER_SWEEP_MAX_LOOKBACK_SECONDS)
+      slot = now.replace(second=0, microsecond=0) - timedelta(minutes=now.minute % REMINDER_SWEEP_INTERVAL_MINUTES)
+      group_key = slot.isoformat()
+    else:
+      window_start, window_end = _reminder_sweep_window(run, now)
+      group_key = now.date().isoformat()
+    run.start(window_start, window_end, group_key)
+    summary["run_id"], summary["group_key"] = run.id, group_key
+
+    reminder_template = _get_email_template("event_1week_reminder")
+    summary["queries"] += 1
+    if not reminder_template:
+      print("Warning: 'event_1week_reminder' email template not found.", file=sys.stderr)
+      run.error("'event_1week_reminder' email template not found")
+      run_status = "failed"
+      return summary
+
+    run_profiles = _TTLCache(maxsize=REMINDER_RUN_PROFILE_MEMO_SIZE, ttl=24 * 3600)
+    with _ReminderSentMarker("one_week_reminder_sent_at", summary) as marker, _ReminderPushCoalescer(marker, summary) as push:
+      while True:
+        batch = _claim_1week_reminder_batch(window_start, window_end, summary)
+        if not batch:
+          break
+        summary["events"] += len(batch)
+        summary["batches"] += 1
+        skipped_ids = _process_1week_reminder_page(batch, reminder_template, settings, run_profiles, marker, run, summary, push)
+        push.flush()
+        marker.flush()
+        if skipped_ids:
+          _park_1week_reminders(skipped_ids, window_end + timedelta(seconds=REMINDER_SWEEP_MAX_LOOKBACK_SECONDS), summary)
+        run.checkpoint()
+
+  except Exception as e:
+    run_status = "failed"
+    run.error(e)
+    print(f"Error in _send_1week_event_reminders_sharded: {e}", file=sys.stderr)
+  finally:
+    summary["duration_seconds"] = round(time.monotonic() - started, 3)
+    attempted = summary["sent"] + summary["failed"]
+    summary["messages_per_second"] = round(attempted / summary["send_seconds"], 2) if summary["send_seconds"] else 0.0
+    summary["send_seconds"] = round(summary["send_seconds"], 3)
+    summary["latency_ms"] = _latency_percentiles(run.latency)
+    run.finish(run_status)
+    print(f"1-week reminder shard summary: {json.dumps(summary)}", file=sys.stderr)
+  return summary
+
+# -----------------------------------------------------------------------------
+# Digest engine (daily / weekly / monthly / countdown notification preferences)
+# -----------------------------------------------------------------------------
+# One pass fetches every event inside the widest cadence window due today, groups them per user and
+# cadence, and sends one digest per user per cadence (O(users) emails instead of O(events)).
+# public.notification_watermarks records the last period each (user, cadence) was sent for.
+# Opt-in: no digest goes out until DIGEST_CADENCES lists the cadences to send (email_daily defaults to
+# true in every profile, so enabling it starts a daily email to the whole user base).
+DIGEST_CADENCES = [c.strip() for c in (os.environ.get("DIGEST_CADENCES") or "").split(",") if c.strip()]
+DIGEST_WEEKLY_ISO_WEEKDAY = int(os.environ.get("DIGEST_WEEKLY_ISO_WEEKDAY", "1") or 1)  # 1 = Monday
+DIGEST_MAX_EVENTS_LISTED = int(os.environ.get("DIGEST_MAX_EVENTS_LISTED", "25") or 25)
+digest_job_id = "event_digests"
+# Time-zone bucketed delivery: every TZ_BUCKET_TICK_MINUTES, digests go to the users whose profiles.timezone
+# currently reads reminder_time, one run (and lease) per UTC-offset bucket, instead of everyone at once.
+TZ_BUCKET_DELIVERY = (os.environ.get("TZ_BUCKET_DELIVERY", "true") or "true").lower() in ("1", "true", "yes")
+TZ_BUCKET_TICK_MINUTES = int(os.environ.get("TZ_BUCKET_TICK_MINUTES", "15") or 15)
+TZ_BUCKET_REFRESH_SECONDS = int(os.environ.get("TZ_BUCKET_REFRESH_SECONDS", "300") or 300)
+tz_bucket_job_id = "event_digests_tz_tick"
+
+_DIGEST_TITLES = {
+  "email_daily": "Your day ahead",
+  "email_weekly": "Your week ahead",
+  "email_monthly": "Your month ahead",
+  "email_3day_countdown": "Coming up in 3 days",
+  "email_1week_countdown": "Coming up in 1 week",
+}
+DIGEST_EVENT_COLUMNS = "id, user_id, title, event_datetime, location, total_tasks, completed_tasks, one_week_reminder_sent_at"
+
+
+def _digest_windows(now: datetime, tz: timezone = timezone.utc) -> Dict[str, Tuple[datetime, datetime, str]]:
+  """
+  Returns {cadence: (window_start, window_end, period_key)} for the enabled cadences due on now's date in tz
+  (windows follow local midnights but are returned in UTC). period_key identifies the digest period,
+  so a rerun on the same day/week/month is a no-op.
+  """
+  today = now.astimezone(tz).date()
+  midnight = datetime(today.year, today.month, today.day, tzinfo=tz)
+  windows = {
+    "email_daily": (now, midnight + timedelta(days=1), today.isoformat()),
+  }
+  if today.isoweekday() == DIGEST_WEEKLY_ISO_WEEKDAY:
+    iso = today.isocalendar()
+    windows["email_weekly"] = (now, midnight + timedelta(days=7), f"{iso[0]}-W{iso[1]:02d}")
+  if today.day == 1:
+    next_month = datetime(today.year + (today.month == 12), today.month % 12 + 1, 1, tzinfo=tz)
+    windows["email_monthly"] = (now, next_month, today.strftime("%Y-%m"))
+  for cadence, days in (("email_3day_countdown", 3), ("email_1week_countdown", 7)):
+    day_start = midnight + timedelta(days=days)
+    windows[cadence] = (day_start, day_start + timedelta(days=1), (today + timedelta(days=days)).isoformat())
+  return {
+    c: (start.astimezone(timezone.utc), end.astimezone(timezone.utc), key)
+    for c, (start, end, key) in windows.items() if c in DIGEST_CADENCES
+  }
+
+
+def _digest_event_entry(event: dict) -> dict:
+  """
+  Compact per-event record kept in memory while a digest run groups events by user.
+  """
+  total, completed = _event_task_counts(event)
+  return {
+    "id": event.get("id"),
+    "title": event.get("title") or "",
+    "event_datetime": event.get("event_datetime"),
+    "location": event.get("location") or "",
+    "total_tasks": total,
+    "completed_tasks": completed,
+  }
+
+
+def _build_digest_context(cadence: str, entries: list, user_profile: dict, window: Tuple[datetime, datetime, str]) -> dict:
+  user_email = user_profile.get("email")
+  user_name = user_profile.get("name") or (user_email.split('@')[0] if user_email else "there")
+  pending_total = sum(e["total_tasks"] - e["completed_tasks"] for e in entries)
+  tz_name = user_profile.get("timezone") or "UTC"
+  tz = _user_zone(tz_name)
+
+  items = []
+  for e in entries[:DIGEST_MAX_EVENTS_LISTED]:
+    local_dt = _parse_iso(e["event_datetime"])
+    when = f"{local_dt.astimezone(tz):%B %d, %Y %H:%M} {tz_name}" if local_dt else str(e["event_datetime"] or "")
+    line = f"<strong>{html.escape(e['title'])}</strong> &mdash; {html.escape(when)}"
+    if e["location"]:
+      line += f" &middot; {html.escape(e['location'])}"
+    if e["total_tasks"]:
+      line += f" &middot; {e['total_tasks'] - e['completed_tasks']} of {e['total_tasks']} task(s) pending"
+    items.append(f"<li>{line}</li>")
+  if len(entries) > DIGEST_MAX_EVENTS_LISTED:
+    items.append(f"<li>&hellip;and {len(entries) - DIGEST_MAX_EVENTS_LISTED} more</li>")
+
+  window_start, window_end, _period = window
+  return {
+    "user_name": user_name,
+    "digest_title": _DIGEST_TITLES.get(cadence, "Upcoming events"),
+    "period_label": f"{window_start.astimezone(tz):%b %d} - {(window_end - timedelta(seconds=1)).astimezone(tz):%b %d, %Y}",
+    "event_count": len(entries),
+    "events_html": "<ul>" + "".join(items) + "</ul>",
+    "has_pending_tasks": "true" if pending_total else "",
+    "pending_tasks_total": pending_total,
+    "current_year": datetime.now().year,
+    "frontend_url": VITE_FRONTEND_URL,
+  }
+
 
-  sender_id = request._auth["id"]
-  sender_email = request._auth["email"]
+_zone_cache: Dict[str, Any] = {}
+_timezone_buckets_cache = _TTLCache(maxsize=1, ttl=TZ_BUCKET_REFRESH_SECONDS)
 
-  profile = fetch_profile(sender_id)
-  sender_role = user_role_for_company(profile or {}, company_id)
-  if not is_owner_or_admin(sender_role):
-    return jsonify({"message": "Forbidden: only owner/admin can send invitations for this company"}), 403
 
-  # Cooldown check for duplicate invitation (same sender -> recipient for same company)
+def _user_zone(name: Optional[str]):
+  """
+  ZoneInfo for an IANA name from profiles.timezone; unknown or empty names fall back to UTC.
+  """
+  name = name or "UTC"
+  zone = _zone_cache.get(name)
+  if zone is None:
+    try:
+      zone = ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+      zone = timezone.utc
+    _zone_cache[name] = zone
+  return zone
+
+
+def _fmt_utc_offset(offset_minutes: int) -> str:
+  sign = "+" if offset_minutes >= 0 else "-"
+  return f"UTC{sign}{abs(offset_minutes) // 60:02d}:{abs(offset_minutes) % 60:02d}"
+
+
+def _load_timezone_buckets() -> Dict[str, int]:
+  """
+  {timezone: user_count} from public.timezone_buckets, which a trigger on profiles keeps current.
+  Cached for TZ_BUCKET_REFRESH_SECONDS.
+  """
+  buckets = _timezone_buckets_cache.get("all")
+  if buckets is not None:
+    return buckets
   try:
-    last_resp = (
-      supabase.table("invitations")
-      .select("id, created_at")
-      .eq("sender_id", sender_id)
-      .eq("recipient_email", recipient)
-      .eq("company_id", company_id)
-      .order("created_at", desc=True)
-      .limit(1)
-      .execute()
-    )
-    last_data = getattr(last_resp, "data", None) or (last_resp.get("data") if isinstance(last_resp, dict) else None)
-    if isinstance(last_data, list) and len(last_data) > 0:
-      last_inv = last_data[0]
-      last_created_at = _parse_iso(last_inv.get("created_at"))
-      now = datetime.now(timezone.utc)
-      if last_created_at:
-        elapsed = (now - last_created_at).total_seconds()
-        if elapsed < INVITE_COOLDOWN_SECONDS:
-          remaining = int(INVITE_COOLDOWN_SECONDS - elapsed)
-          next_allowed = (now + timedelta(seconds=remaining)).isoformat()
-          resp = jsonify({
-            "message": "Please wait before sending another invite to this person for this company.",
-            "retry_after_seconds": remaining,
-            "next_allowed_at": next_allowed
-          })
-          resp.headers["Retry-After"] = str(remaining)
-          return resp, 429
+    rows = supabase.table("timezone_buckets").select("timezone, user_count").gt("user_count", 0).execute().data or []
+    buckets = {r["timezone"]: int(r.get("user_count") or 0) for r in rows if r.get("timezone")}
   except Exception as e:
-    print(f"Cooldown check error: {e}", file=sys.stderr)
+    print(f"WARNING: timezone buckets unavailable ({e}); treating everyone as UTC.", file=sys.stderr)
+    return {"UTC": 0}
+  _timezone_buckets_cache.set("all", buckets)
+  return buckets
 
-  payload = {
-    "sender_id": sender_id,
-    "sender_email": sender_email,
-    "recipient_email": recipient,
-    "company_id": company_id,
-    "company_name": company_name,
-    "role": role,
-    "status": "pending",
-  }
 
+def _due_timezone_buckets(now: datetime, reminder_time: str) -> Dict[int, list]:
+  """
+  {utc_offset_minutes: [timezone, ...]} of the zones whose local reminder_time falls in the tick
+  starting at now (rounded down to TZ_BUCKET_TICK_MINUTES). Zones sharing an offset share a bucket;
+  unknown zone names land in the UTC bucket.
+  """
   try:
-    supabase.table("invitations").insert(payload).execute()
+    hour, minute = map(int, reminder_time.split(':'))
+  except ValueError:
+    hour, minute = 2, 0
+  tick = max(1, TZ_BUCKET_TICK_MINUTES)
+  now = now.replace(second=0, microsecond=0) - timedelta(minutes=now.minute % tick)
+  target = hour * 60 + minute
+  due: Dict[int, list] = {}
+  for name in _load_timezone_buckets():
+    local = now.astimezone(_user_zone(name))
+    if (local.hour * 60 + local.minute - target) % 1440 < tick:
+      offset = int(local.utcoffset().total_seconds() // 60)
+      due.setdefault(offset, []).append(name)
+  return due
+
+
+def _iter_profile_ids_in_timezones(zones: list, summary: Optional[dict] = None):
+  """
+  Yields pages of profile ids whose timezone is in zones (keyset on id).
+  """
+  last_id = None
+  while True:
+    q = supabase.table("profiles").select("id").in_("timezone", zones)
+    if last_id is not None:
+      q = q.gt("id", last_id)
+    page = q.order("id").limit(REMINDER_PROFILE_BATCH_SIZE).execute().data or []
+    if summary is not None:
+      summary["queries"] += 1
+    if page:
+      yield [str(r["id"]) for r in page]
+    if len(page) < REMINDER_PROFILE_BATCH_SIZE:
+      return
+    last_id = page[-1]["id"]
 
-    # Send invitation email
-    template = _get_email_template("invitation_to_company")
-    if template:
-      context = {
-        "sender_email": sender_email,
-        "company_name": company_name,
-        "role": role.capitalize(),
-        "current_year": datetime.now().year,
-        "frontend_url": VITE_FRONTEND_URL,
-      }
-      rendered_html = _render_template(template["html_content"], context)
-      rendered_subject = _render_template(template["subject"], context)
-      _send_email_via_maileroo(recipient, rendered_subject, rendered_html, sender_email)
-    else:
-      print("Warning: 'invitation_to_company' email template not found.", file=sys.stderr)
 
-    return jsonify({
-      "message": "Invitation sent",
-      "cooldown_seconds": INVITE_COOLDOWN_SECONDS
-    }), 202
-  except Exception as e:
-    print(f"send_invitation insert/email error: {e}", file=sys.stderr)
-    return jsonify({"message": "Failed to send invitation"}), 500
+def _fetch_digest_watermarks(user_ids: list, summary: Optional[dict] = None) -> Dict[Tuple[str, str], str]:
+  """
+  Returns {(user_id, cadence): period_key} of the last digest sent per user and cadence.
+  """
+  marks: Dict[Tuple[str, str], str] = {}
+  for i in range(0, len(user_ids), REMINDER_PROFILE_BATCH_SIZE):
+    chunk = user_ids[i:i + REMINDER_PROFILE_BATCH_SIZE]
+    resp = supabase.table("notification_watermarks").select("user_id, cadence, period_key").in_("user_id", chunk).execute()
+    if summary is not None:
+      summary["queries"] += 1
+    for row in (resp.data or []):
+      marks[(str(row.get("user_id")), row.get("cadence"))] = row.get("period_key")
+  return marks
+
+
+def _record_digest_watermarks(rows: list, summary: Optional[dict] = None) -> None:
+  for i in range(0, len(rows), REMINDER_MARK_BATCH_SIZE):
+    chunk = rows[i:i + REMINDER_MARK_BATCH_SIZE]
+    try:
+      supabase.table("notification_watermarks").upsert(chunk, on_conflict="user_id,cadence").execute()
+      if summary is not None:
+        summary["queries"] += 1
+    except Exception as e:
+      print(f"ERROR: failed to record {len(chunk)} digest watermark(s): {e}", file=sys.stderr)
 
 
-@app.post("/api/notify-task-assigned")
-def notify_task_assigned():
+def _send_event_digests_job(bucket: Optional[Tuple[int, list]] = None) -> Optional[dict]:
   """
-  This endpoint is called by the frontend when a task is assigned.
-  It should trigger an email notification to the assignee.
+  Sends one digest email per user per due cadence (see _digest_windows), honouring each user's
+  notifications preferences and skipping (user, cadence) pairs whose watermark already covers this period.
+  bucket=(utc_offset_minutes, [timezone, ...]) limits the run to users in those zones, with periods
+  following their local calendar; without it everyone is processed on the UTC calendar.
   """
-  print("--- Received request at /api/notify-task-assigned ---", file=sys.stderr)
-  body = request.get_json(force=True, silent=True) or {}
-  print(f"Payload received: {json.dumps(body, indent=2)}", file=sys.stderr)
+  print(f"Running event digest job at {datetime.now(timezone.utc)} UTC{f' for {_fmt_utc_offset(bucket[0])}' if bucket else ''}.", file=sys.stderr)
+  if not supabase:
+    print("Supabase client not configured for digest job.", file=sys.stderr)
+    return None
 
-  assigned_to_email = (body.get("assigned_to_email") or "").strip().lower()
-  assigned_to_name = (body.get("assigned_to_name") or "there").strip()
-  assigned_by_name = (body.get("assigned_by_name") or "Someone").strip()
-  assigned_by_email = (body.get("assigned_by_email") or "").strip()
-  event_title = (body.get("event_title") or "an event").strip()
-  event_date = (body.get("event_date") or "").strip()
-  event_time = (body.get("event_time") or "").strip()
-  company_name = (body.get("company_name") or "").strip()
-  task_title = (body.get("task_title") or "a task").strip()
-  task_description = (body.get("task_description") or "").strip()
-  due_date = (body.get("due_date") or "").strip()
+  settings = _get_email_settings()
+  if not settings or not settings.get("scheduler_enabled"):
+    print("Scheduler is now disabled. Skipping digest job execution.", file=sys.stderr)
+    return None
 
-  if not assigned_to_email or not task_title:
-    return jsonify({"message": "Missing required fields for task notification"}), 400
+  started = time.monotonic()
+  now = datetime.now(timezone.utc)
+  summary = {"cadences": [], "events": 0, "users": 0, "queries": 0, "sent": 0, "skipped": 0, "failed": 0, "send_seconds": 0.0, "by_cadence": {}}
+  if bucket:
+    summary["bucket"] = {"utc_offset": _fmt_utc_offset(bucket[0]), "timezones": bucket[1]}
+  # Digests are idempotent through their watermarks, so runs are recorded but never resumed
+  run = _JobRun(_timezone_bucket_job_name(bucket[0]) if bucket else digest_job_id, summary)
+  run_status = "completed"
+  try:
+    windows = _digest_windows(now, timezone(timedelta(minutes=bucket[0])) if bucket else timezone.utc)
+    summary["cadences"] = sorted(windows)
+    if not windows:
+      return summary
+
+    horizon_start = min(w[0] for w in windows.values())
+    horizon_end = max(w[1] for w in windows.values())
+    run.start(horizon_start, horizon_end)
+    summary["run_id"] = run.id
+
+    template = _get_email_template("event_digest")
+    summary["queries"] += 1
+    if not template:
+      print("Warning: 'event_digest' email template not found.", file=sys.stderr)
+      run.error("'event_digest' email template not found")
+      run_status = "failed"
+      return summary
+
+    # Group every event in the widest window by user and cadence
+    per_user: Dict[str, Dict[str, list]] = {}
+    if bucket:
+      pages = (
+        page
+        for ids in _iter_profile_ids_in_timezones(bucket[1], summary)
+        for page in _iter_reminder_candidate_pages(horizon_start, horizon_end, columns=DIGEST_EVENT_COLUMNS, summary=summary, unsent_column=None, user_ids=ids)
+      )
+    else:
+      pages = _iter_reminder_candidate_pages(horizon_start, horizon_end, columns=DIGEST_EVENT_COLUMNS, summary=summary, unsent_column=None)
+    for page in pages:
+      summary["events"] += len(page)
+      for event in page:
+        event_dt = _parse_iso(event.get("event_datetime"))
+        if not event_dt:
+          continue
+        entry = None
+        for cadence, (window_start, window_end, _period) in windows.items():
+          if not (window_start <= event_dt < window_end):
+            continue
+          if cadence == "email_1week_countdown" and event.get("one_week_reminder_sent_at"):
+            continue
+          entry = entry or _digest_event_entry(event)
+          per_user.setdefault(str(event.get("user_id")), {}).setdefault(cadence, []).append(entry)
+
+    user_ids = list(per_user)
+    profiles = _fetch_profiles_by_ids(user_ids, "email, name, notifications, timezone", summary)
+    watermarks = _fetch_digest_watermarks(user_ids, summary)
+    summary["users"] = len(profiles)
+
+    def _flush(outgoing: list, marker: "_ReminderSentMarker") -> None:
+      latencies: list = []
+      send_started = time.monotonic()
+      results = _dispatch_emails(outgoing, settings, latencies)
+      summary["send_seconds"] += time.monotonic() - send_started
+      run.observe_latencies(latencies)
+      marks = []
+      for message, ok, error in results:
+        counts = summary["by_cadence"].setdefault(message["cadence"], {"sent": 0, "failed": 0})
+        if not ok:
+          summary["failed"] += 1
+          counts["failed"] += 1
+          run.error(f"{message['cadence']} digest to {message['to']}: {error}")
+          print(f"Failed to send {message['cadence']} digest to {message['to']}: {error}", file=sys.stderr)
+          continue
+        summary["sent"] += 1
+        counts["sent"] += 1
+        marks.append({
+          "user_id": message["user_id"],
+          "cadence": message["cadence"],
+          "period_key": message["period_key"],
+          "event_count": len(message["event_ids"]),
+          "last_sent_at": datetime.now(timezone.utc).isoformat(),
+        })
+        if message["cadence"] == "email_1week_countdown":
+          for event_id in message["event_ids"]:
+            marker.add(event_id)
+      _record_digest_watermarks(marks, summary)
+      outgoing.clear()
+      run.checkpoint()
+
+    outgoing: list = []
+    with _ReminderSentMarker("one_week_reminder_sent_at", summary) as marker:
+      for uid, by_cadence in per_user.items():
+        profile = profiles.get(uid)
+        if not profile or not profile.get("email"):
+          summary["skipped"] += len(by_cadence)
+          continue
+        prefs = profile.get("notifications") or {}
+        for cadence, entries in by_cadence.items():
+          period_key = windows[cadence][2]
+          if not prefs.get(cadence, False) or watermarks.get((uid, cadence)) == period_key:
+            summary["skipped"] += 1
+            continue
+          subject, html_out = _render_email_template(template, _build_digest_context(cadence, entries, profile, windows[cadence]))
+          outgoing.append({
+            "user_id": uid,
+            "cadence": cadence,
+            "period_key": period_key,
+            "event_ids": [e["id"] for e in entries],
+            "to": profile["email"],
+            "subject": subject,
+            "html": html_out,
+          })
+          if len(outgoing) >= REMINDER_PAGE_SIZE:
+            _flush(outgoing, marker)
+      _flush(outgoing, marker)
 
-  template = _get_email_template("task_assigned")
-  if not template:
-    print("Warning: 'task_assigned' email template not found.", file=sys.stderr)
-    return jsonify({"message": "Email template not found"}), 500
+  except Exception as e:
+    run_status = "failed"
+    run.error(e)
+    print(f"Error in _send_event_digests_job: {e}", file=sys.stderr)
+  finally:
+    summary["duration_seconds"] = round(time.monotonic() - started, 3)
+    attempted = summary["sent"] + summary["failed"]
+    summary["messages_per_second"] = round(attempted / summary["send_seconds"], 2) if summary["send_seconds"] else 0.0
+    summary["send_seconds"] = round(summary["send_seconds"], 3)
+    summary["latency_ms"] = _latency_percentiles(run.latency)
+    run.finish(run_status)
+    print(f"Event digest run summary: {json.dumps(summary)}", file=sys.stderr)
+  return summary
 
-  context = {
-    "assignee_name": assigned_to_name,
-    "assigned_by_name": assigned_by_name,
-    "assigned_by_email": assigned_by_email,
-    "event_title": event_title,
-    "event_date": event_date,
-    "event_time": event_time,
-    "company_name": company_name,
-    "task_title": task_title,
-    "task_description": task_description,
-    "due_date": due_date,
-    "current_year": datetime.now().year,
-    "frontend_url": VITE_FRONTEND_URL,
-  }
-  rendered_html = _render_template(template["html_content"], context)
-  rendered_subject = _render_template(template["subject"], context)
 
-  if _send_email_via_maileroo(assigned_to_email, rendered_subject, rendered_html):
-    return jsonify({"message": "Task assigned notification sent"}), 200
-  else:
-    return jsonify({"message": "Failed to send task assigned notification"}), 500
+def _scheduled_event_digests():
+  _run_job_exclusively(digest_job_id, _send_event_digests_job)
 
-@app.post("/api/send-welcome-email")
-@require_api_key  # Protected by API key from Supabase trigger
-def send_welcome_email():
-  body = request.get_json(force=True, silent=True) or {}
-  email = (body.get("email") or "").strip().lower()
-  user_name = (body.get("user_name") or "there").strip()
 
-  if not email:
-    return jsonify({"message": "Email is required"}), 400
+def _timezone_bucket_job_name(offset_minutes: int) -> str:
+  return f"{digest_job_id}@{_fmt_utc_offset(offset_minutes)}"
 
-  template = _get_email_template("welcome_email")
-  if not template:
-    print("Warning: 'welcome_email' email template not found.", file=sys.stderr)
-    return jsonify({"message": "Email template not found"}), 500
 
-  context = {
-    "user_name": user_name,
-    "current_year": datetime.now().year,
-    "frontend_url": VITE_FRONTEND_URL,
-  }
-  rendered_html = _render_template(template["html_content"], context)
-  rendered_subject = _render_template(template["subject"], context)
+def _due_timezone_bucket_jobs(settings: Optional[dict]) -> Dict[str, Tuple[int, list]]:
+  """
+  {bucket job name: (utc_offset_minutes, [timezone, ...])} of the buckets due in the current tick.
+  """
+  due = _due_timezone_buckets(datetime.now(timezone.utc), (settings or {}).get("reminder_time") or "02:00")
+  return {_timezone_bucket_job_name(offset): (offset, zones) for offset, zones in sorted(due.items())}
 
-  if _send_email_via_maileroo(email, rendered_subject, rendered_html):
-    return jsonify({"message": "Welcome email sent"}), 200
-  else:
-    return jsonify({"message": "Failed to send welcome email"}), 500
 
-# -----------------------------------------------------------------------------
-# Scheduler Setup
-# -----------------------------------------------------------------------------
-scheduler = BackgroundScheduler()
-scheduler_job_id = "daily_event_reminders"
+def _run_due_timezone_bucket_digests(settings: Optional[dict]) -> Dict[str, Tuple[bool, Any]]:
+  """
+  Runs the digest job once per due bucket under that bucket's lease. Returns {bucket job name: (ran, summary)}.
+  """
+  return {
+    job_name: _run_job_exclusively(job_name, _send_event_digests_job, bucket)
+    for job_name, bucket in _due_timezone_bucket_jobs(settings).items()
+  }
 
-def _schedule_daily_reminders_job():
+
+def _scheduled_timezone_bucket_digests():
+  """
+  Tick job: runs the digest job once per UTC-offset bucket whose local time is reminder_time.
+  Each bucket has its own lease, so the workers of a tick can share the buckets between them.
+  """
   settings = _get_email_settings()
   if not settings or not settings.get("scheduler_enabled"):
-    print("Scheduler is disabled or settings not found. Not scheduling job.", file=sys.stderr)
     return
+  _run_due_timezone_bucket_digests(settings)
 
-  reminder_time_str = settings.get("reminder_time", "02:00")
-  try:
-    hour, minute = map(int, reminder_time_str.split(':'))
-  except ValueError:
-    print(f"Invalid reminder_time format: {reminder_time_str}. Defaulting to 02:00.", file=sys.stderr)
-    hour, minute = 2, 0
+# -----------------------------------------------------------------------------
+# Push broadcast (admin notices to every subscribed device)
+# -----------------------------------------------------------------------------
+# Streams the device registry in keyset pages of PUSH_BROADCAST_PAGE_SIZE. Each page's payloads are
+# encrypted in a process pool (ECDH + AES-GCM per device is CPU-bound and would otherwise hold the GIL
+# for minutes at tens of thousands of devices) while already encrypted chunks are posted over the
+# push client's pooled connections. Progress and throughput are checkpointed to job_runs after every page.
+push_broadcast_job_id = "push_broadcast"
+_push_encrypt_pool: Optional[ProcessPoolExecutor] = None
+_push_encrypt_pool_pid: Optional[int] = None
+_push_encrypt_pool_lock = threading.Lock()
 
-  if scheduler.get_job(scheduler_job_id):
-    scheduler.remove_job(scheduler_job_id)
-    print(f"Removed existing scheduler job: {scheduler_job_id}", file=sys.stderr)
 
-  scheduler.add_job(
-    _send_1week_event_reminders_job,
-    CronTrigger(hour=hour, minute=minute),
-    id=scheduler_job_id,
-    replace_existing=True
-  )
-  print(f"Scheduled daily event reminders for {reminder_time_str} UTC.", file=sys.stderr)
+def _get_push_encrypt_pool() -> Optional[ProcessPoolExecutor]:
+  """
+  Per-process pool of PUSH_ENCRYPT_PROCESSES workers forked from a forkserver that preloads push_crypto,
+  so the children start quickly and do not inherit the scheduler/outbox threads of this worker.
+  None when disabled or unsupported (no forkserver on Windows).
+  """
+  global _push_encrypt_pool, _push_encrypt_pool_pid
+  if PUSH_ENCRYPT_PROCESSES <= 0 or "forkserver" not in multiprocessing.get_all_start_methods():
+    return None
+  if _push_encrypt_pool is None or _push_encrypt_pool_pid != os.getpid():
+    with _push_encrypt_pool_lock:
+      if _push_encrypt_pool is None or _push_encrypt_pool_pid != os.getpid():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["push_crypto"])
+        _push_encrypt_pool = ProcessPoolExecutor(max_workers=PUSH_ENCRYPT_PROCESSES, mp_context=ctx)
+        _push_encrypt_pool_pid = os.getpid()
+  return _push_encrypt_pool
+
+
+def _reset_push_encrypt_pool() -> None:
+  global _push_encrypt_pool
+  with _push_encrypt_pool_lock:
+    if _push_encrypt_pool is not None:
+      _push_encrypt_pool.shutdown(wait=False, cancel_futures=True)
+    _push_encrypt_pool = None
 
 
-def _send_1week_event_reminders_job():
+def _encrypt_push_page(subs: list, payload: str):
   """
-  This function is called by the scheduler to send 1-week event reminders.
-  It fetches events due in 7 days and sends notifications.
+  Yields (chunk_of_subscriptions, encrypted_bodies) as each chunk is encrypted, one chunk per pool process,
+  so posting starts as soon as the first chunk is ready. Falls back to in-thread encryption if the pool is
+  disabled or broken.
   """
-  print(f"Running daily 1-week event reminder job at {datetime.now(timezone.utc)} UTC.", file=sys.stderr)
-  if not supabase:
-    print("Supabase client not configured for scheduler job.", file=sys.stderr)
+  pool = _get_push_encrypt_pool()
+  if pool is None:
+    yield subs, push_crypto.encrypt_payloads(subs, payload)
     return
+  size = max(1, -(-len(subs) // PUSH_ENCRYPT_PROCESSES))
+  chunks = [subs[i:i + size] for i in range(0, len(subs), size)]
+  try:
+    futures = [pool.submit(push_crypto.encrypt_payloads, chunk, payload) for chunk in chunks]
+  except (BrokenProcessPool, RuntimeError) as e:
+    print(f"Push encryption pool unavailable ({e}); encrypting in-process.", file=sys.stderr)
+    _reset_push_encrypt_pool()
+    futures = [None] * len(chunks)
+  for chunk, fut in zip(chunks, futures):
+    try:
+      bodies = fut.result() if fut is not None else push_crypto.encrypt_payloads(chunk, payload)
+    except BrokenProcessPool as e:
+      print(f"Push encryption pool broke ({e}); encrypting in-process.", file=sys.stderr)
+      _reset_push_encrypt_pool()
+      bodies = push_crypto.encrypt_payloads(chunk, payload)
+    yield chunk, bodies
 
-  settings = _get_email_settings()
-  if not settings or not settings.get("scheduler_enabled"):
-    print("Scheduler is now disabled. Skipping reminder job execution.", file=sys.stderr)
-    return
 
+def _push_broadcast_active() -> Optional[dict]:
+  """
+  The broadcast currently running on any worker (a 'running' row checkpointed within the lease TTL), if any.
+  """
+  if not supabase:
+    return None
+  cutoff = (datetime.now(timezone.utc) - timedelta(seconds=JOB_LEASE_TTL_SECONDS)).isoformat()
   try:
-    # Calculate 7 days from now (local date, ignoring time for comparison)
-    seven_days_from_now = (datetime.now(timezone.utc) + timedelta(days=7)).date()
-    seven_days_from_now_str = seven_days_from_now.isoformat()
-
-    # Fetch events that are 7 days away and haven't had a 1-week reminder sent
-    resp = supabase.table("events")\
-      .select("id, user_id, company_id, title, date, time, location, description, event_tasks")\
-      .eq("date", seven_days_from_now_str)\
-      .is_("one_week_reminder_sent_at", None)\
-      .execute()
-    events_to_remind = resp.data
-
-    count_events = len(events_to_remind or [])
-    print(f"1-week reminder: {count_events} event(s) on {seven_days_from_now_str}", file=sys.stderr)
-    if not events_to_remind:
-      return
-
-    reminder_template = _get_email_template("event_1week_reminder")
-    if not reminder_template:
-      print("Warning: 'event_1week_reminder' email template not found.", file=sys.stderr)
-      return
+    rows = supabase.table("job_runs").select("*").eq("job_name", push_broadcast_job_id).eq("status", "running")\
+      .gte("updated_at", cutoff).order("started_at", desc=True).limit(1).execute().data or []
+    return rows[0] if rows else None
+  except Exception as e:
+    print(f"WARNING: could not check for a running push broadcast: {e}", file=sys.stderr)
+    return None
 
-    for event in events_to_remind:
-      try:
-        user_profile_resp = supabase.table("profiles").select("email, name, notifications").eq("id", event["user_id"]).single().execute()
-        user_profile = user_profile_resp.data
 
-        if not user_profile:
-          print(f"User profile not found for event {event['id']}. Skipping reminder.", file=sys.stderr)
+def _send_push_broadcast_job(run: "_JobRun", title: str, body: str, url: str) -> dict:
+  """
+  Sends one notification to every registered device whose user has notifications.push enabled.
+  Counters: events = devices scanned, sent / failed deliveries, skipped = opted out or unusable keys.
+  """
+  summary = run.summary
+  payload = _push_payload(title, body, url)
+  client = _get_push_client()
+  executor = _get_push_fanout_executor()
+  after: Optional[str] = None
+  started = time.monotonic()
+  try:
+    while True:
+      q = supabase.table("push_subscriptions").select(PUSH_SUBSCRIPTION_COLUMNS).order("endpoint").limit(PUSH_BROADCAST_PAGE_SIZE)
+      if after is not None:
+        q = q.gt("endpoint", after)
+      page = q.execute().data or []
+      summary["queries"] += 1
+      if not page:
+        break
+      after = page[-1]["endpoint"]
+      summary["events"] += len(page)
+      summary["pages"] += 1
+
+      profiles = _fetch_profiles_by_ids([r["user_id"] for r in page], "notifications", summary)
+      subs = []
+      for row in page:
+        notif = (profiles.get(str(row["user_id"])) or {}).get("notifications")
+        if not isinstance(row.get("subscription"), dict) or (isinstance(notif, dict) and notif.get("push") is False):
+          summary["skipped"] += 1
           continue
+        subs.append(row["subscription"])
+
+      encrypt_started = time.monotonic()
+      posts, delivered = [], []
+      for chunk, bodies in _encrypt_push_page(subs, payload):
+        for sub, encrypted in zip(chunk, bodies):
+          if encrypted is None:
+            summary["skipped"] += 1
+            continue
+          posts.append((sub["endpoint"], executor.submit(client.post, sub["endpoint"], encrypted)))
+      summary["encrypt_seconds"] += time.monotonic() - encrypt_started
+
+      send_started = time.monotonic()
+      for endpoint, fut in posts:
+        try:
+          fut.result()
+          summary["sent"] += 1
+          delivered.append(endpoint)
+        except Exception as e:
+          summary["failed"] += 1
+          run.error(f"{client.origin(endpoint)}: {e}")
+      summary["send_seconds"] += time.monotonic() - send_started
+      if delivered:
+        try:
+          supabase.table("push_subscriptions").update({"last_success_at": _utcnow_iso()}).in_("endpoint", delivered).execute()
+        except Exception as e:
+          print(f"Could not record push delivery timestamps: {e}", file=sys.stderr)
+
+      elapsed = time.monotonic() - started
+      summary["devices_per_second"] = round(summary["events"] / elapsed, 1) if elapsed else 0.0
+      run.checkpoint({"endpoint": after})
+      print(
+        f"Push broadcast {run.id}: {summary['events']} devices scanned, {summary['sent']} sent, "
+        f"{summary['failed']} failed ({summary['devices_per_second']}/s)",
+        file=sys.stderr,
+      )
+    client.flush_dead()
+    run.finish("completed")
+  except Exception as e:
+    run.error(e)
+    run.finish("failed")
+    print(f"ERROR: push broadcast {run.id} failed: {e}", file=sys.stderr)
+  return summary
 
-        user_email = user_profile.get("email")
-        user_name = user_profile.get("name") or (user_email.split('@')[0] if user_email else "there")
-        user_notifications = user_profile.get("notifications", {}) or {}
 
-        if not user_notifications.get("email_1week_countdown", False):
-          print(f"User {user_email} has 1-week countdown emails disabled. Skipping.", file=sys.stderr)
-          continue
+def _start_push_broadcast(title: str, body: str, url: str) -> "_JobRun":
+  """
+  Records the run and starts the broadcast on a background thread of this worker; the lease keeps a
+  second broadcast from starting elsewhere while it runs.
+  """
+  summary = {"events": 0, "sent": 0, "skipped": 0, "failed": 0, "send_seconds": 0.0, "encrypt_seconds": 0.0,
+             "pages": 0, "queries": 0, "title": title[:120]}
+  run = _JobRun(push_broadcast_job_id, summary)
+  run.start(None, None)
 
-        # Calculate task completion for the event (defensively)
-        event_tasks_raw = event.get("event_tasks")
-        event_tasks = _ensure_list_event_tasks(event_tasks_raw)
-        total_tasks = len(event_tasks)
-        completed_tasks = sum(1 for task in event_tasks if isinstance(task, dict) and task.get("completed"))
-        pending_tasks_count = total_tasks - completed_tasks
-        task_completion_percentage = f"{int((completed_tasks / total_tasks) * 100)}%" if total_tasks > 0 else "0%"
-
-        context = {
-          "user_name": user_name,
-          "event_title": event.get("title") or "",
-          "event_date": _fmt_event_date_display(event.get("date")),
-          "event_time": event.get("time") or "N/A",
-          "event_location": event.get("location") or "",
-          "event_description": event.get("description") or "",
-          "has_tasks": "true" if total_tasks > 0 else "",
-          "pending_tasks_count": pending_tasks_count,
-          "task_completion_percentage": task_completion_percentage,
-          "current_year": datetime.now().year,
-          "frontend_url": VITE_FRONTEND_URL,
-        }
-        rendered_html = _render_template(reminder_template["html_content"], context)
-        rendered_subject = _render_template(reminder_template["subject"], context)
-
-        if _send_email_via_maileroo(user_email, rendered_subject, rendered_html):
-          # Mark reminder as sent
-          supabase.table("events")\
-            .update({"one_week_reminder_sent_at": datetime.now(timezone.utc).isoformat()})\
-            .eq("id", event["id"])\
-            .execute()
-          print(f"Sent 1-week reminder for event {event['id']} to {user_email}", file=sys.stderr)
-        else:
-          print(f"Failed to send 1-week reminder for event {event['id']} to {user_email}", file=sys.stderr)
-      except Exception as inner_e:
-        print(f"Error processing event {event.get('id')}: {inner_e}", file=sys.stderr)
+  def _worker():
+    ran, _ = _run_job_exclusively(push_broadcast_job_id, _send_push_broadcast_job, run, title, body, url)
+    if not ran:
+      run.error("another push broadcast is running")
+      run.finish("abandoned")
+
+  threading.Thread(target=_worker, name="push-broadcast", daemon=True).start()
+  return run
 
-  except Exception as e:
-    print(f"Error in _send_1week_event_reminders_job: {e}", file=sys.stderr)
 
 @app.post("/api/admin/scheduler-control")
 @require_admin_email
@@ -963,25 +4723,89 @@ def scheduler_control():
 @require_admin_email
 def scheduler_status():
   job = scheduler.get_job(scheduler_job_id)
+  digest_job = scheduler.get_job(tz_bucket_job_id if TZ_BUCKET_DELIVERY else digest_job_id)
   status = {
     "is_running": scheduler.running,
     "job_scheduled": job is not None,
-    "next_run_time": job.next_run_time.isoformat() if job and job.next_run_time else None
+    "next_run_time": job.next_run_time.isoformat() if job and job.next_run_time else None,
+    "lease": _job_lease_status(scheduler_job_id),
+    "digest_job": {
+      "cadences": DIGEST_CADENCES,
+      "job_scheduled": digest_job is not None,
+      "next_run_time": digest_job.next_run_time.isoformat() if digest_job and digest_job.next_run_time else None,
+      "timezone_buckets": {"enabled": TZ_BUCKET_DELIVERY, "tick_minutes": TZ_BUCKET_TICK_MINUTES, "timezones": len(_load_timezone_buckets()) if supabase else 0},
+    },
   }
+  if TZ_BUCKET_DELIVERY:
+    # Bucket runs take one lease per UTC offset (digest_job_id@UTC±hh:mm), not digest_job_id's
+    buckets = status["digest_job"]["timezone_buckets"]
+    buckets["due_now"] = list(_due_timezone_bucket_jobs(_get_email_settings())) if supabase else []
+    buckets["leases"] = _held_job_leases(f"{digest_job_id}@")
+  else:
+    status["digest_job"]["lease"] = _job_lease_status(digest_job_id)
   return jsonify(status), 200
 
-# Initial scheduling when app starts
-if not scheduler.running:
-  scheduler.start()
-_schedule_daily_reminders_job()
+# Initial scheduling when app starts. Under `python app.py`, multiprocessing children (the push
+# encryption pool) re-import this script as __mp_main__; they must not start jobs of their own.
+# BACKGROUND_SERVICES=false imports the app without the scheduler or outbox workers (tests, one-off scripts).
+BACKGROUND_SERVICES = (os.environ.get("BACKGROUND_SERVICES", "true") or "true").lower() in ("1", "true", "yes")
+if __name__ != "__mp_main__" and BACKGROUND_SERVICES:
+  if not scheduler.running:
+    scheduler.start()
+  _schedule_daily_reminders_job()
+
+  # Drain anything left in the outbox by a previous run of this process
+  try:
+    _ensure_outbox_workers()
+  except Exception as e:
+    print(f"ERROR: Failed to start outbox workers: {e}", file=sys.stderr)
 
 # Manual (API-key protected) trigger for the 1-week reminder job (useful for testing/cron over HTTP)
 @app.post("/api/send-1week-event-reminders")
 @require_api_key
 def trigger_1week_event_reminders():
+  """
+  Runs the 1-week reminder job now. ?dry_run=1 only simulates it and returns a capacity report;
+  dry runs also accept multiplier (synthetic volume), workers (for the projection) and
+  date (YYYY-MM-DD, the UTC day of the events to simulate instead of the current window).
+  """
+  if request.args.get("dry_run", "").lower() in ("1", "true", "yes"):
+    try:
+      window = None
+      if request.args.get("date"):
+        day = dt_date.fromisoformat(request.args["date"])
+        window_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        window = (window_start, window_start + timedelta(days=1))
+      report = _simulate_1week_reminders(int(request.args.get("multiplier", "1")), window, int(request.args.get("workers", "1")))
+    except ValueError as e:
+      return jsonify({"message": f"Invalid dry-run parameter: {e}"}), 400
+    return jsonify({"message": "Dry run complete (nothing sent)", "report": report}), 200
   try:
-    _send_1week_event_reminders_job()
-    return jsonify({"message": "Triggered 1-week reminder job"}), 200
+    ran, summary = _scheduled_1week_event_reminders()
+    if not ran:
+      return jsonify({"message": "1-week reminder job is already running", "lease": _job_lease_status(scheduler_job_id)}), 409
+    return jsonify({"message": "Triggered 1-week reminder job", "summary": summary}), 200
+  except Exception as e:
+    return jsonify({"message": f"Failed to trigger: {e}"}), 500
+
+# Manual (API-key protected) trigger for the digest job
+@app.post("/api/send-event-digests")
+@require_api_key
+def trigger_event_digests():
+  try:
+    if TZ_BUCKET_DELIVERY:
+      # Same runs and leases as the tick job, so a manual trigger never repeats a bucket's local day
+      results = _run_due_timezone_bucket_digests(_get_email_settings())
+      if not results:
+        return jsonify({"message": "No time zone bucket is due", "buckets": {}}), 200
+      if not any(ran for ran, _ in results.values()):
+        return jsonify({"message": "Digest jobs are already running", "leases": [_job_lease_status(name) for name in results]}), 409
+      buckets = {name: summary if ran else {"message": "already running"} for name, (ran, summary) in results.items()}
+      return jsonify({"message": "Triggered digest jobs for the due time zone buckets", "buckets": buckets}), 200
+    ran, summary = _run_job_exclusively(digest_job_id, _send_event_digests_job)
+    if not ran:
+      return jsonify({"message": "Digest job is already running", "lease": _job_lease_status(digest_job_id)}), 409
+    return jsonify({"message": "Triggered digest job", "summary": summary}), 200
   except Exception as e:
     return jsonify({"message": f"Failed to trigger: {e}"}), 500
 
@@ -1026,6 +4850,7 @@ def update_email_settings_admin():
 
   try:
     supabase.table("email_settings").update(updates).eq("id", settings_id).execute()
+    _invalidate_email_settings()
     refetch = supabase.table("email_settings").select("*").eq("id", settings_id).single().execute()
     _schedule_daily_reminders_job()  # Re-schedule if settings changed
     return jsonify({"message": "Email settings updated", "settings": refetch.data}), 200
@@ -1144,8 +4969,7 @@ def send_test_email_admin():
     "current_year": datetime.now().year,
     "frontend_url": VITE_FRONTEND_URL,
   }
-  rendered_html = _render_template(test_template["html_content"], context)
-  rendered_subject = _render_template(test_template["subject"], context)
+  rendered_subject, rendered_html = _render_email_template(test_template, context)
 
   if _send_email_via_maileroo(recipient_email, f"[TEST] {rendered_subject}", rendered_html):
     return jsonify({"message": "Test email sent successfully"}), 200
@@ -1153,6 +4977,79 @@ def send_test_email_admin():
     # _send_email_via_maileroo already logs the error
     return jsonify({"message": "Failed to send test email. Check backend logs for details."}), 500
 
+@app.post("/api/admin/send-test-push")
+@require_admin_email
+def send_test_push_admin():
+  """
+  Sends a push notification to every registered device of one user.
+  Body: { recipient_email, title?, body?, url? }
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase not configured"}), 500
+  body = request.get_json(force=True, silent=True) or {}
+  recipient_email = (body.get("recipient_email") or "").strip().lower()
+  if not recipient_email:
+    return jsonify({"message": "Recipient email is required"}), 400
+  if not VAPID_PRIVATE_KEY:
+    return jsonify({"message": "VAPID private key not configured"}), 500
+  try:
+    rows = supabase.table("profiles").select("id").eq("email", recipient_email).limit(1).execute().data or []
+  except Exception as e:
+    print(f"send_test_push profile lookup error: {e}", file=sys.stderr)
+    return jsonify({"message": "Failed to look up recipient"}), 500
+  if not rows:
+    return jsonify({"message": f"No user with email {recipient_email}"}), 404
+
+  result = _send_push_to_user(
+    rows[0]["id"],
+    f"[TEST] {body.get('title') or 'DayClap test notification'}",
+    body.get("body") or "Push notifications are working.",
+    body.get("url") or VITE_FRONTEND_URL,
+  )
+  if not result["devices"]:
+    return jsonify({"message": "Recipient has no registered push subscription", **result}), 404
+  if not result["sent"]:
+    return jsonify({"message": "Failed to deliver the test push. Check backend logs for details.", **result}), 502
+  return jsonify({"message": f"Test push sent to {result['sent']} of {result['devices']} device(s)", **result}), 200
+
+
+@app.post("/api/admin/push-broadcast")
+@require_admin_email
+def push_broadcast_admin():
+  """
+  Broadcasts a push notification (e.g. an outage notice) to every subscribed device. Runs in the background;
+  poll GET /api/admin/push-broadcast/<run_id> for progress and throughput.
+  Body: { title, body, url? }
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase not configured"}), 500
+  if not VAPID_PRIVATE_KEY:
+    return jsonify({"message": "VAPID private key not configured"}), 500
+  body = request.get_json(force=True, silent=True) or {}
+  title, text = (body.get("title") or "").strip(), (body.get("body") or "").strip()
+  if not title or not text:
+    return jsonify({"message": "title and body are required"}), 400
+  active = _push_broadcast_active()
+  if active:
+    return jsonify({"message": "A push broadcast is already running", "run": _job_run_view(active)}), 409
+  run = _start_push_broadcast(title, text, body.get("url") or VITE_FRONTEND_URL)
+  return jsonify({"message": "Push broadcast started", "run_id": run.id}), 202
+
+
+@app.get("/api/admin/push-broadcast/<run_id>")
+@require_admin_email
+def push_broadcast_status_admin(run_id):
+  if not supabase:
+    return jsonify({"message": "Supabase not configured"}), 500
+  try:
+    rows = supabase.table("job_runs").select("*").eq("id", run_id).eq("job_name", push_broadcast_job_id).limit(1).execute().data or []
+  except Exception as e:
+    print(f"Error reading push broadcast {run_id}: {e}", file=sys.stderr)
+    return jsonify({"message": "Failed to read push broadcast"}), 500
+  if not rows:
+    return jsonify({"message": "Push broadcast not found"}), 404
+  return jsonify(_job_run_view(rows[0])), 200
+
 # -----------------------------------------------------------------------------
 # Admin Diagnostics (read-only)
 # -----------------------------------------------------------------------------
@@ -1184,10 +5081,83 @@ def diagnostics():
       },
     },
     "admin_emails_count": len(_get_allowed_admin_emails() or []),
+    "auth": _auth_cache_stats(),
+    "profile_cache": _profile_cache_stats(),
+    "email_settings_cache": _email_settings_cache_stats(),
+    "template_cache": _compiled_template_cache.stats(),
+    "maileroo_http": _maileroo_http_stats(),
+    "push": _get_push_client().stats(),
+    "rate_limits": _get_rate_limiter().stats(),
   }
   return jsonify(di), 200
 
 
+@app.get("/api/admin/outbox")
+@require_admin_email
+def outbox_status_admin():
+  """
+  Outbox health: queue depth by status, age of the oldest undelivered message,
+  delivery throughput over the last 1m/5m/1h and a sample of recent errors.
+  """
+  try:
+    return jsonify(_outbox_stats()), 200
+  except Exception as e:
+    print(f"Error reading outbox stats: {e}", file=sys.stderr)
+    return jsonify({"message": "Failed to read outbox stats"}), 500
+
+
+@app.get("/api/admin/job-runs")
+@require_admin_email
+def job_runs_admin():
+  """
+  Recent scheduled job runs (newest first) with throughput and send-latency percentiles.
+  Query params: job (e.g. daily_event_reminders), status, limit.
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase not configured"}), 500
+  try:
+    limit = max(1, min(int(request.args.get("limit", "20")), JOB_RUN_HISTORY_LIMIT))
+  except ValueError:
+    return jsonify({"message": "limit must be an integer"}), 400
+  try:
+    q = supabase.table("job_runs").select("*")
+    if request.args.get("job"):
+      q = q.eq("job_name", request.args["job"])
+    if request.args.get("status"):
+      q = q.eq("status", request.args["status"])
+    rows = q.order("started_at", desc=True).limit(limit).execute().data or []
+    return jsonify({"runs": [_job_run_view(r) for r in rows]}), 200
+  except Exception as e:
+    print(f"Error reading job runs: {e}", file=sys.stderr)
+    return jsonify({"message": "Failed to read job runs"}), 500
+
+
+@app.get("/api/admin/job-runs/report")
+@require_admin_email
+def job_runs_report_admin():
+  """
+  Aggregated completion report for one group of runs (all shards of a sharded sweep).
+  Query params: job (default: the sharded 1-week reminder job), group_key (default: the latest one).
+  """
+  if not supabase:
+    return jsonify({"message": "Supabase not configured"}), 500
+  job_name = request.args.get("job") or f"{scheduler_job_id}#shard"
+  try:
+    group_key = request.args.get("group_key")
+    if not group_key:
+      latest = supabase.table("job_runs").select("group_key").eq("job_name", job_name).not_.is_("group_key", None)\
+        .order("started_at", desc=True).limit(1).execute().data or []
+      if not latest:
+        return jsonify({"message": f"No grouped runs for '{job_name}'"}), 404
+      group_key = latest[0]["group_key"]
+    rows = supabase.table("job_runs").select("*").eq("job_name", job_name).eq("group_key", group_key)\
+      .order("started_at").execute().data or []
+    return jsonify({"job": job_name, **_aggregate_job_runs(rows)}), 200
+  except Exception as e:
+    print(f"Error building job run report: {e}", file=sys.stderr)
+    return jsonify({"message": "Failed to build job run report"}), 500
+
+
 # NEW: Admin route to list all registered API routes (for diagnostics)
 @app.get("/api/admin/routes")
 @require_admin_email
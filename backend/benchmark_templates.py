@@ -0,0 +1,172 @@
+"""
+Benchmark: compiled single-pass template engine vs. the previous multi-pass regex renderer.
+
+Uses the real templates seeded in supabase_schema.sql (or the live email_templates table with --from-db)
+and the same context shapes the backend builds for each template. Imports only template_engine, not the
+backend app, so running it starts no scheduler, outbox workers or database connections.
+
+Usage:
+  python benchmark_templates.py [--iterations 2000] [--from-db]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import template_engine
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "supabase_schema.sql")
+
+CONTEXTS = {
+  "welcome_email": {
+    "user_name": "Test User",
+    "current_year": datetime.now().year,
+    "frontend_url": "https://dayclap.com",
+  },
+  "invitation_to_company": {
+    "sender_email": "owner@example.com",
+    "company_name": "Acme Inc",
+    "role": "Admin",
+    "current_year": datetime.now().year,
+    "frontend_url": "https://dayclap.com",
+  },
+  "task_assigned": {
+    "assignee_name": "Sam",
+    "assigned_by_name": "Alex",
+    "assigned_by_email": "alex@example.com",
+    "event_title": "Quarterly planning",
+    "event_date": "2026-10-24",
+    "event_time": "10:00",
+    "company_name": "Acme Inc",
+    "task_title": "Prepare slides",
+    "task_description": "Cover Q3 metrics and Q4 goals",
+    "due_date": "",
+    "current_year": datetime.now().year,
+    "frontend_url": "https://dayclap.com",
+  },
+  "event_1week_reminder": {
+    "user_name": "Sam",
+    "event_title": "Quarterly planning",
+    "event_date": "October 24, 2026",
+    "event_time": "10:00",
+    "event_location": "Room 4",
+    "event_description": "",
+    "has_tasks": "true",
+    "pending_tasks_count": 3,
+    "task_completion_percentage": "40%",
+    "current_year": datetime.now().year,
+    "frontend_url": "https://dayclap.com",
+  },
+}
+
+
+def legacy_render_template(html_content: str, context: dict) -> str:
+  """
+  The renderer used before the compiled engine (kept here verbatim for comparison).
+  """
+  content = html_content
+
+  def replace_ternary(match):
+    key, true_val, false_val = match.groups()
+    return true_val if context.get(key) else false_val
+
+  ternary_regex = re.compile(r'\{\{\s*([a-zA-Z0-9_]+)\s*\?\s*\'(.*?)\'\s*:\s*\'(.*?)\'\s*\}\}')
+  content = ternary_regex.sub(replace_ternary, content)
+
+  def replace_if_block(match):
+    key, inner_content = match.groups()
+    return inner_content if context.get(key) else ''
+
+  if_block_regex = re.compile(r'\{\{\s*#if\s*([a-zA-Z0-9_]+)\s*\}\}(.*?)\{\{\s*/if\s*\}\}', re.DOTALL)
+  for _ in range(5):
+    new_content = if_block_regex.sub(replace_if_block, content)
+    if new_content == content:
+      break
+    content = new_content
+
+  for key, value in context.items():
+    placeholder = f"{{{{ {key} }}}}"
+    content = content.replace(placeholder, str(value or ''))
+
+  return content
+
+
+def load_templates_from_schema(path: str) -> list:
+  with open(path, encoding="utf-8") as f:
+    sql = f.read()
+  rx = re.compile(r"INSERT INTO email_templates \(name, subject, html_content\)\s*SELECT '([^']+)', '((?:[^']|'')*)',\s*\$\$(.*?)\$\$", re.DOTALL)
+  return [
+    {"name": name, "subject": subject.replace("''", "'"), "html_content": body, "updated_at": "schema"}
+    for name, subject, body in rx.findall(sql)
+  ]
+
+
+def load_templates_from_db() -> list:
+  from dotenv import load_dotenv
+  from supabase import create_client
+
+  load_dotenv()
+  url = os.environ.get("SUPABASE_URL") or os.environ.get("VITE_SUPABASE_URL")
+  key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("VITE_SUPABASE_SERVICE_ROLE_KEY")
+  if not url or not key:
+    sys.exit("Supabase client not configured (SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY).")
+  return create_client(url, key).table("email_templates").select("*").execute().data or []
+
+
+def _time_it(fn, iterations: int) -> float:
+  start = time.perf_counter()
+  for _ in range(iterations):
+    fn()
+  return time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--iterations", type=int, default=2000)
+  parser.add_argument("--from-db", action="store_true", help="benchmark the live email_templates rows")
+  args = parser.parse_args()
+
+  templates = load_templates_from_db() if args.from_db else load_templates_from_schema(SCHEMA_PATH)
+  if not templates:
+    sys.exit("No templates found.")
+
+  print(f"{'template':<24}{'bytes':>8}{'legacy ms':>12}{'compiled ms':>13}{'speedup':>9}  same")
+  total_legacy = total_compiled = 0.0
+  for tpl in templates:
+    ctx = CONTEXTS.get(tpl["name"], CONTEXTS["welcome_email"])
+
+    def legacy():
+      legacy_render_template(tpl["html_content"], ctx)
+      legacy_render_template(tpl["subject"], ctx)
+
+    # The backend compiles each template once and caches it, so only rendering is timed
+    subject_tpl = template_engine.CompiledTemplate(tpl["subject"])
+    html_tpl = template_engine.CompiledTemplate(tpl["html_content"])
+
+    def compiled():
+      subject_tpl.render(ctx)
+      html_tpl.render(ctx)
+
+    same = (
+      legacy_render_template(tpl["subject"], ctx),
+      legacy_render_template(tpl["html_content"], ctx),
+    ) == (subject_tpl.render(ctx), html_tpl.render(ctx))
+
+    t_legacy = _time_it(legacy, args.iterations)
+    t_compiled = _time_it(compiled, args.iterations)
+    total_legacy += t_legacy
+    total_compiled += t_compiled
+    print(
+      f"{tpl['name'][:23]:<24}{len(tpl['html_content']):>8}"
+      f"{t_legacy / args.iterations * 1000:>12.4f}{t_compiled / args.iterations * 1000:>13.4f}"
+      f"{(t_legacy / t_compiled if t_compiled else 0):>8.1f}x  {'yes' if same else 'NO'}"
+    )
+
+  print(f"\nTotal over {args.iterations} renders/template: legacy {total_legacy:.3f}s, compiled {total_compiled:.3f}s "
+        f"({(total_legacy / total_compiled if total_compiled else 0):.1f}x)")
+
+
+if __name__ == "__main__":
+  main()
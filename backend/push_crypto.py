@@ -0,0 +1,33 @@
+"""
+Web Push payload encryption (RFC 8291, aes128gcm content encoding).
+
+Encryption does an ephemeral ECDH key agreement plus AES-GCM per subscription, so it is CPU-bound.
+It lives in its own module so the backend's broadcast process pool can run it in worker processes
+that import only pywebpush, not the Flask app (and its scheduler) in app.py.
+"""
+from typing import List, Optional
+
+from pywebpush import WebPusher
+
+CONTENT_ENCODING = "aes128gcm"
+
+
+def encrypt_payload(subscription_info: dict, data: str) -> bytes:
+  """
+  Encrypts data for one subscription ({"endpoint", "keys": {"p256dh", "auth"}}).
+  Raises WebPushException (or ValueError) for malformed subscription keys.
+  """
+  return bytes(WebPusher(subscription_info).encode(data, CONTENT_ENCODING)["body"])
+
+
+def encrypt_payloads(subscriptions: List[dict], data: str) -> List[Optional[bytes]]:
+  """
+  Encrypts data for each subscription, in order; None where a subscription's keys are unusable.
+  """
+  out: List[Optional[bytes]] = []
+  for sub in subscriptions:
+    try:
+      out.append(encrypt_payload(sub, data))
+    except Exception:
+      out.append(None)
+  return out
@@ -0,0 +1,96 @@
+"""
+Email template engine: templates are parsed once into a segment tree and rendered in a single pass.
+
+Supported tags (the same set, and the same spacing rules, as the original multi-pass renderer):
+  {{#if key}} ... {{/if}}              conditional block (nestable)
+  {{ key ? 'if_true' : 'if_false' }}   ternary
+  {{ key }}                            variable: exactly one space inside each brace pair
+
+This module has no side effects on import (no app, scheduler or database), so tools such as
+benchmark_templates.py can use it without starting the backend.
+"""
+import re
+
+# One tokenizer for every tag. Variables keep the old renderer's literal "{{ key }}" placeholder form, so
+# "{{key}}" or "{{  key  }}" stay untouched (as do unknown variables such as Supabase's {{ .Token }}).
+TAG_RE = re.compile(
+  r"\{\{(?:"
+  r"\s*#if\s*(?P<if_key>[a-zA-Z0-9_]+)\s*"
+  r"|\s*(?P<endif>/if)\s*"
+  r"|\s*(?P<tern_key>[a-zA-Z0-9_]+)\s*\?\s*'(?P<tern_true>[^\n]*?)'\s*:\s*'(?P<tern_false>[^\n]*?)'\s*"
+  r"| (?P<var_key>[a-zA-Z0-9_]+) "
+  r")\}\}"
+)
+
+
+class CompiledTemplate:
+  """
+  A template parsed once into a segment tree and rendered in a single linear pass.
+  Segments are tuples: ("text", str) | ("var", key, raw_tag) | ("if", key, children) | ("ternary", key, true_children, false_children).
+  Unknown variables are left untouched (e.g. Supabase's {{ .Token }}), matching the old multi-pass renderer.
+  """
+  __slots__ = ("segments", "source_len")
+
+  def __init__(self, source: str):
+    self.source_len = len(source or "")
+    self.segments = self._parse(source or "")
+
+  @staticmethod
+  def _parse(source: str) -> list:
+    root: list = []
+    stack = [(None, None, root)]  # (if_key, raw_open_tag, children)
+    pos = 0
+    for m in TAG_RE.finditer(source):
+      if m.start() > pos:
+        stack[-1][2].append(("text", source[pos:m.start()]))
+      pos = m.end()
+      if m.group("if_key"):
+        children: list = []
+        stack[-1][2].append(("if", m.group("if_key"), children))
+        stack.append((m.group("if_key"), m.group(0), children))
+      elif m.group("endif"):
+        if len(stack) > 1:
+          stack.pop()
+        else:
+          stack[-1][2].append(("text", m.group(0)))  # stray {{/if}} is kept verbatim
+      elif m.group("tern_key"):
+        stack[-1][2].append((
+          "ternary",
+          m.group("tern_key"),
+          CompiledTemplate._parse(m.group("tern_true")),
+          CompiledTemplate._parse(m.group("tern_false")),
+        ))
+      else:
+        stack[-1][2].append(("var", m.group("var_key"), m.group(0)))
+    if pos < len(source):
+      stack[-1][2].append(("text", source[pos:]))
+
+    # Unclosed {{#if}}: emit the opening tag literally and splice its children back into the parent
+    while len(stack) > 1:
+      _key, raw_open, children = stack.pop()
+      parent = stack[-1][2]
+      idx = next(i for i in range(len(parent) - 1, -1, -1) if parent[i][0] == "if" and parent[i][2] is children)
+      parent[idx:idx + 1] = [("text", raw_open)] + children
+    return root
+
+  def render(self, context: dict) -> str:
+    out: list = []
+    self._render_into(self.segments, context, out)
+    return "".join(out)
+
+  @classmethod
+  def _render_into(cls, segments: list, context: dict, out: list) -> None:
+    for seg in segments:
+      kind = seg[0]
+      if kind == "text":
+        out.append(seg[1])
+      elif kind == "var":
+        if seg[1] in context:
+          out.append(str(context[seg[1]] or ""))
+        else:
+          out.append(seg[2])
+      elif kind == "if":
+        if context.get(seg[1]):
+          cls._render_into(seg[2], context, out)
+      else:
+        cls._render_into(seg[2] if context.get(seg[1]) else seg[3], context, out)
@@ -0,0 +1,318 @@
+"""
+Shared fixtures for the backend tests.
+
+app.py reads its configuration when it is imported, so the environment is prepared here first:
+background services stay off, the outbox and rate-limit SQLite files go to a temporary directory
+and no Supabase client is created. Tests that touch the database get FakeSupabase, an in-memory stand-in for the subset of
+the supabase-py query builder the backend uses.
+"""
+import base64
+import copy
+import os
+import re
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_STATE_DIR = tempfile.mkdtemp(prefix="dayclap-tests-")
+os.environ["OUTBOX_DB_PATH"] = os.path.join(_STATE_DIR, "outbox.sqlite3")
+os.environ["RATE_LIMIT_DB_PATH"] = os.path.join(_STATE_DIR, "rate_limits.sqlite3")
+os.environ["RATE_LIMIT_BACKEND"] = "sqlite"
+os.environ["BACKGROUND_SERVICES"] = "false"  # no scheduler or outbox threads racing the tests
+for _name in ("SUPABASE_URL", "VITE_SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "VITE_SUPABASE_SERVICE_ROLE_KEY", "MAILEROO_API_KEY"):
+  os.environ[_name] = ""
+
+import app  # noqa: E402  (must come after the environment above)
+
+
+def pytest_sessionfinish(session, exitstatus):
+  shutil.rmtree(_STATE_DIR, ignore_errors=True)
+
+
+class FakeResponse:
+  def __init__(self, data):
+    self.data = data
+
+
+_KEYSET_OR_RE = re.compile(r'(\w+)\.gt\."([^"]+)",and\(\1\.eq\."\2",(\w+)\.gt\.(.+)\)$')
+
+
+class FakeQuery:
+  def __init__(self, db: "FakeSupabase", table: str):
+    self.db = db
+    self.table = table
+    self.op = "select"
+    self.columns = "*"
+    self.payload = None
+    self.filters = []
+    self.ordering = []
+    self.row_limit = None
+    self.single_row = False
+
+  def select(self, columns="*", **kwargs):
+    self.columns = columns
+    return self
+
+  def _where(self, fn):
+    self.filters.append(fn)
+    return self
+
+  def eq(self, key, value):
+    return self._where(lambda r: str(r.get(key)) == str(value))
+
+  def neq(self, key, value):
+    return self._where(lambda r: str(r.get(key)) != str(value))
+
+  def in_(self, key, values):
+    values = {str(v) for v in values}
+    return self._where(lambda r: str(r.get(key)) in values)
+
+  def is_(self, key, value):
+    if value in (None, "null"):
+      return self._where(lambda r: r.get(key) is None)
+    return self._where(lambda r: r.get(key) is not None)
+
+  def gte(self, key, value):
+    return self._where(lambda r: r.get(key) is not None and str(r.get(key)) >= str(value))
+
+  def gt(self, key, value):
+    return self._where(lambda r: r.get(key) is not None and str(r.get(key)) > str(value))
+
+  def lt(self, key, value):
+    return self._where(lambda r: r.get(key) is not None and str(r.get(key)) < str(value))
+
+  def lte(self, key, value):
+    return self._where(lambda r: r.get(key) is not None and str(r.get(key)) <= str(value))
+
+  def like(self, key, pattern):
+    regex = re.compile("^" + ".*".join(re.escape(part) for part in pattern.split("%")) + "$", re.S)
+    return self._where(lambda r: r.get(key) is not None and regex.match(str(r.get(key))) is not None)
+
+  def or_(self, expr):
+    # Only the keyset form the backend builds: a.gt."x",and(a.eq."x",b.gt.y)
+    m = _KEYSET_OR_RE.match(expr)
+    if not m:
+      raise NotImplementedError(f"FakeSupabase: unsupported or_ filter {expr}")
+    k1, v1, k2, v2 = m.groups()
+    return self._where(lambda r: (str(r.get(k1)), str(r.get(k2))) > (v1, v2))
+
+  def order(self, key, desc=False):
+    self.ordering.append((key, desc))
+    return self
+
+  def limit(self, n):
+    self.row_limit = n
+    return self
+
+  def single(self):
+    self.single_row = True
+    return self
+
+  maybe_single = single
+
+  def update(self, payload):
+    self.op, self.payload = "update", payload
+    return self
+
+  def insert(self, payload):
+    self.op, self.payload = "insert", payload
+    return self
+
+  def upsert(self, payload, **kwargs):
+    self.op, self.payload = "upsert", payload
+    return self
+
+  def delete(self):
+    self.op = "delete"
+    return self
+
+  def execute(self):
+    self.db.log.append((self.op, self.table))
+    error = self.db.fail.get((self.op, self.table))
+    if error:
+      raise error
+    if self.table in self.db.views:
+      source = self.db.views[self.table](self.db)
+    else:
+      source = self.db.tables.setdefault(self.table, [])
+    rows = [r for r in source if all(f(r) for f in self.filters)]
+    if self.op == "select":
+      for key, desc in reversed(self.ordering):
+        rows = sorted(rows, key=lambda r: str(r.get(key)), reverse=desc)
+      if self.row_limit is not None:
+        rows = rows[:self.row_limit]
+      if self.columns != "*":
+        columns = [c.strip() for c in self.columns.split(",")]
+        rows = [{c: r.get(c) for c in columns} for r in rows]
+      rows = copy.deepcopy(rows)
+      if self.single_row:
+        return FakeResponse(rows[0] if rows else None)
+      return FakeResponse(rows)
+    if self.op == "update":
+      for r in rows:
+        r.update(copy.deepcopy(self.payload))
+      return FakeResponse(copy.deepcopy(rows))
+    if self.op in ("insert", "upsert"):
+      items = self.payload if isinstance(self.payload, list) else [self.payload]
+      out = []
+      for item in items:
+        item = dict(item)
+        item.setdefault("id", str(uuid.uuid4()))
+        self.db.tables.setdefault(self.table, []).append(item)
+        out.append(copy.deepcopy(item))
+      return FakeResponse(out)
+    self.db.tables[self.table] = [r for r in source if r not in rows]
+    return FakeResponse(rows)
+
+
+class FakeRpc:
+  def __init__(self, db: "FakeSupabase", name: str, params: dict):
+    self.db, self.name, self.params = db, name, params
+
+  def execute(self):
+    self.db.log.append(("rpc", self.name))
+    fn = self.db.rpcs.get(self.name)
+    if fn is None:
+      raise Exception(f"function {self.name} does not exist")
+    return FakeResponse(fn(self.params))
+
+
+class FakeSupabase:
+  """
+  tables: {name: [row, ...]}; views: {name: fn(db) -> rows}; rpcs: {name: fn(params) -> data};
+  fail: {(op, table): exception} makes that operation raise; log records (op, table) per call.
+  """
+  def __init__(self):
+    self.tables = {}
+    self.views = {}
+    self.rpcs = {}
+    self.fail = {}
+    self.log = []
+
+  def table(self, name):
+    return FakeQuery(self, name)
+
+  def rpc(self, name, params=None):
+    return FakeRpc(self, name, params or {})
+
+  def calls(self, op, table):
+    return sum(1 for entry in self.log if entry == (op, table))
+
+
+@pytest.fixture
+def sb(monkeypatch):
+  db = FakeSupabase()
+  monkeypatch.setattr(app, "supabase", db)
+  app._profile_cache.clear()
+  return db
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+  """
+  A fresh per-process rate limiter, so counters never carry over between tests.
+  """
+  fresh = app._RateLimiter(app._MemoryRateLimitStore())
+  monkeypatch.setattr(app, "_rate_limiter", fresh)
+  monkeypatch.setattr(app, "RATE_LIMIT_ENABLED", True)
+  return fresh
+
+
+@pytest.fixture
+def client():
+  app.app.config["TESTING"] = True
+  return app.app.test_client()
+
+
+@pytest.fixture
+def reminder_db(sb, monkeypatch):
+  """
+  sb prepared for the 1-week reminder job in sweep mode: the invitation template, the candidates view
+  over sb.tables["events"] and a scheduler-enabled settings snapshot. Emails are recorded in sb.sent
+  instead of going to Maileroo. Add rows with add_reminder_event() and add_reminder_profile().
+  """
+  monkeypatch.setattr(app, "REMINDER_SWEEP_INTERVAL_MINUTES", 5)
+  monkeypatch.setattr(app, "_reminder_view_retry_at", 0.0)
+  monkeypatch.setattr(app, "_get_email_settings", lambda: {"scheduler_enabled": True})
+  sb.tables["events"] = []
+  sb.tables["profiles"] = []
+  sb.tables["email_templates"] = [{"name": "event_1week_reminder", "subject": "{{ event_title }}", "html_content": "<p>{{ event_title }}</p>"}]
+  sb.views[app.REMINDER_CANDIDATES_VIEW] = lambda db: [dict(e, total_tasks=0, completed_tasks=0) for e in db.tables["events"]]
+  sb.sent = []
+
+  def dispatch(messages, settings=None, latencies=None):
+    sb.sent.extend(m["to"] for m in messages)
+    return [(m, True, None) for m in messages]
+
+  monkeypatch.setattr(app, "_dispatch_emails", dispatch)
+  return sb
+
+
+def add_reminder_profile(db, user_id, **notifications):
+  db.tables["profiles"].append({
+    "id": user_id, "email": f"{user_id}@example.com", "name": user_id,
+    "notifications": notifications or {"email_1week_countdown": True},
+  })
+
+
+def add_reminder_event(db, event_id, user_id, due_in=timedelta(minutes=-30)):
+  """
+  An event whose 1-week reminder became due `due_in` from now (negative: already due).
+  """
+  at = datetime.now(timezone.utc) + app.REMINDER_LEAD + due_in
+  db.tables["events"].append({"id": event_id, "user_id": user_id, "title": event_id, "event_datetime": at.isoformat(), "one_week_reminder_sent_at": None})
+
+
+def make_subscription(endpoint):
+  """
+  A Web Push subscription with real keys, so payloads can be encrypted for it.
+  """
+  from cryptography.hazmat.primitives import serialization
+  from cryptography.hazmat.primitives.asymmetric import ec
+
+  key = ec.generate_private_key(ec.SECP256R1())
+  public = key.public_key().public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+  b64 = lambda raw: base64.urlsafe_b64encode(raw).decode().rstrip("=")
+  return {"endpoint": endpoint, "keys": {"p256dh": b64(public), "auth": b64(os.urandom(16))}}
+
+
+class FakePushResponse:
+  def __init__(self, status_code):
+    self.status_code = status_code
+    self.reason = "Gone" if status_code in (404, 410) else ""
+    self.text = ""
+    self.headers = {}
+
+
+@pytest.fixture
+def push_service(monkeypatch, tmp_path):
+  """
+  A fresh _PushClient with a throwaway VAPID key whose HTTP sessions record posts instead of sending
+  them. Set push_service.status[endpoint] to answer an endpoint with another status than 201.
+  """
+  from cryptography.hazmat.primitives import serialization
+  from cryptography.hazmat.primitives.asymmetric import ec
+
+  key_file = tmp_path / "vapid_private.pem"
+  key_file.write_bytes(ec.generate_private_key(ec.SECP256R1()).private_bytes(
+    serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+  monkeypatch.setattr(app, "VAPID_PRIVATE_KEY", str(key_file))
+  client = app._PushClient()
+  monkeypatch.setattr(app, "_push_client", client)
+  client.posts = []
+  client.status = {}
+
+  class Session:
+    def post(self, endpoint, data=None, headers=None, timeout=None):
+      client.posts.append((endpoint, headers))
+      return FakePushResponse(client.status.get(endpoint, 201))
+
+  monkeypatch.setattr(client, "session", lambda origin: Session())
+  return client
@@ -0,0 +1,75 @@
+import time
+
+import jwt
+import pytest
+
+import app
+
+SECRET = "test-secret-with-enough-length-for-hs256"
+
+
+@pytest.fixture
+def local_auth(monkeypatch):
+  monkeypatch.setattr(app, "AUTH_VERIFY_MODE", "local")
+  monkeypatch.setattr(app, "SUPABASE_JWT_SECRET", SECRET)
+  monkeypatch.setattr(app, "SUPABASE_JWKS_URL", "")
+  monkeypatch.setattr(app, "_jwks_client", None)
+  monkeypatch.setattr(app, "_auth_token_cache", app._TTLCache(maxsize=16, ttl=300))
+  remote = []
+  monkeypatch.setattr(app, "_get_user_from_token_remote", lambda token: remote.append(token) or ("remote-user", "r@example.com", {}))
+  return remote
+
+
+def token(secret=SECRET, expires_in=3600, **claims):
+  payload = {"sub": "user-1", "email": "u@example.com", "aud": "authenticated", "exp": int(time.time()) + expires_in, **claims}
+  return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def test_valid_token_is_verified_locally_and_cached(local_auth, monkeypatch):
+  t = token()
+  uid, email, claims = app.get_user_from_token(t)
+  assert (uid, email) == ("user-1", "u@example.com")
+  monkeypatch.setattr(app, "_verify_token_locally", lambda token: pytest.fail("cached identity not used"))
+  assert app.get_user_from_token(t)[0] == "user-1"
+  assert local_auth == []
+
+
+@pytest.mark.parametrize("bad", [
+  token(secret="another-secret-of-sufficient-length!!"),
+  token(expires_in=-3600),
+  token(aud="anon"),
+  "not.a.jwt",
+])
+def test_bad_tokens_are_rejected_without_asking_supabase(local_auth, bad):
+  assert app.get_user_from_token(bad) == (None, None, None)
+  assert local_auth == []
+
+
+def test_falls_back_to_supabase_without_a_verification_key(local_auth, monkeypatch):
+  monkeypatch.setattr(app, "SUPABASE_JWT_SECRET", None)
+  assert app.get_user_from_token(token())[0] == "remote-user"
+  assert len(local_auth) == 1
+
+
+def test_cached_identities_never_outlive_the_token(local_auth):
+  t = token(expires_in=2)
+  app.get_user_from_token(t)
+  (expires_at, _), = app._auth_token_cache._data.values()
+  assert expires_at - time.monotonic() <= 2
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used(monkeypatch):
+  clock = [100.0]
+  monkeypatch.setattr(app.time, "monotonic", lambda: clock[0])
+  cache = app._TTLCache(maxsize=2, ttl=10)
+  cache.set("a", 1)
+  cache.set("b", 2)
+  assert cache.get("a") == 1
+  cache.set("c", 3)  # evicts b, the least recently used
+  assert cache.get("b") is None and cache.evictions == 1
+  cache.set("d", 4, ttl=60)  # capped at the cache's own ttl
+  clock[0] += 10
+  assert cache.get("a") is None and cache.get("d") is None
+  cache.set("e", 5, ttl=0)
+  assert cache.get("e") is None
+  assert cache.stats()["hits"] == 1
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app
+from conftest import add_reminder_event, add_reminder_profile
+
+ALL_CADENCES = ["email_daily", "email_weekly", "email_monthly", "email_3day_countdown", "email_1week_countdown"]
+
+
+def test_digests_are_opt_in(monkeypatch):
+  monkeypatch.setattr(app, "DIGEST_CADENCES", [])
+  assert app._digest_windows(datetime(2024, 4, 1, 2, tzinfo=timezone.utc)) == {}
+
+
+def test_digest_windows_on_a_monday_the_first(monkeypatch):
+  monkeypatch.setattr(app, "DIGEST_CADENCES", ALL_CADENCES)
+  now = datetime(2024, 4, 1, 2, 0, tzinfo=timezone.utc)  # a Monday
+  windows = app._digest_windows(now)
+  assert windows["email_daily"] == (now, datetime(2024, 4, 2, tzinfo=timezone.utc), "2024-04-01")
+  assert windows["email_weekly"] == (now, datetime(2024, 4, 8, tzinfo=timezone.utc), "2024-W14")
+  assert windows["email_monthly"] == (now, datetime(2024, 5, 1, tzinfo=timezone.utc), "2024-04")
+  assert windows["email_3day_countdown"] == (datetime(2024, 4, 4, tzinfo=timezone.utc), datetime(2024, 4, 5, tzinfo=timezone.utc), "2024-04-04")
+  assert windows["email_1week_countdown"][2] == "2024-04-08"
+  # Other days only get the daily and countdown digests
+  assert sorted(app._digest_windows(now + timedelta(days=1))) == ["email_1week_countdown", "email_3day_countdown", "email_daily"]
+
+
+def test_digest_windows_follow_local_midnight(monkeypatch):
+  monkeypatch.setattr(app, "DIGEST_CADENCES", ["email_daily", "email_monthly"])
+  tz = timezone(timedelta(hours=-5))
+  now = datetime(2024, 12, 1, 7, 0, tzinfo=timezone.utc)  # 02:00 on Dec 1 locally
+  windows = app._digest_windows(now, tz)
+  assert windows["email_daily"][1] == datetime(2024, 12, 2, 5, tzinfo=timezone.utc)
+  assert windows["email_monthly"][1:] == (datetime(2025, 1, 1, 5, tzinfo=timezone.utc), "2024-12")
+
+
+@pytest.fixture
+def digests(reminder_db, monkeypatch):
+  monkeypatch.setattr(app, "DIGEST_CADENCES", ["email_daily"])
+  reminder_db.tables["email_templates"].append({"name": "event_digest", "subject": "{{ digest_title }}", "html_content": "{{ events_html }}"})
+  reminder_db.tables["notification_watermarks"] = []
+  return reminder_db
+
+
+def test_one_digest_per_user_and_period(digests):
+  add_reminder_profile(digests, "u-1", email_daily=True)
+  add_reminder_profile(digests, "u-2", email_daily=False)
+  for event_id, uid in (("a", "u-1"), ("b", "u-1"), ("c", "u-2")):
+    add_reminder_event(digests, event_id, uid, due_in=timedelta(seconds=30) - app.REMINDER_LEAD)  # today, in 30s
+  summary = app._send_event_digests_job()
+  assert digests.sent == ["u-1@example.com"]
+  assert summary["sent"] == 1 and summary["skipped"] == 1
+  # A rerun in the same period is a no-op thanks to the watermark
+  app._send_event_digests_job()
+  assert digests.sent == ["u-1@example.com"]
+
+
+@pytest.fixture
+def zones(sb, monkeypatch):
+  monkeypatch.setattr(app, "_timezone_buckets_cache", app._TTLCache(maxsize=1, ttl=300))
+  monkeypatch.setattr(app, "TZ_BUCKET_TICK_MINUTES", 15)
+  sb.tables["timezone_buckets"] = [
+    {"timezone": "UTC", "user_count": 4},
+    {"timezone": "Europe/Berlin", "user_count": 2},
+    {"timezone": "Africa/Lagos", "user_count": 1},
+    {"timezone": "America/New_York", "user_count": 3},
+    {"timezone": "Asia/Kolkata", "user_count": 0},
+  ]
+  return sb
+
+
+def test_due_buckets_group_zones_by_utc_offset(zones):
+  # 00:05 UTC on a summer day: 02:00 in Berlin (UTC+2) is inside the 00:00 tick; Lagos (UTC+1) is at 01:00
+  due = app._due_timezone_buckets(datetime(2024, 7, 1, 0, 5, tzinfo=timezone.utc), "02:00")
+  assert due == {120: ["Europe/Berlin"]}
+  due = app._due_timezone_buckets(datetime(2024, 7, 1, 6, 14, tzinfo=timezone.utc), "02:00")
+  assert due == {-240: ["America/New_York"]}
+  assert app._due_timezone_buckets(datetime(2024, 7, 1, 2, 0, tzinfo=timezone.utc), "02:00") == {0: ["UTC"]}
+  assert zones.calls("select", "timezone_buckets") == 1  # cached between ticks
+
+
+def test_unknown_zones_and_offsets():
+  assert app._user_zone("Not/AZone") is timezone.utc
+  assert app._user_zone(None).utcoffset(datetime(2024, 7, 1)) == timedelta(0)
+  assert app._fmt_utc_offset(330) == "UTC+05:30"
+  assert app._fmt_utc_offset(-240) == "UTC-04:00"
+  assert app._fmt_utc_offset(0) == "UTC+00:00"
+
+
+def test_bucketed_run_only_reaches_users_in_its_zones(digests):
+  add_reminder_profile(digests, "u-berlin", email_daily=True)
+  add_reminder_profile(digests, "u-utc", email_daily=True)
+  digests.tables["profiles"][0]["timezone"] = "Europe/Berlin"
+  digests.tables["profiles"][1]["timezone"] = "UTC"
+  for uid in ("u-berlin", "u-utc"):
+    add_reminder_event(digests, f"ev-{uid}", uid, due_in=timedelta(seconds=30) - app.REMINDER_LEAD)
+  offset = int(datetime.now(app._user_zone("Europe/Berlin")).utcoffset().total_seconds() // 60)
+  summary = app._send_event_digests_job((offset, ["Europe/Berlin"]))
+  assert digests.sent == ["u-berlin@example.com"]
+  assert summary["bucket"]["timezones"] == ["Europe/Berlin"]
+
+
+@pytest.fixture
+def bucket_mode(zones, monkeypatch):
+  monkeypatch.setattr(app, "TZ_BUCKET_DELIVERY", True)
+  monkeypatch.setattr(app, "_get_email_settings", lambda: {"scheduler_enabled": True, "reminder_time": "02:00"})
+  monkeypatch.setattr(app, "_due_timezone_buckets", lambda now, reminder_time: {120: ["Europe/Berlin"], -240: ["America/New_York"]})
+  return zones
+
+
+def test_manual_digest_trigger_runs_the_due_buckets_under_their_leases(bucket_mode, client, monkeypatch):
+  monkeypatch.setattr(app, "BACKEND_API_KEY", "secret")
+  runs = []
+
+  def run_exclusively(job_name, fn, *args):
+    runs.append((job_name, args))
+    return job_name != "event_digests@UTC+02:00", {"sent": 1}
+
+  monkeypatch.setattr(app, "_run_job_exclusively", run_exclusively)
+  resp = client.post("/api/send-event-digests", headers={"X-API-Key": "secret"})
+  assert resp.status_code == 200
+  assert runs == [("event_digests@UTC-04:00", ((-240, ["America/New_York"]),)), ("event_digests@UTC+02:00", ((120, ["Europe/Berlin"]),))]
+  assert resp.get_json()["buckets"] == {"event_digests@UTC-04:00": {"sent": 1}, "event_digests@UTC+02:00": {"message": "already running"}}
+
+
+def test_scheduler_status_reports_the_bucket_leases(bucket_mode, client, monkeypatch):
+  monkeypatch.setattr(app, "_get_allowed_admin_emails", lambda: {"admin@example.com"})
+  later = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+  earlier = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+  bucket_mode.tables["job_leases"] = [
+    {"job_name": "event_digests@UTC+02:00", "holder": "worker-a", "expires_at": later},
+    {"job_name": "event_digests@UTC-04:00", "holder": "worker-b", "expires_at": earlier},
+    {"job_name": "event_digests", "holder": "worker-c", "expires_at": later},
+  ]
+  resp = client.get("/api/admin/scheduler-status", headers={"X-User-Email": "admin@example.com"})
+  digest = resp.get_json()["digest_job"]
+  assert "lease" not in digest
+  assert digest["timezone_buckets"]["due_now"] == ["event_digests@UTC-04:00", "event_digests@UTC+02:00"]
+  assert [(l["job_name"], l["holder"]) for l in digest["timezone_buckets"]["leases"]] == [("event_digests@UTC+02:00", "worker-a")]
@@ -0,0 +1,46 @@
+import threading
+import time
+
+import app
+
+
+def test_results_come_back_in_message_order(monkeypatch):
+  running, peak, lock = [0], [0], threading.Lock()
+
+  def send(to, subject, html, sender=None, settings=None):
+    with lock:
+      running[0] += 1
+      peak[0] = max(peak[0], running[0])
+    time.sleep(0.05 if to == "slow@example.com" else 0.01)
+    with lock:
+      running[0] -= 1
+    if to == "boom@example.com":
+      raise RuntimeError("boom")
+    return to != "bad@example.com"
+
+  monkeypatch.setattr(app, "_send_email_via_maileroo", send)
+  recipients = ["slow@example.com", "a@example.com", "bad@example.com", "boom@example.com", "b@example.com"]
+  latencies = []
+  results = app._dispatch_emails([{"to": r, "subject": "s", "html": "h"} for r in recipients], latencies=latencies)
+  assert [(m["to"], ok, error) for m, ok, error in results] == [
+    ("slow@example.com", True, None),
+    ("a@example.com", True, None),
+    ("bad@example.com", False, "send failed"),
+    ("boom@example.com", False, "boom"),
+    ("b@example.com", True, None),
+  ]
+  assert len(latencies) == 4
+  assert peak[0] > 1  # sent concurrently
+
+
+def test_token_bucket_paces_after_the_burst(monkeypatch):
+  clock = [0.0]
+  monkeypatch.setattr(app.time, "monotonic", lambda: clock[0])
+
+  def sleep(seconds):
+    clock[0] += seconds
+
+  monkeypatch.setattr(app.time, "sleep", sleep)
+  bucket = app._TokenBucket(rate=2, burst=2)
+  assert [bucket.acquire() for _ in range(4)] == [0.0, 0.0, 0.5, 0.5]
+  assert bucket.waited_seconds == 1.0
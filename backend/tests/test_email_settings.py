@@ -0,0 +1,53 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def settings_db(sb, monkeypatch):
+  clock = [1000.0]
+  monkeypatch.setattr(app.time, "monotonic", lambda: clock[0])
+  monkeypatch.setattr(app, "_email_settings_snapshot", {"settings": None, "db_updated_at": None, "loaded_at": 0.0, "checked_at": 0.0})
+  monkeypatch.setattr(app, "EMAIL_SETTINGS_TTL", 300)
+  monkeypatch.setattr(app, "EMAIL_SETTINGS_VERSION_CHECK_SECONDS", 15)
+  sb.tables["email_settings"] = [{"id": 1, "maileroo_sending_key": "key-1", "mail_default_sender": "a@example.com", "updated_at": "v1"}]
+  sb.clock = clock
+  return sb
+
+
+def test_snapshot_is_served_until_the_version_check(settings_db):
+  assert app._get_email_settings()["maileroo_sending_key"] == "key-1"
+  settings_db.tables["email_settings"][0]["maileroo_sending_key"] = "key-2"
+  settings_db.clock[0] += 10
+  assert app._get_email_settings()["maileroo_sending_key"] == "key-1"
+  assert settings_db.calls("select", "email_settings") == 1
+  # The probe sees the same updated_at: keep serving the snapshot
+  settings_db.clock[0] += 10
+  assert app._get_email_settings()["maileroo_sending_key"] == "key-1"
+  assert settings_db.calls("select", "email_settings") == 2
+  # A bumped updated_at reloads
+  settings_db.tables["email_settings"][0]["updated_at"] = "v2"
+  settings_db.clock[0] += 20
+  assert app._get_email_settings()["maileroo_sending_key"] == "key-2"
+
+
+def test_invalidation_and_ttl_force_a_reload(settings_db):
+  app._get_email_settings()
+  settings_db.tables["email_settings"][0]["mail_default_sender"] = "b@example.com"
+  app._invalidate_email_settings()
+  assert app._get_email_settings()["mail_default_sender"] == "b@example.com"
+  settings_db.tables["email_settings"][0]["mail_default_sender"] = "c@example.com"
+  settings_db.clock[0] += 301
+  assert app._get_email_settings()["mail_default_sender"] == "c@example.com"
+
+
+def test_callers_get_a_copy(settings_db):
+  app._get_email_settings()["maileroo_sending_key"] = "masked"
+  assert app._get_email_settings()["maileroo_sending_key"] == "key-1"
+
+
+def test_unreachable_db_keeps_the_snapshot(settings_db):
+  app._get_email_settings()
+  settings_db.fail[("select", "email_settings")] = RuntimeError("down")
+  settings_db.clock[0] += 20
+  assert app._get_email_settings()["maileroo_sending_key"] == "key-1"
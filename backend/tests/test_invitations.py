@@ -0,0 +1,105 @@
+import pytest
+
+import app
+
+SENDER = "sender-1"
+COMPANY = "company-1"
+AUTH = {"Authorization": "Bearer token"}
+
+
+@pytest.fixture
+def invites(sb, limiter, monkeypatch):
+  monkeypatch.setattr(app, "get_user_from_token", lambda token: (SENDER, "owner@example.com", {}))
+  monkeypatch.setattr(app, "_queue_emails", lambda kind, messages: ["queued"] * len(messages))
+  monkeypatch.setattr(app, "_queue_email", lambda *args, **kwargs: "queued")
+  sb.tables["profiles"] = [{"id": SENDER, "companies": [{"id": COMPANY, "name": "Acme", "role": "owner"}]}]
+  sb.tables["email_templates"] = [{"name": "invitation_to_company", "subject": "Join {{ company_name }}", "html_content": "<p>{{ role }}</p>"}]
+  return sb
+
+
+def invite(client, recipient="member@example.com", **body):
+  payload = {"recipient_email": recipient, "company_id": COMPANY, "company_name": "Acme", **body}
+  return client.post("/api/send-invitation", json=payload, headers=AUTH)
+
+
+def test_invitation_is_recorded_and_cooled_down(client, invites):
+  assert invite(client).status_code == 202
+  assert len(invites.tables["invitations"]) == 1
+  resp = invite(client)
+  assert resp.status_code == 429 and resp.headers["Retry-After"]
+  assert invite(client, "other@example.com").status_code == 202
+
+
+def test_rejected_requests_are_not_charged(client, invites, monkeypatch):
+  monkeypatch.setattr(app, "_invites_per_sender_policy", app._RateLimit("invites_per_sender", 1, 3600))
+  assert client.post("/api/send-invitation", json={"company_id": COMPANY}, headers=AUTH).status_code == 400
+  assert invite(client, company_id="not-mine").status_code == 403
+  assert invite(client).status_code == 202
+  assert invite(client, "other@example.com").status_code == 429
+
+
+def test_failed_insert_releases_cooldown_and_budget(client, invites, monkeypatch):
+  monkeypatch.setattr(app, "_invites_per_sender_policy", app._RateLimit("invites_per_sender", 1, 3600))
+  invites.fail[("insert", "invitations")] = RuntimeError("db down")
+  assert invite(client).status_code == 500
+  del invites.fail[("insert", "invitations")]
+  assert invite(client).status_code == 202
+
+
+def test_bulk_invitation_results_keep_the_recipient_address(client, invites):
+  resp = client.post("/api/send-invitations", headers=AUTH, json={
+    "company_id": COMPANY, "company_name": "Acme", "recipients": ["a@example.com", {"email": "b@example.com", "role": "admin"}],
+  })
+  assert resp.status_code == 202
+  results = resp.get_json()["results"]
+  assert [(r["email"], r["role"], r["status"], r["delivery"]) for r in results] == [
+    ("a@example.com", "user", "invited", "queued"),
+    ("b@example.com", "admin", "invited", "queued"),
+  ]
+
+
+def invite_many(client, recipients, **body):
+  payload = {"company_id": COMPANY, "company_name": "Acme", "recipients": recipients, **body}
+  return client.post("/api/send-invitations", json=payload, headers=AUTH)
+
+
+def test_bulk_invitations_report_every_recipient(client, invites):
+  assert invite(client, "cool@example.com").status_code == 202
+  resp = invite_many(client, ["new@example.com", "not-an-email", "NEW@example.com", "cool@example.com"])
+  assert resp.status_code == 202
+  body = resp.get_json()
+  assert [r["status"] for r in body["results"]] == ["invited", "invalid", "duplicate", "cooldown"]
+  assert body["results"][3]["retry_after_seconds"] > 0
+  assert body["summary"] == {"invited": 1, "invalid": 1, "duplicate": 1, "cooldown": 1}
+  assert [r["recipient_email"] for r in invites.tables["invitations"]] == ["cool@example.com", "new@example.com"]
+
+
+def test_bulk_invitations_need_owner_or_admin(client, invites):
+  invites.tables["profiles"][0]["companies"][0]["role"] = "user"
+  assert invite_many(client, ["a@example.com"]).status_code == 403
+  assert "invitations" not in invites.tables
+
+
+def test_bulk_budget_is_charged_only_for_recorded_invitations(client, invites, monkeypatch):
+  monkeypatch.setattr(app, "_invites_per_sender_policy", app._RateLimit("invites_per_sender", 2, 3600))
+  assert invite(client, "a@example.com").status_code == 202
+  # a@ is cooling down and x is invalid: only b@ is charged, which leaves the budget spent
+  resp = invite_many(client, ["a@example.com", "x", "b@example.com"])
+  assert [r["status"] for r in resp.get_json()["results"]] == ["cooldown", "invalid", "invited"]
+  resp = invite_many(client, ["c@example.com"])
+  assert resp.status_code == 429
+  # The rejected batch did not start a cooldown for c@
+  monkeypatch.setattr(app, "_invites_per_sender_policy", None)
+  assert invite_many(client, ["c@example.com"]).get_json()["summary"] == {"invited": 1}
+
+
+def test_failed_bulk_insert_releases_cooldowns_and_budget(client, invites, monkeypatch):
+  monkeypatch.setattr(app, "_invites_per_sender_policy", app._RateLimit("invites_per_sender", 2, 3600))
+  invites.fail[("insert", "invitations")] = RuntimeError("db down")
+  resp = invite_many(client, ["a@example.com", "b@example.com"])
+  assert resp.status_code == 500
+  assert [r["status"] for r in resp.get_json()["results"]] == ["failed", "failed"]
+  del invites.fail[("insert", "invitations")]
+  resp = invite_many(client, ["a@example.com", "b@example.com"])
+  assert resp.status_code == 202
+  assert resp.get_json()["summary"] == {"invited": 2}
@@ -0,0 +1,59 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def file_leases(sb, monkeypatch, tmp_path):
+  # No acquire_job_lease RPC in sb: leases fall back to lock files
+  monkeypatch.setattr(app, "JOB_LOCK_DIR", str(tmp_path))
+  monkeypatch.setattr(app, "JOB_LEASE_MIN_HOLD_SECONDS", 0)
+  return tmp_path
+
+
+@pytest.fixture
+def db_leases(sb, monkeypatch):
+  leases = {}
+
+  def acquire(params):
+    holder = leases.get(params["p_job_name"])
+    if holder not in (None, params["p_holder"]):
+      return False
+    leases[params["p_job_name"]] = params["p_holder"]
+    return True
+
+  sb.rpcs["acquire_job_lease"] = acquire
+  sb.rpcs["release_job_lease"] = lambda params: leases.pop(params["p_job_name"], None)
+  return leases
+
+
+def test_only_one_lease_holder_at_a_time(file_leases):
+  with app._JobLease("job") as first:
+    assert first.acquired and first.backend == "file"
+    with app._JobLease("job") as second:
+      assert not second.acquired
+  with app._JobLease("job") as third:
+    assert third.acquired
+
+
+def test_minimum_hold_keeps_other_workers_from_rerunning_a_job(file_leases, monkeypatch):
+  monkeypatch.setattr(app, "JOB_LEASE_MIN_HOLD_SECONDS", 60)
+  with app._JobLease("job") as lease:
+    assert lease.acquired
+  with app._JobLease("job") as lease:
+    assert not lease.acquired
+
+
+def test_db_lease_is_released_after_the_run(db_leases, monkeypatch):
+  monkeypatch.setattr(app, "_worker_id", lambda: "worker-a")
+  assert app._run_job_exclusively("job", lambda: "done") == (True, "done")
+  assert db_leases == {}
+  db_leases["job"] = "worker-b"
+  assert app._run_job_exclusively("job", lambda: pytest.fail("ran without the lease")) == (False, None)
+
+
+def test_a_worker_does_not_run_a_job_twice_at_once(file_leases):
+  def reenter():
+    return app._run_job_exclusively("job", lambda: "inner")
+
+  assert app._run_job_exclusively("job", reenter) == (True, (False, None))
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+import pytest
+
+import app
+from conftest import add_reminder_event, add_reminder_profile
+
+
+class WorkerKilled(BaseException):
+  pass
+
+
+@pytest.fixture
+def three_pages(reminder_db, monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_PAGE_SIZE", 1)
+  add_reminder_profile(reminder_db, "u-1")
+  for i in range(3):
+    add_reminder_event(reminder_db, f"ev-{i}", "u-1", due_in=timedelta(minutes=-30 + i))
+  return reminder_db
+
+
+def crash_on_page(db, monkeypatch, page):
+  """
+  Kills the run (no cleanup, like a worker restart) when the given page is sent.
+  """
+  real_dispatch = app._dispatch_emails
+  calls = []
+
+  def dispatch(messages, *args):
+    calls.append(messages)
+    if len(calls) == page:
+      raise WorkerKilled()
+    return real_dispatch(messages, *args)
+
+  monkeypatch.setattr(app, "_dispatch_emails", dispatch)
+  monkeypatch.setattr(app._JobRun, "finish", lambda run, status="completed": None)
+  with pytest.raises(WorkerKilled):
+    app._send_1week_event_reminders_job()
+
+
+def test_interrupted_run_resumes_from_its_checkpoint(three_pages, monkeypatch):
+  with monkeypatch.context() as m:
+    crash_on_page(three_pages, m, 2)
+  assert three_pages.sent == ["u-1@example.com"]
+  (row,) = three_pages.tables["job_runs"]
+  assert row["status"] == "running" and row["cursor"]["id"] == "ev-0" and row["sent"] == 1
+
+  summary = app._send_1week_event_reminders_job()
+  assert three_pages.sent == ["u-1@example.com"] * 3  # nothing re-sent, nothing skipped
+  assert summary["resumed_run"] == row["id"] and summary["sent"] == 3
+  (row,) = three_pages.tables["job_runs"]
+  assert row["status"] == "completed" and row["attempts"] == 2
+
+
+def test_resume_only_does_nothing_without_an_interrupted_run(three_pages):
+  assert app._send_1week_event_reminders_job(resume_only=True) is None
+  assert three_pages.sent == []
+
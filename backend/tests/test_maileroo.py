@@ -0,0 +1,136 @@
+import pytest
+import requests
+
+import app
+
+SETTINGS = {
+  "maileroo_sending_key": "key-123456789",
+  "maileroo_api_endpoint": "https://smtp.maileroo.com/api/v2",
+  "mail_default_sender": "Dayclap <noreply@example.com>",
+}
+
+
+class Response:
+  def __init__(self, status_code):
+    self.status_code = status_code
+    self.text = ""
+
+
+@pytest.fixture
+def daily_budget(limiter, monkeypatch):
+  monkeypatch.setattr(app, "_maileroo_daily_policy", app._RateLimit("maileroo_daily", 1, 86400))
+
+
+def send():
+  return app._send_email_via_maileroo("to@example.com", "Hi", "<p>Hi</p>", settings=SETTINGS)
+
+
+def test_daily_budget_counts_accepted_messages(daily_budget, monkeypatch):
+  posts = []
+  monkeypatch.setattr(app, "_maileroo_post", lambda url, key, payload: posts.append(payload) or Response(202))
+  assert send()
+  assert not send()
+  assert len(posts) == 1
+
+
+@pytest.mark.parametrize("failure", [Response(500), requests.exceptions.ConnectionError("reset")])
+def test_daily_budget_is_given_back_when_maileroo_does_not_accept(daily_budget, monkeypatch, failure):
+  def post(url, key, payload):
+    if isinstance(failure, Exception):
+      raise failure
+    return failure
+
+  monkeypatch.setattr(app, "_maileroo_post", post)
+  assert not send()
+  monkeypatch.setattr(app, "_maileroo_post", lambda url, key, payload: Response(200))
+  assert send()
+
+
+def test_read_timeouts_stay_counted(daily_budget, monkeypatch):
+  def post(url, key, payload):
+    raise requests.exceptions.ReadTimeout("slow")
+
+  monkeypatch.setattr(app, "_maileroo_post", post)
+  assert not send()
+  monkeypatch.setattr(app, "_maileroo_post", lambda url, key, payload: Response(200))
+  assert not send()
+
+
+class Session:
+  def __init__(self, *outcomes):
+    self.outcomes = list(outcomes)
+    self.posts = 0
+
+  def post(self, url, **kwargs):
+    self.posts += 1
+    outcome = self.outcomes.pop(0)
+    if isinstance(outcome, Exception):
+      raise outcome
+    return outcome
+
+
+def retry_response(status, retry_after=None):
+  response = Response(status)
+  response.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+  return response
+
+
+@pytest.fixture
+def http(monkeypatch):
+  sleeps = []
+  monkeypatch.setattr(app.time, "sleep", sleeps.append)
+  monkeypatch.setattr(app, "_acquire_maileroo_send_slot", lambda: None)
+  monkeypatch.setattr(app, "MAILEROO_MAX_RETRIES", 2)
+
+  def use(*outcomes):
+    session = Session(*outcomes)
+    monkeypatch.setattr(app, "_maileroo_session", lambda: session)
+    return session
+  use.sleeps = sleeps
+  return use
+
+
+def post():
+  return app._maileroo_post("https://maileroo.test/emails", "key", {})
+
+
+def test_retryable_statuses_and_connection_errors_are_retried(http):
+  session = http(retry_response(503), requests.exceptions.ConnectionError("reset"), retry_response(202))
+  assert post().status_code == 202
+  assert session.posts == 3 and len(http.sleeps) == 2
+
+
+def test_retries_give_up_with_the_last_response(http):
+  session = http(retry_response(500), retry_response(502), retry_response(503))
+  assert post().status_code == 503
+  assert session.posts == 3
+
+
+def test_client_errors_and_read_timeouts_are_not_retried(http):
+  session = http(retry_response(400))
+  assert post().status_code == 400
+  assert session.posts == 1
+  session = http(requests.exceptions.ReadTimeout("slow"))
+  with pytest.raises(requests.exceptions.ReadTimeout):
+    post()
+  assert session.posts == 1
+
+
+def test_retry_after_is_honoured_up_to_the_backoff_cap(http, monkeypatch):
+  monkeypatch.setattr(app, "MAILEROO_BACKOFF_MAX", 10)
+  http(retry_response(429, "3"), retry_response(202))
+  assert post().status_code == 202
+  assert http.sleeps == [3.0]
+  session = http(retry_response(429, "60"))
+  assert post().status_code == 429
+  assert session.posts == 1
+
+
+def test_backoff_and_retry_after_parsing(monkeypatch):
+  monkeypatch.setattr(app, "MAILEROO_BACKOFF_BASE", 0.5)
+  monkeypatch.setattr(app, "MAILEROO_BACKOFF_MAX", 4)
+  assert all(0 <= app._backoff_delay(a) <= min(4, 0.5 * 2 ** a) for a in range(8) for _ in range(20))
+  assert app._retry_after_seconds(retry_response(429, "7")) == 7.0
+  assert app._retry_after_seconds(retry_response(429, "Wed, 21 Oct 2015 07:28:00 GMT")) == 0.0
+  assert app._retry_after_seconds(retry_response(429, "soon")) is None
+  assert app._retry_after_seconds(retry_response(429)) is None
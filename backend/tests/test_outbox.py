@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+  monkeypatch.setattr(app, "OUTBOX_DB_PATH", str(tmp_path / "outbox.sqlite3"))
+  monkeypatch.setattr(app, "_outbox_initialized", False)
+  monkeypatch.setattr(app, "_ensure_outbox_workers", lambda: None)
+  monkeypatch.setattr(app, "_outbox_inflight", set())
+  return app
+
+
+def _rows(outbox):
+  conn = outbox._outbox_connect()
+  try:
+    return [dict(r) for r in conn.execute("SELECT * FROM outbox ORDER BY id")]
+  finally:
+    conn.close()
+
+
+def test_enqueue_is_idempotent_per_dedup_key(outbox):
+  outbox._outbox_enqueue("invitation", "a@x.com", "S", "<p>h</p>", dedup_key="k1")
+  outbox._outbox_enqueue("invitation", "a@x.com", "S", "<p>h</p>", dedup_key="k1")
+  outbox._outbox_enqueue_many("invitation", [
+    {"to": "b@x.com", "subject": "S", "html": "h", "dedup_key": "k2"},
+    {"to": "a@x.com", "subject": "S", "html": "h", "dedup_key": "k1"},
+  ])
+  assert [r["recipient"] for r in _rows(outbox)] == ["a@x.com", "b@x.com"]
+
+
+def test_dedup_key_windows_collapse_only_within_a_bucket(monkeypatch):
+  monkeypatch.setattr(app.time, "time", lambda: 1000.0)
+  first = app._outbox_dedup_key("task", "a@x.com", "t1", window_seconds=600)
+  assert first == app._outbox_dedup_key("task", "a@x.com", "t1", window_seconds=600)
+  assert first != app._outbox_dedup_key("task", "a@x.com", "t2", window_seconds=600)
+  monkeypatch.setattr(app.time, "time", lambda: 1900.0)
+  assert first != app._outbox_dedup_key("task", "a@x.com", "t1", window_seconds=600)
+
+
+def test_claim_complete_and_retry_schedule(outbox, monkeypatch):
+  monkeypatch.setattr(app, "OUTBOX_MAX_ATTEMPTS", 2)
+  outbox._outbox_enqueue("welcome", "a@x.com", "S", "h", dedup_key="k")
+  row = outbox._outbox_claim()
+  assert row["status"] == "pending" and _rows(outbox)[0]["status"] == "sending"
+  assert outbox._outbox_claim() is None  # leased
+
+  outbox._outbox_complete(row, False, "boom")
+  stored = _rows(outbox)[0]
+  assert stored["status"] == "pending" and stored["last_error"] == "boom"
+  assert stored["next_attempt_at"] > time.time() + 20  # backed off, not immediately claimable
+  assert outbox._outbox_claim() is None
+
+  conn = outbox._outbox_connect()
+  conn.execute("UPDATE outbox SET next_attempt_at = 0")
+  conn.close()
+  row = outbox._outbox_claim()
+  outbox._outbox_complete(row, False, "boom again")
+  assert _rows(outbox)[0]["status"] == "failed"
+
+
+def test_expired_lease_is_reclaimed(outbox, monkeypatch):
+  monkeypatch.setattr(app, "OUTBOX_LEASE_SECONDS", 0.05)
+  outbox._outbox_enqueue("welcome", "a@x.com", "S", "h", dedup_key="k")
+  first = outbox._outbox_claim()
+  time.sleep(0.1)
+  second = outbox._outbox_claim()
+  assert second is not None and second["id"] == first["id"]
+
+
+def test_lease_is_renewed_while_a_send_is_in_flight(outbox, monkeypatch):
+  monkeypatch.setattr(app, "OUTBOX_LEASE_SECONDS", 0.3)
+  outbox._outbox_enqueue("welcome", "a@x.com", "S", "h", dedup_key="k")
+  row = outbox._outbox_claim()
+  outbox._outbox_inflight.add(row["id"])
+  for _ in range(6):  # a send that takes twice the lease
+    time.sleep(0.1)
+    assert outbox._outbox_renew_leases() == 1
+  assert outbox._outbox_claim() is None
+
+  outbox._outbox_complete(row, True)
+  outbox._outbox_inflight.discard(row["id"])
+  assert _rows(outbox)[0]["status"] == "sent"
+  assert outbox._outbox_renew_leases() == 0
+
+
+def test_worker_keeps_the_lease_during_a_slow_send(outbox, monkeypatch):
+  monkeypatch.setattr(app, "OUTBOX_LEASE_SECONDS", 0.3)
+  outbox._outbox_enqueue("welcome", "a@x.com", "S", "h", dedup_key="k")
+  real_claim = app._outbox_claim
+  other_worker_claims = []
+
+  def slow_send(*args, **kwargs):
+    for _ in range(6):  # twice the lease
+      time.sleep(0.1)
+      outbox._outbox_renew_leases()  # what the renewer thread does every lease / 3
+      other_worker_claims.append(real_claim())
+    return True
+
+  def claim_once():
+    if other_worker_claims:
+      raise SystemExit  # stop the worker loop after its first message
+    return real_claim()
+
+  monkeypatch.setattr(app, "_send_email_via_maileroo", slow_send)
+  monkeypatch.setattr(app, "_outbox_claim", claim_once)
+  with pytest.raises(SystemExit):
+    outbox._outbox_worker_loop()
+  assert other_worker_claims == [None] * 6
+  assert _rows(outbox)[0]["status"] == "sent"
+  assert not outbox._outbox_inflight
@@ -0,0 +1,41 @@
+import app
+
+
+def profile_selects(sb):
+  return sb.calls("select", "profiles")
+
+
+def test_projected_lookups_fetch_only_missing_columns(sb):
+  sb.tables["profiles"] = [{"id": "u-1", "email": "u@example.com", "companies": [{"id": "c"}], "notifications": {"push": True}}]
+  assert app.fetch_profile("u-1", ("companies",)) == {"companies": [{"id": "c"}]}
+  assert app.fetch_profile("u-1", ("companies",)) == {"companies": [{"id": "c"}]}
+  assert profile_selects(sb) == 1
+  # A new column is fetched and merged with what is already cached
+  assert app.fetch_profile("u-1", ("email", "companies")) == {"email": "u@example.com", "companies": [{"id": "c"}]}
+  assert profile_selects(sb) == 2
+  assert app.fetch_profile("u-1", ("companies", "email")) is not None
+  assert profile_selects(sb) == 2
+
+
+def test_full_rows_serve_every_projection(sb):
+  sb.tables["profiles"] = [{"id": "u-1", "email": "u@example.com", "name": "U"}]
+  assert app.fetch_profile("u-1")["name"] == "U"
+  assert app.fetch_profile("u-1", ("email",)) == {"email": "u@example.com"}
+  assert profile_selects(sb) == 1
+
+
+def test_request_memo_and_invalidation(sb):
+  sb.tables["profiles"] = [{"id": "u-1", "email": "old@example.com"}]
+  with app.app.test_request_context():
+    assert app.fetch_profile("u-1", ("email",))["email"] == "old@example.com"
+    sb.tables["profiles"][0]["email"] = "new@example.com"
+    assert app.fetch_profile("u-1", ("email",))["email"] == "old@example.com"
+    app._invalidate_profile("u-1")
+    assert app.fetch_profile("u-1", ("email",))["email"] == "new@example.com"
+  assert profile_selects(sb) == 2
+
+
+def test_missing_profiles_are_not_cached(sb):
+  assert app.fetch_profile("ghost", ("email",)) is None
+  sb.tables["profiles"] = [{"id": "ghost", "email": "g@example.com"}]
+  assert app.fetch_profile("ghost", ("email",)) == {"email": "g@example.com"}
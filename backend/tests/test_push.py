@@ -0,0 +1,82 @@
+import pytest
+from pywebpush import WebPushException
+
+import app
+from conftest import make_subscription
+
+
+def test_vapid_headers_are_signed_once_per_audience(push_service, monkeypatch):
+  clock = [1_000_000.0]
+  monkeypatch.setattr(app.time, "time", lambda: clock[0])
+  fcm = push_service.vapid_headers("https://fcm.googleapis.com")
+  assert push_service.vapid_headers("https://fcm.googleapis.com") is fcm
+  push_service.vapid_headers("https://updates.push.services.mozilla.com")
+  assert push_service.vapid_signatures == 2
+  # Re-signed once the JWT is within the refresh margin of its exp
+  clock[0] += app.PUSH_VAPID_EXPIRY_SECONDS - app.PUSH_VAPID_REFRESH_MARGIN_SECONDS + 1
+  assert push_service.vapid_headers("https://fcm.googleapis.com") is not fcm
+  assert push_service.vapid_signatures == 3
+
+
+def test_one_pooled_session_per_push_service():
+  client = app._PushClient()
+  assert client.session("https://fcm.googleapis.com") is client.session("https://fcm.googleapis.com")
+  assert client.session("https://fcm.googleapis.com") is not client.session("https://web.push.apple.com")
+  assert app._PushClient.origin("https://fcm.googleapis.com/fcm/send/abc") == "https://fcm.googleapis.com"
+
+
+def test_send_encrypts_and_posts_with_cached_headers(push_service):
+  sub = make_subscription("https://fcm.googleapis.com/fcm/send/abc")
+  push_service.send(sub, '{"title": "hi"}')
+  push_service.send(sub, '{"title": "again"}')
+  (endpoint, headers), _ = push_service.posts
+  assert endpoint == sub["endpoint"]
+  assert headers["Content-Encoding"] == "aes128gcm" and headers["Authorization"].startswith("vapid ")
+  assert push_service.vapid_signatures == 1
+  assert push_service.stats()["services"]["https://fcm.googleapis.com"]["status"] == {"201": 2}
+
+
+def test_rejected_pushes_raise(push_service):
+  sub = make_subscription("https://fcm.googleapis.com/fcm/send/abc")
+  push_service.status[sub["endpoint"]] = 400
+  with pytest.raises(WebPushException):
+    push_service.send(sub, "{}")
+
+
+@pytest.fixture
+def pruning(sb, push_service, monkeypatch):
+  monkeypatch.setattr(app, "PUSH_PRUNE_BATCH_SIZE", 2)
+  monkeypatch.setattr(app, "PUSH_PRUNE_FLUSH_SECONDS", 3600)
+  pruned = []
+  sb.rpcs["prune_push_subscriptions"] = lambda params: pruned.append(params["p_endpoints"]) or [{"user_id": "u-1"}]
+  return pruned
+
+
+def test_gone_subscriptions_are_pruned_in_batches(pruning, push_service, monkeypatch):
+  invalidated = []
+  monkeypatch.setattr(app, "_invalidate_profile", invalidated.append)
+  subs = [make_subscription(f"https://fcm.googleapis.com/fcm/send/{i}") for i in range(3)]
+  for sub, status in zip(subs, (410, 404, 201)):
+    push_service.status[sub["endpoint"]] = status
+  for sub in subs[:2]:
+    with pytest.raises(WebPushException):
+      push_service.send(sub, "{}")
+  push_service.send(subs[2], "{}")
+  assert pruning == [[subs[0]["endpoint"], subs[1]["endpoint"]]]
+  assert invalidated == ["u-1"]
+  assert push_service.stats()["prune"]["pruned_subscriptions"] == 2
+
+
+def test_partial_batches_wait_for_the_timer_and_repeats_are_ignored(pruning, push_service):
+  push_service.report_dead("https://fcm.googleapis.com/fcm/send/a")
+  push_service.report_dead("https://fcm.googleapis.com/fcm/send/a")
+  assert pruning == [] and push_service.stats()["prune"]["queued"] == 1
+  assert push_service.flush_dead() == 1
+  assert pruning == [["https://fcm.googleapis.com/fcm/send/a"]]
+  assert push_service.stats()["prune"]["queued"] == 0
+
+
+def test_pruning_falls_back_to_plain_deletes_without_the_rpc(sb):
+  sb.tables["push_subscriptions"] = [{"endpoint": "https://push/a", "user_id": "u-1"}, {"endpoint": "https://push/b", "user_id": "u-1"}]
+  app._prune_dead_subscriptions(["https://push/a"])
+  assert [r["endpoint"] for r in sb.tables["push_subscriptions"]] == ["https://push/b"]
@@ -0,0 +1,61 @@
+import pytest
+
+import app
+import push_crypto
+from conftest import make_subscription
+
+
+def test_encrypt_payloads_keeps_order_and_marks_unusable_keys():
+  good = make_subscription("https://fcm.googleapis.com/fcm/send/a")
+  bad = {"endpoint": "https://fcm.googleapis.com/fcm/send/b", "keys": {"p256dh": "not-a-key", "auth": "x"}}
+  bodies = push_crypto.encrypt_payloads([good, bad, good], '{"title": "hi"}')
+  assert bodies[1] is None
+  assert isinstance(bodies[0], bytes) and isinstance(bodies[2], bytes)
+  # Every encryption uses a fresh ephemeral key
+  assert bodies[0] != bodies[2]
+
+
+@pytest.fixture
+def devices(sb, push_service, monkeypatch):
+  monkeypatch.setattr(app, "PUSH_ENCRYPT_PROCESSES", 0)
+  monkeypatch.setattr(app, "PUSH_BROADCAST_PAGE_SIZE", 2)
+  sb.tables["profiles"] = [
+    {"id": "u-1", "notifications": {"push": True}},
+    {"id": "u-2", "notifications": {"push": False}},
+  ]
+  sb.tables["push_subscriptions"] = [
+    {"endpoint": f"https://fcm.googleapis.com/fcm/send/{i}", "user_id": uid, "subscription": make_subscription(f"https://fcm.googleapis.com/fcm/send/{i}")}
+    for i, uid in enumerate(["u-1", "u-1", "u-2", "u-3", "u-1"])
+  ]
+  sb.tables["push_subscriptions"][4]["subscription"]["keys"]["p256dh"] = "broken"
+  return sb
+
+
+def broadcast_run():
+  summary = {"events": 0, "sent": 0, "skipped": 0, "failed": 0, "send_seconds": 0.0, "encrypt_seconds": 0.0,
+             "pages": 0, "queries": 0, "title": "Outage"}
+  run = app._JobRun(app.push_broadcast_job_id, summary)
+  run.start(None, None)
+  return run
+
+
+def test_broadcast_pages_through_every_device(devices, push_service):
+  push_service.status["https://fcm.googleapis.com/fcm/send/3"] = 500
+  summary = app._send_push_broadcast_job(broadcast_run(), "Outage", "We are back", "/")
+  # Opted out (u-2) and unusable keys (device 4) are skipped; users without a profile still get it
+  assert {k: summary[k] for k in ("events", "sent", "failed", "skipped", "pages")} == {
+    "events": 5, "sent": 2, "failed": 1, "skipped": 2, "pages": 3,
+  }
+  assert sorted(e for e, _ in push_service.posts) == [f"https://fcm.googleapis.com/fcm/send/{i}" for i in (0, 1, 3)]
+  [row] = devices.tables["job_runs"]
+  assert row["status"] == "completed" and row["cursor"] == {"endpoint": "https://fcm.googleapis.com/fcm/send/4"}
+
+
+def test_admin_broadcast_validates_and_refuses_to_overlap(devices, client, monkeypatch):
+  monkeypatch.setattr(app, "_get_allowed_admin_emails", lambda: {"admin@example.com"})
+  headers = {"X-User-Email": "admin@example.com"}
+  assert client.post("/api/admin/push-broadcast", json={"title": "Outage"}, headers=headers).status_code == 400
+  assert client.post("/api/admin/push-broadcast", json={"title": "t", "body": "b"}).status_code == 403
+  monkeypatch.setattr(app, "_push_broadcast_active", lambda: {"id": "run-1", "status": "running"})
+  resp = client.post("/api/admin/push-broadcast", json={"title": "t", "body": "b"}, headers=headers)
+  assert resp.status_code == 409
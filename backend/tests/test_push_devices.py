@@ -0,0 +1,54 @@
+import app
+from conftest import make_subscription
+
+AUTH = {"Authorization": "Bearer token"}
+
+
+def register(sb, user_id, endpoint):
+  sub = make_subscription(endpoint)
+  sb.tables.setdefault("push_subscriptions", []).append({"endpoint": endpoint, "user_id": user_id, "subscription": sub})
+  return sub
+
+
+def test_every_device_of_every_user_gets_the_message(sb, push_service):
+  register(sb, "u-1", "https://fcm.googleapis.com/fcm/send/phone")
+  register(sb, "u-1", "https://updates.push.services.mozilla.com/wpush/v2/laptop")
+  register(sb, "u-2", "https://web.push.apple.com/dead")
+  push_service.status["https://web.push.apple.com/dead"] = 410
+  results = app._send_push_to_users({"u-1": ("t", "b", "/"), "u-2": ("t", "b", "/"), "u-3": ("t", "b", "/")})
+  assert results == {
+    "u-1": {"devices": 2, "sent": 2, "failed": 0},
+    "u-2": {"devices": 1, "sent": 0, "failed": 1},
+    "u-3": {"devices": 0, "sent": 0, "failed": 0},
+  }
+  assert len(push_service.posts) == 3
+  # Only delivered devices are stamped, in one UPDATE
+  stamped = {r["endpoint"] for r in sb.tables["push_subscriptions"] if r.get("last_success_at")}
+  assert stamped == {"https://fcm.googleapis.com/fcm/send/phone", "https://updates.push.services.mozilla.com/wpush/v2/laptop"}
+  assert sb.calls("update", "push_subscriptions") == 1
+
+
+def test_prefetched_subscriptions_skip_the_registry_query(sb, push_service):
+  sub = make_subscription("https://fcm.googleapis.com/fcm/send/phone")
+  results = app._send_push_to_users({"u-1": ("t", "b", "/")}, {"u-1": [sub]})
+  assert results["u-1"]["sent"] == 1
+  assert sb.calls("select", "push_subscriptions") == 0
+
+
+def test_subscribing_registers_the_device_and_enables_push(sb, client, monkeypatch):
+  monkeypatch.setattr(app, "get_user_from_token", lambda token: ("u-1", "u-1@example.com", {}))
+  sb.tables["profiles"] = [{"id": "u-1", "notifications": {"push": False, "email": True}}]
+  sub = make_subscription("https://fcm.googleapis.com/fcm/send/phone")
+  resp = client.post("/api/subscribe-push", json=sub, headers={**AUTH, "User-Agent": "Firefox"})
+  assert resp.status_code == 200
+  [row] = sb.tables["push_subscriptions"]
+  assert (row["endpoint"], row["user_id"], row["user_agent"]) == (sub["endpoint"], "u-1", "Firefox")
+  assert sb.tables["profiles"][0]["notifications"] == {"push": True, "email": True}
+  assert sb.tables["profiles"][0]["push_subscription"] == sub
+
+
+def test_subscriptions_without_keys_are_rejected(sb, client, monkeypatch):
+  monkeypatch.setattr(app, "get_user_from_token", lambda token: ("u-1", "u-1@example.com", {}))
+  resp = client.post("/api/subscribe-push", json={"endpoint": "https://fcm.googleapis.com/fcm/send/x"}, headers=AUTH)
+  assert resp.status_code == 400
+  assert "push_subscriptions" not in sb.tables
@@ -0,0 +1,71 @@
+import pytest
+
+import app
+
+
+def test_window_decision_counts_the_previous_window_by_overlap():
+  # Halfway through the window, half of the previous window's 10 hits still count
+  assert app._window_decision(150.0, 100.0, 10, 1, cur=4, prev=10) == (True, 0.0, 0.0)
+  allowed, remaining, retry_after = app._window_decision(150.0, 100.0, 10, 1, cur=5, prev=10)
+  assert not allowed and remaining == 0.0
+  # One more hit fits once the previous window's share has decayed to 4: at 160
+  assert retry_after == pytest.approx(10.0)
+
+
+def test_window_decision_waits_into_the_next_window_when_this_one_is_full():
+  allowed, _, retry_after = app._window_decision(120.0, 100.0, 10, 1, cur=10, prev=0)
+  assert not allowed and retry_after == pytest.approx(80.0 + 10.0)
+
+
+def test_bucket_decision():
+  assert app._bucket_decision(3.0, 1.0, 1) == (True, 2.0, 0.0)
+  assert app._bucket_decision(0.5, 0.5, 1) == (False, 0.5, 1.0)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+  if request.param == "memory":
+    return app._MemoryRateLimitStore()
+  return app._SQLiteRateLimitStore(str(tmp_path / "rate_limits.sqlite3"))
+
+
+def test_sliding_window_store_limits_and_refunds(store):
+  policy = app._RateLimit("p", 2, 60)
+  limiter = app._RateLimiter(store)
+  assert [d[0] for d in limiter.hit_many(policy, ["a", "a", "a", "b"])] == [True, True, False, True]
+  limiter.refund(policy, ["a"])
+  assert limiter.hit(policy, "a")[0]
+  assert not limiter.hit(policy, "a")[0]
+
+
+def test_token_bucket_store_refund_restores_a_cooldown(store):
+  policy = app._RateLimit("cooldown", 1, 300, "token_bucket", burst=1)
+  limiter = app._RateLimiter(store)
+  assert limiter.hit(policy, "k")[0]
+  allowed, _, retry_after = limiter.hit(policy, "k")
+  assert not allowed and 299 < retry_after <= 300
+  limiter.refund(policy, ["k"])
+  assert limiter.hit(policy, "k")[0]
+
+
+def test_larger_costs_are_charged_as_a_whole(store):
+  policy = app._RateLimit("p", 5, 60)
+  limiter = app._RateLimiter(store)
+  assert limiter.hit(policy, "s", cost=4)[0]
+  assert not limiter.hit(policy, "s", cost=2)[0]
+  # A refused multi-hit request is not remembered as blocking single hits
+  assert limiter.hit(policy, "s")[0]
+
+
+def test_store_errors_fall_back_to_process_memory():
+  class Broken:
+    name = "broken"
+
+    def decide_many(self, *args):
+      raise RuntimeError("down")
+
+  limiter = app._RateLimiter(Broken())
+  policy = app._RateLimit("p", 1, 60)
+  assert limiter.hit(policy, "k")[0]
+  assert not limiter.hit(policy, "k")[0]
+  assert limiter.counters["p"]["store_errors"] == 2
@@ -0,0 +1,36 @@
+import pytest
+
+import app
+
+
+def channels(**notifications):
+  return app._1week_reminder_channels({"email": "u@x.com", "notifications": notifications})
+
+
+@pytest.fixture(autouse=True)
+def push_enabled(monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_PUSH_ENABLED", True)
+
+
+def test_the_1week_preference_gates_both_channels():
+  assert channels(email_1week_countdown=True, push=True) == ("email", "push")
+  assert channels(email_1week_countdown=True, push=False) == ("email",)
+  # push is only the device master switch (it defaults to true): no opt-in by itself
+  assert channels(email_1week_countdown=False, push=True) == ()
+  assert channels(push=True) == ()
+
+
+def test_push_only_needs_its_own_preference():
+  assert channels(email_1week_countdown=False, push_1week_countdown=True, push=True) == ("push",)
+  assert channels(push_1week_countdown=True, push=False) == ()
+
+
+def test_push_channel_can_be_switched_off(monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_PUSH_ENABLED", False)
+  assert channels(email_1week_countdown=True, push=True) == ("email",)
+
+
+def test_opted_out_users_are_skipped():
+  assert app._1week_reminder_skip_reason(None) == "no_profile"
+  assert app._1week_reminder_skip_reason({"notifications": {"push": True}}) == "disabled"
+  assert app._1week_reminder_skip_reason({"notifications": {"email_1week_countdown": True}}) is None
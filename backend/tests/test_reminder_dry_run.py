@@ -0,0 +1,47 @@
+import pytest
+
+import app
+from conftest import add_reminder_event, add_reminder_profile
+
+
+@pytest.fixture
+def candidates(reminder_db, monkeypatch):
+  monkeypatch.setattr(app, "_dispatch_emails", lambda *args, **kwargs: pytest.fail("dry run sent email"))
+  monkeypatch.setattr(app, "MAILEROO_RATE_LIMIT_PER_SECOND", 10)
+  add_reminder_profile(reminder_db, "u-1")
+  add_reminder_profile(reminder_db, "u-off", email_1week_countdown=False)
+  add_reminder_event(reminder_db, "ev-1", "u-1")
+  add_reminder_event(reminder_db, "ev-2", "u-1")
+  add_reminder_event(reminder_db, "ev-off", "u-off")
+  add_reminder_event(reminder_db, "ev-ghost", "ghost")
+  return reminder_db
+
+
+def writes(db):
+  return [entry for entry in db.log if entry[0] != "select"]
+
+
+def test_dry_run_renders_but_sends_marks_and_records_nothing(candidates):
+  report = app._simulate_1week_reminders()
+  assert report["dry_run"] and report["events"] == 4
+  assert report["would_send"] == 2
+  assert report["skipped"] == {"no_profile": 1, "disabled": 1}
+  assert report["rendered_bytes"]["total"] > 0
+  assert report["projection"]["send_seconds_rate_bound"] == 0.2
+  assert writes(candidates) == []
+
+
+def test_multiplier_projects_a_larger_volume(candidates):
+  report = app._simulate_1week_reminders(multiplier=5)
+  assert report["would_send"] == 10 and report["events"] == 20
+  assert report["skipped"]["disabled"] == 5
+  assert report["projection"]["send_seconds_rate_bound"] == 1.0
+
+
+def test_dry_run_endpoint(candidates, client, monkeypatch):
+  monkeypatch.setattr(app, "BACKEND_API_KEY", "secret")
+  headers = {"X-API-Key": "secret"}
+  resp = client.post("/api/send-1week-event-reminders?dry_run=1&multiplier=2", headers=headers)
+  assert resp.status_code == 200 and resp.get_json()["report"]["would_send"] == 4
+  assert client.post("/api/send-1week-event-reminders?dry_run=1&date=tomorrow", headers=headers).status_code == 400
+  assert writes(candidates) == []
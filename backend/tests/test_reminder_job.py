@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app
+from conftest import add_reminder_event, add_reminder_profile
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_PAGE_SIZE", 2)
+  monkeypatch.setattr(app, "REMINDER_PROFILE_BATCH_SIZE", 2)
+
+
+def test_profiles_are_fetched_in_chunks(sb, monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_PROFILE_BATCH_SIZE", 2)
+  sb.tables["profiles"] = [{"id": f"u-{i}", "email": f"u{i}@example.com"} for i in range(5)]
+  summary = {"queries": 0}
+  profiles = app._fetch_profiles_by_ids(["u-0", "u-1", "u-1", None, "u-2", "u-3", "u-4", "ghost"], "email", summary)
+  assert sorted(profiles) == ["u-0", "u-1", "u-2", "u-3", "u-4"]
+  assert profiles["u-3"] == {"id": "u-3", "email": "u3@example.com"}
+  assert summary["queries"] == sb.calls("select", "profiles") == 3
+
+
+def test_owners_are_looked_up_once_per_run(reminder_db, small_pages):
+  for uid in ("u-1", "u-2"):
+    add_reminder_profile(reminder_db, uid)
+  for i in range(6):
+    add_reminder_event(reminder_db, f"ev-{i}", f"u-{i % 2 + 1}", due_in=timedelta(minutes=-30 + i))
+  summary = app._send_1week_event_reminders_job()
+  assert summary["sent"] == 6 and summary["users"] == 2
+  # Three pages, but both owners were resolved on the first one
+  assert reminder_db.calls("select", "profiles") == 1
+
+
+def page_ids(pages):
+  return [[e["id"] for e in page] for page in pages]
+
+
+def sweep_window():
+  return app._reminder_sweep_window(app._JobRun("test", {}), datetime.now(timezone.utc))
+
+
+def test_candidates_are_paged_by_keyset_across_ties(reminder_db, small_pages):
+  for event_id in ("b", "a", "c"):
+    add_reminder_event(reminder_db, event_id, "u-1")
+  for e in reminder_db.tables["events"]:
+    e["event_datetime"] = reminder_db.tables["events"][0]["event_datetime"]  # ties are broken by id
+  add_reminder_event(reminder_db, "d", "u-1", due_in=timedelta(minutes=-1))
+  pages = []
+  for page in app._iter_reminder_candidate_pages(*sweep_window()):
+    pages.append(page)
+    # Rows marked as sent while iterating must not shift later pages
+    reminder_db.table("events").update({"one_week_reminder_sent_at": "now"}).in_("id", [e["id"] for e in page]).execute()
+  assert page_ids(pages) == [["a", "b"], ["c", "d"]]
+
+
+def test_candidate_paging_resumes_after_a_checkpoint(reminder_db, small_pages):
+  for i in range(3):
+    add_reminder_event(reminder_db, f"ev-{i}", "u-1", due_in=timedelta(minutes=-30 + i))
+  first = reminder_db.tables["events"][0]
+  pages = app._iter_reminder_candidate_pages(*sweep_window(), start_after=(first["event_datetime"], first["id"]))
+  assert page_ids(pages) == [["ev-1", "ev-2"]]
+
+
+def test_sent_markers_are_written_in_batches(sb, monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_MARK_BATCH_SIZE", 3)
+  sb.tables["events"] = [{"id": f"ev-{i}", "one_week_reminder_sent_at": None} for i in range(7)]
+  summary = {"queries": 0}
+  with app._ReminderSentMarker("one_week_reminder_sent_at", summary) as marker:
+    for i in range(7):
+      marker.add(f"ev-{i}")
+    assert sb.calls("update", "events") == 2  # flushed as each batch filled up
+  assert sb.calls("update", "events") == 3
+  assert summary["marked"] == 7
+  assert all(e["one_week_reminder_sent_at"] for e in sb.tables["events"])
+
+
+def test_failed_marker_writes_are_retried_once_and_left_unmarked(sb):
+  sb.tables["events"] = [{"id": "ev-1", "one_week_reminder_sent_at": None}]
+  sb.fail[("update", "events")] = RuntimeError("db down")
+  marker = app._ReminderSentMarker()
+  marker.add("ev-1")
+  marker.flush()
+  assert sb.calls("update", "events") == 2
+  assert sb.tables["events"][0]["one_week_reminder_sent_at"] is None
@@ -0,0 +1,52 @@
+import pytest
+
+import app
+from conftest import add_reminder_event, add_reminder_profile
+
+
+@pytest.fixture
+def reminders(reminder_db, monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_PUSH_ENABLED", True)
+  add_reminder_profile(reminder_db, "u-1", push=True, push_1week_countdown=True, email_1week_countdown=False)
+  add_reminder_event(reminder_db, "ev-1", "u-1")
+  return reminder_db
+
+
+def completed_runs(sb):
+  return [r for r in sb.tables["job_runs"] if r["status"] == "completed"]
+
+
+def test_failed_push_is_picked_up_by_the_next_sweep(reminders, monkeypatch):
+  delivered = []
+
+  def send(messages, outcome):
+    delivered.extend(messages)
+    return {uid: {"devices": 1, "sent": int(outcome), "failed": int(not outcome)} for uid in messages}
+
+  monkeypatch.setattr(app, "_send_push_to_users", lambda messages: send(messages, False))
+  first = app._send_1week_event_reminders_job()
+  assert first["push_failed"] == 1 and first["failed"] == 1
+  assert reminders.tables["events"][0]["one_week_reminder_sent_at"] is None
+  # The watermark stays at the undelivered event instead of the end of the window
+  assert completed_runs(reminders)[0]["window_end"] == reminders.tables["events"][0]["event_datetime"]
+
+  monkeypatch.setattr(app, "_send_push_to_users", lambda messages: send(messages, True))
+  second = app._send_1week_event_reminders_job()
+  assert second["events"] == 1 and second["push_sent"] == 1
+  assert reminders.tables["events"][0]["one_week_reminder_sent_at"] is not None
+  assert delivered == ["u-1", "u-1"]
+
+
+def test_pushes_go_out_before_each_checkpoint(reminders, monkeypatch):
+  checkpoints = []
+  real_checkpoint = app._JobRun.checkpoint
+
+  def checkpoint(run, cursor=None):
+    checkpoints.append(reminders.tables["events"][0]["one_week_reminder_sent_at"])
+    real_checkpoint(run, cursor)
+
+  monkeypatch.setattr(app._JobRun, "checkpoint", checkpoint)
+  monkeypatch.setattr(app, "_send_push_to_users", lambda messages: {uid: {"devices": 1, "sent": 1, "failed": 0} for uid in messages})
+  summary = app._send_1week_event_reminders_job()
+  assert summary["push_sent"] == 1
+  assert checkpoints and checkpoints[0] is not None
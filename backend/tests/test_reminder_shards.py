@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app
+from conftest import add_reminder_event, add_reminder_profile
+
+
+@pytest.fixture
+def shards(reminder_db, monkeypatch):
+  """
+  claim_one_week_reminders with the SQL function's semantics, over reminder_db's events.
+  """
+  monkeypatch.setattr(app, "REMINDER_CLAIM_BATCH_SIZE", 2)
+  monkeypatch.setattr(app, "REMINDER_MAX_ATTEMPTS", 2)
+
+  def claim(params):
+    now = datetime.now(timezone.utc).isoformat()
+    free = sorted(
+      (e for e in reminder_db.tables["events"]
+       if params["p_window_start"] <= e["event_datetime"] < params["p_window_end"]
+       and e["one_week_reminder_sent_at"] is None
+       and (e.get("one_week_reminder_claimed_until") or "") < now
+       and e.get("one_week_reminder_attempts", 0) < params["p_max_attempts"]),
+      key=lambda e: (e["event_datetime"], e["id"]),
+    )[:params["p_limit"]]
+    until = (datetime.now(timezone.utc) + timedelta(seconds=params["p_claim_seconds"])).isoformat()
+    for e in free:
+      e.update(one_week_reminder_claimed_by=params["p_holder"], one_week_reminder_claimed_until=until,
+               one_week_reminder_attempts=e.get("one_week_reminder_attempts", 0) + 1)
+    return [dict(e, total_tasks=0, completed_tasks=0) for e in free]
+
+  reminder_db.rpcs["claim_one_week_reminders"] = claim
+  return reminder_db
+
+
+def expire_claims(db):
+  for e in db.tables["events"]:
+    e["one_week_reminder_claimed_until"] = "2000-01-01T00:00:00+00:00"
+
+
+def test_a_shard_claims_batches_until_nothing_is_left(shards):
+  add_reminder_profile(shards, "u-1")
+  add_reminder_profile(shards, "u-off", email_1week_countdown=False)
+  for i in range(4):
+    add_reminder_event(shards, f"ev-{i}", "u-1", due_in=timedelta(minutes=-30 + i))
+  add_reminder_event(shards, "ev-off", "u-off")
+  summary = app._send_1week_event_reminders_sharded()
+  assert summary["batches"] == 3 and summary["sent"] == 4 and summary["skipped"] == 1
+  assert len(shards.sent) == 4
+  # The opted-out user's event stays claimed past its window, so no shard picks it up again
+  (parked,) = [e for e in shards.tables["events"] if e["id"] == "ev-off"]
+  assert parked["one_week_reminder_claimed_until"] > parked["event_datetime"]
+  assert app._send_1week_event_reminders_sharded()["events"] == 0
+
+
+def test_undelivered_claims_are_retried_up_to_the_attempt_limit(shards, monkeypatch):
+  add_reminder_profile(shards, "u-1")
+  add_reminder_event(shards, "ev-1", "u-1")
+  monkeypatch.setattr(app, "_dispatch_emails", lambda messages, *args: [(m, False, "down") for m in messages])
+  assert app._send_1week_event_reminders_sharded()["failed"] == 1
+  # Still claimed by the failed shard: nobody else takes it yet
+  assert app._send_1week_event_reminders_sharded()["events"] == 0
+  expire_claims(shards)
+  assert app._send_1week_event_reminders_sharded()["failed"] == 1
+  expire_claims(shards)
+  assert app._send_1week_event_reminders_sharded()["events"] == 0  # REMINDER_MAX_ATTEMPTS reached
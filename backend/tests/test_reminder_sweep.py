@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app
+from conftest import add_reminder_event, add_reminder_profile
+
+NOW = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class Run:
+  def __init__(self, watermark):
+    self.watermark = watermark
+
+  def last_watermark(self):
+    return self.watermark
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_SWEEP_INTERVAL_MINUTES", 5)
+  monkeypatch.setattr(app, "REMINDER_SWEEP_MAX_LOOKBACK_SECONDS", 3600)
+
+
+def test_sweep_window_starts_at_the_watermark(sweep):
+  end = NOW + app.REMINDER_LEAD
+  assert app._reminder_sweep_window(Run(end - timedelta(minutes=5)), NOW) == (end - timedelta(minutes=5), end)
+
+
+def test_sweep_window_lookback_is_capped(sweep):
+  end = NOW + app.REMINDER_LEAD
+  assert app._reminder_sweep_window(Run(None), NOW) == (end - timedelta(hours=1), end)
+  assert app._reminder_sweep_window(Run(end - timedelta(days=2)), NOW) == (end - timedelta(hours=1), end)
+  # A watermark from the future (clock skew) never yields an inverted window
+  assert app._reminder_sweep_window(Run(end + timedelta(hours=1)), NOW) == (end, end)
+
+
+def test_daily_mode_covers_the_utc_day_a_week_ahead(monkeypatch):
+  monkeypatch.setattr(app, "REMINDER_SWEEP_INTERVAL_MINUTES", 0)
+  assert app._reminder_sweep_window(Run(None), NOW) == (datetime(2024, 5, 8, tzinfo=timezone.utc), datetime(2024, 5, 9, tzinfo=timezone.utc))
+
+
+def test_consecutive_sweeps_pick_up_only_newly_due_events(reminder_db):
+  add_reminder_profile(reminder_db, "u-1")
+  add_reminder_event(reminder_db, "due", "u-1")
+  add_reminder_event(reminder_db, "later", "u-1", due_in=timedelta(hours=1))
+  assert app._send_1week_event_reminders_job()["events"] == 1
+  (first,) = reminder_db.tables["job_runs"]
+  assert app._send_1week_event_reminders_job()["events"] == 0
+  second = reminder_db.tables["job_runs"][-1]
+  assert second["window_start"] == first["window_end"]
+  assert reminder_db.sent == ["u-1@example.com"]
+
+
+def failing_dispatch(db, fail_to):
+  def dispatch(messages, settings=None, latencies=None):
+    db.sent.extend(m["to"] for m in messages if m["to"] != fail_to)
+    return [(m, m["to"] != fail_to, None if m["to"] != fail_to else "send failed") for m in messages]
+  return dispatch
+
+
+def test_failed_email_is_picked_up_by_the_next_sweep(reminder_db, monkeypatch):
+  add_reminder_profile(reminder_db, "u-1")
+  add_reminder_profile(reminder_db, "u-2")
+  add_reminder_event(reminder_db, "ev-1", "u-1", due_in=timedelta(minutes=-40))
+  add_reminder_event(reminder_db, "ev-2", "u-2", due_in=timedelta(minutes=-30))
+  real_dispatch = app._dispatch_emails
+  monkeypatch.setattr(app, "_dispatch_emails", failing_dispatch(reminder_db, "u-1@example.com"))
+  first = app._send_1week_event_reminders_job()
+  assert (first["sent"], first["failed"]) == (1, 1)
+  assert first["watermark_held_at"] == reminder_db.tables["events"][0]["event_datetime"]
+
+  monkeypatch.setattr(app, "_dispatch_emails", real_dispatch)
+  second = app._send_1week_event_reminders_job()
+  # ev-2 was marked in sweep 1, so only the failed reminder is due again
+  assert (second["events"], second["sent"]) == (1, 1)
+  assert reminder_db.sent == ["u-2@example.com", "u-1@example.com"]
+  assert all(e["one_week_reminder_sent_at"] for e in reminder_db.tables["events"])
+
+
+def test_render_errors_and_unmarked_sends_hold_the_watermark(reminder_db, monkeypatch):
+  add_reminder_profile(reminder_db, "u-1")
+  add_reminder_event(reminder_db, "ev-1", "u-1")
+  render = app._render_email_template
+  monkeypatch.setattr(app, "_render_email_template", lambda *args: 1 / 0)
+  assert app._send_1week_event_reminders_job()["failed"] == 1
+  assert reminder_db.sent == []
+
+  monkeypatch.setattr(app, "_render_email_template", render)
+  reminder_db.fail[("update", "events")] = RuntimeError("db down")
+  assert app._send_1week_event_reminders_job()["sent"] == 1
+  del reminder_db.fail[("update", "events")]
+  # Sent but not marked: retried (a duplicate is preferable to a miss)
+  assert app._send_1week_event_reminders_job()["sent"] == 1
+  assert reminder_db.sent == ["u-1@example.com", "u-1@example.com"]
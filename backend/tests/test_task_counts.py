@@ -0,0 +1,33 @@
+import json
+
+import app
+from conftest import add_reminder_event
+
+
+def test_task_counts_prefer_the_views_aggregates():
+  assert app._event_task_counts({"total_tasks": 3, "completed_tasks": 1, "event_tasks": []}) == (3, 1)
+  assert app._event_task_counts({"total_tasks": None, "completed_tasks": None}) == (0, 0)
+
+
+def test_task_counts_fall_back_to_event_tasks():
+  tasks = [{"completed": True}, {"completed": False}, {}, "junk"]
+  assert app._event_task_counts({"event_tasks": tasks}) == (4, 1)
+  assert app._event_task_counts({"event_tasks": json.dumps(tasks[:2])}) == (2, 1)
+  assert app._event_task_counts({"event_tasks": "not json"}) == (0, 0)
+
+
+def test_raw_columns_swap_counts_for_event_tasks():
+  assert app._columns_with_raw_tasks("id, total_tasks, completed_tasks, title") == "id, title, event_tasks"
+  assert app._columns_with_raw_tasks("id, title") == "id, title"
+
+
+def test_candidates_come_from_events_while_the_view_is_unavailable(reminder_db):
+  add_reminder_event(reminder_db, "ev-1", "u-1")
+  reminder_db.tables["events"][0]["event_tasks"] = [{"completed": True}, {"completed": False}]
+  reminder_db.fail[("select", app.REMINDER_CANDIDATES_VIEW)] = RuntimeError("relation does not exist")
+  window = app._reminder_sweep_window(app._JobRun("test", {}), app.datetime.now(app.timezone.utc))
+  (page,) = app._iter_reminder_candidate_pages(*window)
+  assert [app._event_task_counts(e) for e in page] == [(2, 1)]
+  # The view is not retried on the next page fetch
+  list(app._iter_reminder_candidate_pages(*window))
+  assert reminder_db.calls("select", app.REMINDER_CANDIDATES_VIEW) == 1
@@ -0,0 +1,29 @@
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+  monkeypatch.setattr(app, "_compiled_template_cache", app._TTLCache(maxsize=8, ttl=3600))
+
+
+def test_templates_are_compiled_once_per_version(monkeypatch):
+  compiled = []
+  real = app.template_engine.CompiledTemplate
+  monkeypatch.setattr(app.template_engine, "CompiledTemplate", lambda source: compiled.append(source) or real(source))
+  row = {"name": "welcome", "updated_at": "v1", "subject": "Hi {{ name }}", "html_content": "<p>{{ name }}</p>"}
+  assert app._render_email_template(row, {"name": "A"}) == ("Hi A", "<p>A</p>")
+  assert app._render_email_template(row, {"name": "B"}) == ("Hi B", "<p>B</p>")
+  assert len(compiled) == 2
+  # An edit bumps updated_at, so the new source is compiled even though the name is the same
+  edited = dict(row, updated_at="v2", subject="Hello {{ name }}")
+  assert app._render_email_template(edited, {"name": "C"})[0] == "Hello C"
+  assert len(compiled) == 4
+
+
+def test_rows_without_a_version_are_cached_by_source():
+  row = {"name": "welcome", "subject": "Hi {{ name }}", "html_content": ""}
+  assert app._render_email_template(row, {"name": "A"})[0] == "Hi A"
+  row["subject"] = "Bye {{ name }}"
+  assert app._render_email_template(row, {"name": "A"})[0] == "Bye A"
@@ -0,0 +1,42 @@
+from template_engine import CompiledTemplate
+
+
+def render(source, **context):
+  return CompiledTemplate(source).render(context)
+
+
+def test_variables_use_the_spaced_placeholder_form():
+  assert render("Hi {{ name }}!", name="Sam") == "Hi Sam!"
+  assert render("{{ a }}{{ a }}", a=1) == "11"
+
+
+def test_unspaced_and_unknown_variables_are_left_untouched():
+  # Same as the pre-compiled renderer, which only replaced the literal "{{ key }}"
+  assert render("{{name}} {{  name  }}", name="Sam") == "{{name}} {{  name  }}"
+  assert render("Code: {{ .Token }} {{ missing }}") == "Code: {{ .Token }} {{ missing }}"
+
+
+def test_falsy_values_render_empty():
+  assert render("[{{ a }}][{{ b }}]", a=None, b=0) == "[][]"
+
+
+def test_if_blocks_nest_and_tolerate_spacing():
+  source = "{{#if a}}A{{ #if b }}B{{/if}}{{ /if }}."
+  assert render(source, a=True, b=True) == "AB."
+  assert render(source, a=True, b=False) == "A."
+  assert render(source, a=False, b=True) == "."
+
+
+def test_ternary_picks_a_branch():
+  source = "{{ done ? 'yes' : 'no' }}"
+  assert render(source, done=True) == "yes"
+  assert render(source, done="") == "no"
+
+
+def test_unbalanced_tags_are_kept_verbatim():
+  assert render("{{/if}}x") == "{{/if}}x"
+  assert render("{{#if a}}x", a=True) == "{{#if a}}x"
+
+
+def test_substituted_values_are_not_reparsed():
+  assert render("{{ a }}", a="{{ b }}", b="no") == "{{ b }}"
@@ -57,8 +57,21 @@ CREATE TABLE IF NOT EXISTS public.events (
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
   last_activity_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
-  one_week_reminder_sent_at TIMESTAMP WITH TIME ZONE -- To track if 1-week reminder was sent
+  one_week_reminder_sent_at TIMESTAMP WITH TIME ZONE, -- To track if 1-week reminder was sent
+  -- Sharded reminder processing: which worker claimed the reminder, until when, and how many times
+  one_week_reminder_claimed_by TEXT,
+  one_week_reminder_claimed_until TIMESTAMP WITH TIME ZONE,
+  one_week_reminder_attempts SMALLINT DEFAULT 0 NOT NULL
 );
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS one_week_reminder_claimed_by TEXT;
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS one_week_reminder_claimed_until TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS one_week_reminder_attempts SMALLINT DEFAULT 0 NOT NULL;
+
+-- Pending 1-week reminders, in the (event_datetime, id) order the backend's incremental sweep pages them.
+-- Partial: rows drop out of the index once their reminder is sent, so it stays small.
+CREATE INDEX IF NOT EXISTS idx_events_one_week_reminder_pending
+  ON public.events (event_datetime, id)
+  WHERE one_week_reminder_sent_at IS NULL;
 
 -- Invitations table for inviting users to companies
 CREATE TABLE IF NOT EXISTS public.invitations (
@@ -97,6 +110,84 @@ CREATE TABLE IF NOT EXISTS public.email_templates (
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
 );
 
+-- Job leases: ensures exactly one backend process runs a given scheduled job run
+-- (every gunicorn worker / node schedules the same cron). Managed by the backend via RPC only.
+CREATE TABLE IF NOT EXISTS public.job_leases (
+  job_name TEXT PRIMARY KEY,
+  holder TEXT NOT NULL, -- "<hostname>:<pid>" of the worker holding the lease
+  acquired_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Job runs: history of scheduled job runs (window, keyset checkpoint, counters, latency histogram,
+-- error samples). A run left 'running' by a restarted worker is resumed from its cursor.
+CREATE TABLE IF NOT EXISTS public.job_runs (
+  id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
+  job_name TEXT NOT NULL,
+  status TEXT DEFAULT 'running' NOT NULL, -- running | completed | failed | abandoned
+  group_key TEXT, -- shared by the shard runs of one sweep (sharded mode)
+  holder TEXT, -- "<hostname>:<pid>" of the worker that last ran it
+  attempts INTEGER DEFAULT 1 NOT NULL,
+  window_start TIMESTAMP WITH TIME ZONE,
+  window_end TIMESTAMP WITH TIME ZONE,
+  cursor JSONB, -- {"event_datetime": ..., "id": ...} of the last fully processed event
+  events INTEGER DEFAULT 0 NOT NULL,
+  sent INTEGER DEFAULT 0 NOT NULL,
+  skipped INTEGER DEFAULT 0 NOT NULL,
+  failed INTEGER DEFAULT 0 NOT NULL,
+  send_seconds NUMERIC DEFAULT 0 NOT NULL,
+  duration_seconds NUMERIC DEFAULT 0 NOT NULL,
+  latency JSONB DEFAULT '{}'::jsonb NOT NULL, -- send-latency histogram (buckets, count, sum_ms, max_ms)
+  error_samples JSONB DEFAULT '[]'::jsonb NOT NULL,
+  summary JSONB,
+  started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  finished_at TIMESTAMP WITH TIME ZONE
+);
+ALTER TABLE public.job_runs ADD COLUMN IF NOT EXISTS group_key TEXT;
+CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON public.job_runs (job_name, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_job_runs_job_group ON public.job_runs (job_name, group_key);
+-- Sweep watermark lookup: latest completed window per job
+CREATE INDEX IF NOT EXISTS idx_job_runs_job_watermark ON public.job_runs (job_name, window_end DESC) WHERE status = 'completed';
+
+-- Timezone buckets: profiles per IANA timezone, kept current by a trigger on profiles. The backend
+-- groups these zones by UTC offset to send digests at each user's local reminder_time.
+CREATE TABLE IF NOT EXISTS public.timezone_buckets (
+  timezone TEXT PRIMARY KEY,
+  user_count INTEGER DEFAULT 0 NOT NULL,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+-- Per-bucket user and event lookups
+CREATE INDEX IF NOT EXISTS idx_profiles_timezone ON public.profiles (timezone, id);
+CREATE INDEX IF NOT EXISTS idx_events_user_datetime ON public.events (user_id, event_datetime);
+-- Dead push subscription pruning (prune_push_subscriptions) looks profiles up by endpoint
+CREATE INDEX IF NOT EXISTS idx_profiles_push_endpoint ON public.profiles ((push_subscription->>'endpoint'))
+  WHERE push_subscription IS NOT NULL;
+
+-- Notification watermarks: last digest period sent per user and cadence (email_daily, email_weekly, ...),
+-- so reruns of the digest job within the same period never send twice.
+CREATE TABLE IF NOT EXISTS public.notification_watermarks (
+  user_id UUID REFERENCES public.profiles(id) ON DELETE CASCADE NOT NULL,
+  cadence TEXT NOT NULL,
+  period_key TEXT NOT NULL, -- e.g. '2026-10-17', '2026-W42', '2026-10'
+  event_count INTEGER DEFAULT 0 NOT NULL,
+  last_sent_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  PRIMARY KEY (user_id, cadence)
+);
+
+-- Push subscription registry: one row per device endpoint, so every browser/device of a user receives pushes
+CREATE TABLE IF NOT EXISTS public.push_subscriptions (
+  endpoint TEXT PRIMARY KEY,
+  user_id UUID REFERENCES public.profiles(id) ON DELETE CASCADE NOT NULL,
+  subscription JSONB NOT NULL, -- {"endpoint", "keys": {"p256dh", "auth"}}
+  user_agent TEXT,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  last_success_at TIMESTAMP WITH TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS idx_push_subscriptions_user ON public.push_subscriptions (user_id);
+
 -- -----------------------------------------------------------------------------
 -- Row Level Security (RLS) Policies
 -- -----------------------------------------------------------------------------
@@ -169,6 +260,24 @@ DROP POLICY IF EXISTS "Allow service role to manage email templates." ON public.
 CREATE POLICY "Allow service role to manage email templates." ON public.email_templates
   FOR ALL USING (auth.role() = 'service_role') WITH CHECK (auth.role() = 'service_role');
 
+-- Job leases RLS (service role only; no policies for other roles)
+ALTER TABLE public.job_leases ENABLE ROW LEVEL SECURITY;
+
+-- Job runs RLS (service role only; no policies for other roles)
+ALTER TABLE public.job_runs ENABLE ROW LEVEL SECURITY;
+
+-- Timezone buckets RLS (service role only; no policies for other roles)
+ALTER TABLE public.timezone_buckets ENABLE ROW LEVEL SECURITY;
+
+-- Notification watermarks RLS (service role only; no policies for other roles)
+ALTER TABLE public.notification_watermarks ENABLE ROW LEVEL SECURITY;
+
+-- Push subscriptions RLS (managed by the backend; users may see their own devices)
+ALTER TABLE public.push_subscriptions ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Users can view their own push subscriptions." ON public.push_subscriptions;
+CREATE POLICY "Users can view their own push subscriptions." ON public.push_subscriptions
+  FOR SELECT USING (auth.uid() = user_id);
+
 -- -----------------------------------------------------------------------------
 -- Functions
 -- -----------------------------------------------------------------------------
@@ -428,6 +537,202 @@ BEGIN
 END;
 $$;
 
+-- Acquire (or renew, when p_holder already holds it) the lease on a job. Returns TRUE if p_holder holds it afterwards.
+CREATE OR REPLACE FUNCTION public.acquire_job_lease(p_job_name TEXT, p_holder TEXT, p_ttl_seconds INTEGER)
+RETURNS BOOLEAN LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    got_holder TEXT;
+BEGIN
+    INSERT INTO public.job_leases AS l (job_name, holder, acquired_at, heartbeat_at, expires_at)
+    VALUES (p_job_name, p_holder, NOW(), NOW(), NOW() + make_interval(secs => p_ttl_seconds))
+    ON CONFLICT (job_name) DO UPDATE
+        SET holder = EXCLUDED.holder,
+            acquired_at = CASE WHEN l.holder = EXCLUDED.holder THEN l.acquired_at ELSE NOW() END,
+            heartbeat_at = NOW(),
+            expires_at = EXCLUDED.expires_at
+        WHERE l.holder = EXCLUDED.holder OR l.expires_at < NOW()
+    RETURNING holder INTO got_holder;
+    RETURN got_holder IS NOT NULL;
+END;
+$$;
+
+-- Release a job lease (no-op unless p_holder holds it). The lease stays blocked until p_min_hold_seconds after
+-- it was acquired, so late-firing workers cannot start a second run of the same scheduled slot.
+CREATE OR REPLACE FUNCTION public.release_job_lease(p_job_name TEXT, p_holder TEXT, p_min_hold_seconds INTEGER DEFAULT 0)
+RETURNS VOID LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+    UPDATE public.job_leases
+    SET expires_at = GREATEST(NOW(), acquired_at + make_interval(secs => p_min_hold_seconds)),
+        heartbeat_at = NOW()
+    WHERE job_name = p_job_name AND holder = p_holder;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.acquire_job_lease(TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.release_job_lease(TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- Task statistics of an event_tasks value (arrays, or arrays JSON-encoded as a string).
+-- A task counts as completed when its "completed" field is truthy, as in the backend.
+CREATE OR REPLACE FUNCTION public.event_task_counts(p_tasks JSONB, OUT total_tasks INTEGER, OUT completed_tasks INTEGER)
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+  v_tasks JSONB := p_tasks;
+BEGIN
+  IF jsonb_typeof(v_tasks) = 'string' THEN
+    BEGIN
+      v_tasks := (v_tasks #>> '{}')::jsonb;
+    EXCEPTION WHEN others THEN
+      v_tasks := NULL;
+    END;
+  END IF;
+  IF v_tasks IS NULL OR jsonb_typeof(v_tasks) <> 'array' THEN
+    total_tasks := 0;
+    completed_tasks := 0;
+    RETURN;
+  END IF;
+  SELECT COUNT(*)::INTEGER,
+         (COUNT(*) FILTER (WHERE jsonb_typeof(t) = 'object' AND COALESCE(t->>'completed', '') NOT IN ('', 'false', '0', 'null')))::INTEGER
+  INTO total_tasks, completed_tasks
+  FROM jsonb_array_elements(v_tasks) AS t;
+END;
+$$;
+
+-- Reminder candidates: events with their task statistics computed in the database, so the reminder and
+-- digest jobs page a few integers instead of every event's event_tasks array. security_invoker keeps the
+-- events RLS policies in force for non-service callers.
+CREATE OR REPLACE VIEW public.event_reminder_candidates
+WITH (security_invoker = true) AS
+SELECT
+  e.id,
+  e.user_id,
+  e.company_id,
+  e.title,
+  e.description,
+  e.location,
+  e.event_datetime,
+  e.one_week_reminder_sent_at,
+  e.one_week_reminder_claimed_by,
+  e.one_week_reminder_claimed_until,
+  e.one_week_reminder_attempts,
+  t.total_tasks,
+  t.completed_tasks,
+  t.total_tasks - t.completed_tasks AS pending_tasks
+FROM public.events AS e
+CROSS JOIN LATERAL public.event_task_counts(e.event_tasks) AS t;
+
+-- Claim up to p_limit due 1-week reminders for p_holder (sharded reminder processing). Rows locked by a
+-- concurrent claim are skipped, so parallel workers always receive disjoint batches. A claim lapses after
+-- p_claim_seconds; undelivered events are then claimable again until p_max_attempts is reached.
+-- Returns the claimed rows as reminder candidates (with task counts).
+DROP FUNCTION IF EXISTS public.claim_one_week_reminders(TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE, TEXT, INTEGER, INTEGER, INTEGER);
+CREATE FUNCTION public.claim_one_week_reminders(
+  p_window_start TIMESTAMP WITH TIME ZONE,
+  p_window_end TIMESTAMP WITH TIME ZONE,
+  p_holder TEXT,
+  p_limit INTEGER,
+  p_claim_seconds INTEGER,
+  p_max_attempts INTEGER
+)
+RETURNS SETOF public.event_reminder_candidates LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+  RETURN QUERY
+    WITH claimed AS (
+      UPDATE public.events AS e
+      SET one_week_reminder_claimed_by = p_holder,
+          one_week_reminder_claimed_until = NOW() + make_interval(secs => p_claim_seconds),
+          one_week_reminder_attempts = e.one_week_reminder_attempts + 1
+      WHERE e.id IN (
+        SELECT c.id FROM public.events AS c
+        WHERE c.event_datetime >= p_window_start
+          AND c.event_datetime < p_window_end
+          AND c.one_week_reminder_sent_at IS NULL
+          AND (c.one_week_reminder_claimed_until IS NULL OR c.one_week_reminder_claimed_until < NOW())
+          AND c.one_week_reminder_attempts < p_max_attempts
+        ORDER BY c.event_datetime, c.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+      )
+      RETURNING e.id
+    )
+    SELECT v.*
+    FROM public.event_reminder_candidates AS v
+    JOIN claimed ON claimed.id = v.id
+    ORDER BY v.event_datetime, v.id;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.claim_one_week_reminders(TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE, TEXT, INTEGER, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- Keep public.timezone_buckets in step with profiles.timezone (one row touched per change)
+CREATE OR REPLACE FUNCTION public.maintain_timezone_buckets()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' AND OLD.timezone IS NOT DISTINCT FROM NEW.timezone THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    UPDATE public.timezone_buckets
+    SET user_count = GREATEST(user_count - 1, 0), updated_at = NOW()
+    WHERE timezone = OLD.timezone;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO public.timezone_buckets (timezone, user_count, updated_at)
+    VALUES (NEW.timezone, 1, NOW())
+    ON CONFLICT (timezone) DO UPDATE
+      SET user_count = public.timezone_buckets.user_count + 1, updated_at = NOW();
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Prune push subscriptions the push service reported gone (404/410): removes them from the registry, clears
+-- profiles.push_subscription where it is one of them, and turns notifications.push off for users left with
+-- no registered device. Returns the affected user ids.
+CREATE OR REPLACE FUNCTION public.prune_push_subscriptions(p_endpoints TEXT[])
+RETURNS TABLE (user_id UUID) LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+  RETURN QUERY
+    WITH removed AS (
+      DELETE FROM public.push_subscriptions AS s
+      WHERE s.endpoint = ANY(p_endpoints)
+      RETURNING s.user_id
+    ),
+    affected AS (
+      SELECT r.user_id AS id FROM removed AS r
+      UNION
+      SELECT pr.id FROM public.profiles AS pr WHERE pr.push_subscription->>'endpoint' = ANY(p_endpoints)
+    )
+    UPDATE public.profiles AS p
+    SET push_subscription = CASE WHEN p.push_subscription->>'endpoint' = ANY(p_endpoints) THEN NULL ELSE p.push_subscription END,
+        notifications = CASE
+          WHEN EXISTS (SELECT 1 FROM public.push_subscriptions AS s WHERE s.user_id = p.id AND NOT s.endpoint = ANY(p_endpoints))
+            THEN p.notifications
+          ELSE COALESCE(p.notifications, '{}'::jsonb) || '{"push": false}'::jsonb
+        END
+    FROM affected
+    WHERE p.id = affected.id
+    RETURNING p.id;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.prune_push_subscriptions(TEXT[]) FROM PUBLIC, anon, authenticated;
+
+-- Copy subscriptions the frontend writes straight to profiles.push_subscription into the device registry
+CREATE OR REPLACE FUNCTION public.sync_push_subscription_registry()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.push_subscription ? 'endpoint' AND NEW.push_subscription ? 'keys'
+     AND NEW.push_subscription IS DISTINCT FROM (CASE WHEN TG_OP = 'UPDATE' THEN OLD.push_subscription END) THEN
+    INSERT INTO public.push_subscriptions (endpoint, user_id, subscription, last_seen_at)
+    VALUES (NEW.push_subscription->>'endpoint', NEW.id,
+            jsonb_build_object('endpoint', NEW.push_subscription->'endpoint', 'keys', NEW.push_subscription->'keys'), NOW())
+    ON CONFLICT (endpoint) DO UPDATE
+      SET user_id = EXCLUDED.user_id, subscription = EXCLUDED.subscription, last_seen_at = NOW();
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
 -- -----------------------------------------------------------------------------
 -- Triggers
 -- -----------------------------------------------------------------------------
@@ -445,6 +750,18 @@ CREATE TRIGGER send_welcome_email_trigger
 AFTER UPDATE ON auth.users
 FOR EACH ROW EXECUTE FUNCTION public.send_welcome_email_on_confirm();
 
+-- Trigger to maintain the per-timezone bucket index
+DROP TRIGGER IF EXISTS maintain_timezone_buckets_trigger ON public.profiles;
+CREATE TRIGGER maintain_timezone_buckets_trigger
+AFTER INSERT OR DELETE OR UPDATE OF timezone ON public.profiles
+FOR EACH ROW EXECUTE FUNCTION public.maintain_timezone_buckets();
+
+-- Trigger to mirror profiles.push_subscription into the push subscription registry
+DROP TRIGGER IF EXISTS sync_push_subscription_registry_trigger ON public.profiles;
+CREATE TRIGGER sync_push_subscription_registry_trigger
+AFTER INSERT OR UPDATE OF push_subscription ON public.profiles
+FOR EACH ROW EXECUTE FUNCTION public.sync_push_subscription_registry();
+
 -- Triggers to update 'updated_at' column
 DROP TRIGGER IF EXISTS set_profiles_updated_at ON public.profiles;
 CREATE TRIGGER set_profiles_updated_at
@@ -484,6 +801,19 @@ SELECT
     '02:00'
 WHERE NOT EXISTS (SELECT 1 FROM public.email_settings);
 
+-- Backfill the timezone bucket index from existing profiles (recounts, so safe to re-run)
+INSERT INTO public.timezone_buckets (timezone, user_count, updated_at)
+SELECT timezone, COUNT(*), NOW() FROM public.profiles GROUP BY timezone
+ON CONFLICT (timezone) DO UPDATE SET user_count = EXCLUDED.user_count, updated_at = NOW();
+
+-- Backfill the push subscription registry from the single per-profile subscription
+INSERT INTO public.push_subscriptions (endpoint, user_id, subscription)
+SELECT push_subscription->>'endpoint', id,
+       jsonb_build_object('endpoint', push_subscription->'endpoint', 'keys', push_subscription->'keys')
+FROM public.profiles
+WHERE push_subscription ? 'endpoint' AND push_subscription ? 'keys'
+ON CONFLICT (endpoint) DO NOTHING;
+
 -- Insert default email templates if they don't exist
 INSERT INTO email_templates (name, subject, html_content)
 SELECT 'welcome_email', 'Welcome to DayClap!',
@@ -646,6 +976,43 @@ $$<!DOCTYPE html>
 </html>$$
 WHERE NOT EXISTS (SELECT 1 FROM email_templates WHERE name = 'event_1week_reminder');
 
+INSERT INTO email_templates (name, subject, html_content)
+SELECT 'event_digest', '{{ digest_title }}: {{ event_count }} upcoming event(s) on DayClap',
+$$<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; background-color: #f4f4f4; margin: 0; padding: 0; }
+        .container { max-width: 600px; margin: 20px auto; background-color: #ffffff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }
+        .header { background-color: #3b82f6; color: #ffffff; padding: 15px; border-radius: 8px 8px 0 0; text-align: center; }
+        .content { padding: 20px; line-height: 1.6; color: #333333; }
+        .button { display: inline-block; background-color: #3b82f6; color: #ffffff; padding: 10px 20px; border-radius: 5px; text-decoration: none; margin-top: 15px; }
+        .footer { text-align: center; font-size: 0.8em; color: #888888; margin-top: 20px; padding-top: 10px; border-top: 1px solid #eeeeee; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h2>{{ digest_title }}</h2>
+        </div>
+        <div class="content">
+            <p>Hello {{ user_name }},</p>
+            <p>You have {{ event_count }} event(s) scheduled for {{ period_label }}:</p>
+            {{ events_html }}
+            {{#if has_pending_tasks}}
+                <p><strong>Tasks:</strong> {{ pending_tasks_total }} task(s) are still pending across these events.</p>
+            {{/if}}
+            <a href="{{ frontend_url }}" class="button">Open DayClap</a>
+        </div>
+        <div class="footer">
+            <p>You are receiving this digest because of your notification preferences in DayClap.</p>
+            <p>&copy; {{ current_year }} DayClap. All rights reserved.</p>
+        </div>
+    </div>
+</body>
+</html>$$
+WHERE NOT EXISTS (SELECT 1 FROM email_templates WHERE name = 'event_digest');
+
 INSERT INTO email_templates (name, subject, html_content)
 SELECT 'verification_email', 'Confirm Your DayClap Account',
 $$<!DOCTYPE html>